@@ -1,41 +1,52 @@
 """Module of scripts helping with process of automation an analyst's model."""
 
 import re
-import openpyxl
-import configparser
 from io import BytesIO
 from pathlib import Path
-from typing import Generator
+from typing import Iterable, Iterator
 from dataclasses import dataclass
 
-from openpyxl.cell import Cell
-from openpyxl.worksheet.worksheet import Worksheet
+import numpy as np
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter
 
+from automation_assistance_config import DEFAULT_MIN_SCORE, DEFAULT_TOP_K, get_config_section_index
+from automation_assistance_disk_cache import load_columnar_sheet_with_cache
 from automation_assistance_exceptions import EmptyTagCellInModel
-
-
-def is_empty_array(array: [list[Cell]|tuple[Cell]]) -> bool:
-    """Проверяет, является ли ряд или столбец пустым (значения ячеек None)."""
-    checklist = [cell.value for cell in array if cell.value is not None]
-    return len(checklist) == 0
-
-
-def define_first_prognosis_column_number(worksheet, explicit_row=None, start_column: int = 1) -> int:
+from automation_assistance_instrumentation import (measure_stage, measure_stage_part, measure_streamed_stage,
+                                                    measure_iterator_stage)
+from automation_assistance_jobs import PROGRESS_REPORT_INTERVAL, report_progress
+from automation_assistance_matching import (SCALE_DETECTION_RELATIVE_TOLERANCE, align_period_columns,
+                                            convert_values_to_numbers, detect_scale_factor, get_evidence_mask,
+                                            join_with_tolerance, match_rows_by_signature,
+                                            normalize_numbers_for_comparison)
+from automation_assistance_snapshot import SheetSnapshot, load_sheet_snapshot_with_cache
+from automation_assistance_streaming import read_sheetnames_from_workbook_xml
+
+
+def find_last_occupied_column_number(sheet_snapshot: SheetSnapshot, min_column: int = 2) -> int | None:
+    """Возвращает номер последнего (самого правого) непустого столбца страницы, начиная с min_column."""
+    occupied_columns = np.flatnonzero(sheet_snapshot.is_occupied[:, min_column - 1:].any(axis=0))
+    if occupied_columns.size:
+        return int(occupied_columns[-1]) + min_column
+
+
+def define_first_prognosis_column_number(sheet_snapshot: SheetSnapshot, explicit_row=None,
+                                         start_column: int = 1) -> int:
     """Определяем первый найденный при обходе слева-направо столбец с прогнозами, у которого в хэдэре
      есть обозначение прогнозного периода (F или П)."""
-    date_row = explicit_row or worksheet.min_row
-    # Используем свойство функции iter_rows по обходу ряда слева-направо. min_col - для поиска только по датам
-    for row in worksheet.iter_rows(min_row=date_row, max_row=date_row, min_col=start_column):
-        for cell in row:
-            # 'П' добавлена для российских компаний
-            if isinstance(cell.value, str) and (cell.value.endswith('F') or cell.value.endswith('П')):
-                return cell.column
-    raise ValueError(f'На странице "{worksheet.title}" не найден период с отметкой F или П')
+    date_row = explicit_row or sheet_snapshot.min_row
+    if date_row <= sheet_snapshot.max_row:
+        # первый отмеченный столбец в ряду с датами; start_column - для поиска только по датам
+        prognosis_columns = np.flatnonzero(sheet_snapshot.is_forecast_header[date_row - 1, start_column - 1:])
+        if prognosis_columns.size:
+            return int(prognosis_columns[0]) + start_column
+    raise ValueError(f'На странице "{sheet_snapshot.title}" не найден период с отметкой F или П')
 
 
-@dataclass
+@dataclass(slots=True)
 class Equivalent:
-    """Класс для хранения информации о названиях статьи из разных источников."""
+    """Класс для хранения информации о названиях статьи из разных источников
+    (__slots__ - объектов в результате может быть очень много)."""
 
     # Название статьи из переданного отчета эмитента
     tag_from_filling: str
@@ -45,85 +56,135 @@ class Equivalent:
     # источника данных (XBRL, PDF, XLSX), где в значениях (правая часть конфига)
     # встретилось название статьи из переданного отчета эмитента
     tags_from_config: list = None
+    # Уверенность сопоставления (доля совпавших периодов) при сопоставлении по нескольким периодам
+    confidence: float = None
+    # Схожесть названий статей из tags_from_config (в том же порядке) при ранжированном поиске в конфиге
+    scores_of_tags_from_config: list = None
+
+
+@dataclass(slots=True)
+class ProblemRow:
+    """Класс для хранения информации о ряде, который не удалось сопоставить. Потоковые функции
+    (iter_tags_equations и др.) отдают такие ряды вместе с эквивалентами вместо исключения."""
+
+    # Адрес ячейки с названием статьи в аналитической модели
+    model_cell_coordinate: str
+    # Описание проблемы
+    message: str
+    # Название статьи из отчета эмитента, значение которой совпало со значением модели
+    tag_from_filling: str = None
+
+
+def collect_equivalents(equivalents_and_problem_rows: Iterable) -> list[Equivalent]:
+    """Собирает результаты потоковой функции в список объектов Equivalent.
+    На первом проблемном ряде выбрасывает EmptyTagCellInModel (как и до появления потоковых функций)."""
+    list_of_equivalents = []
+    for item in equivalents_and_problem_rows:
+        if isinstance(item, ProblemRow):
+            raise EmptyTagCellInModel(item.message)
+        list_of_equivalents.append(item)
+    return list_of_equivalents
+
 
+def normalize_value_for_comparison(value):
+    """Приводит значение ячейки к виду, в котором оно сравнивается с другими ячейками:
+    float усекается до целого числа (int), остальные значения остаются без изменений."""
+    if isinstance(value, float):
+        return int(value)
+    return value
 
-def find_first_numeric_cell_in_column(column_for_searching: Generator) -> str | None:
-    """ Возвращает адрес первой ячейки в столбце, имеющей числовое значение
+
+def create_value_index(rows_and_values) -> dict:
+    """Строит индекс значений столбца для поиска совпадений за O(1) вместо обхода всего столбца.
     Args:
-        column_for_searching: итератор по ячейкам в колонке
+        rows_and_values: пары (номер ряда, значение ячейки) по порядку обхода столбца;
+                         пустые ячейки в индекс не попадают
+    Returns:
+        словарь {нормализованное значение: список номеров рядов в порядке обхода столбца}
+    """
+    value_index = {}
+    for row, value in rows_and_values:
+        if value is None:
+            continue
+        value_index.setdefault(normalize_value_for_comparison(value), []).append(row)
+    return value_index
+
+
+def find_first_numeric_cell_in_column(sheet_snapshot: SheetSnapshot, column_number: int) -> str | None:
+    """ Возвращает адрес первой ячейки в столбце, имеющей ненулевое числовое значение
+    Args:
+        sheet_snapshot: снимок страницы XLSX файла
+        column_number: номер столбца для поиска
     Returns:
         координаты первой числовой ячейки
     """
-    for cell in column_for_searching:
-        if (isinstance(cell.value, int) or isinstance(cell.value, float)) and cell.value != 0:
-            coordinates_of_first_numeric_cell = cell.coordinate
-            return coordinates_of_first_numeric_cell
+    column_is_numeric = sheet_snapshot.get_column(sheet_snapshot.is_numeric, column_number)
+    column_numbers = sheet_snapshot.get_column(sheet_snapshot.numbers, column_number)
+    numeric_rows = np.flatnonzero(column_is_numeric & (column_numbers != 0))
+    if numeric_rows.size:
+        return sheet_snapshot.get_coordinate(int(numeric_rows[0]) + 1, column_number)
 
 
-def find_coordinates_for_start_in_filling(worksheet: Worksheet, cell_value_to_find: int|float) -> str | None:
+def find_coordinates_for_start_in_filling(sheet_snapshot: SheetSnapshot, cell_value_to_find: int|float) -> str | None:
     """Производит поиск ячейки с определенным значением и возвращает координаты первой числовой ячейки в этом столбце
     Args:
-        :param worksheet: страница XLSX файла для поиска
-        :type worksheet:
+        :param sheet_snapshot: снимок страницы XLSX файла для поиска
+        :type sheet_snapshot: SheetSnapshot
         :param cell_value_to_find: значение ячейки, которую необходимо найти
         :type cell_value_to_find: int
     Returns:
         координаты найденной ячейки
     """
-    # min_col=2, т.к. первый столбец вероятнее всего столбец со статьями (str), поэтому пропускаем
-    for column in worksheet.iter_cols(min_col=2):
-        for general_cell in column:
-            if general_cell.value == cell_value_to_find:
-                cell_in_filling_column_index = general_cell.column
-                # получить номер столбца, в котором найдено совпадающее значение
-                # найти в этом столбце координату верхней числовой ячейки
-                for cell in next(worksheet.iter_cols(min_col=cell_in_filling_column_index,
-                                                     max_col=cell_in_filling_column_index)):
-                    if isinstance(cell.value, int) or isinstance(cell.value, float):
-                        coordinates_of_cell_for_start_in_filling = cell.coordinate
-                        return coordinates_of_cell_for_start_in_filling
-
-
-def get_coordinates_of_cells_in_column_with_same_fiscal_period(selected_sheet_in_model_wb: Worksheet,
-                                                               selected_sheet_in_issuer_wb: Worksheet,
+    # индекс значений строится один раз для страницы, начиная со 2-го столбца,
+    # т.к. первый столбец вероятнее всего столбец со статьями (str), поэтому пропускаем
+    value_location_index = sheet_snapshot.get_value_location_index(min_column=2)
+    position = value_location_index.find_positions([cell_value_to_find])[0]
+    if position >= 0:
+        return value_location_index.get_coordinate(position)
+
+
+def get_coordinates_of_cells_in_column_with_same_fiscal_period(model_sheet_snapshot: SheetSnapshot,
+                                                               issuer_sheet_snapshot: SheetSnapshot,
                                                                number_of_column_including_needed_cell: int
                                                                ) -> tuple[str, str]:
-    """Итерируется по ячейкам определенного столбца в файле аналитической модели до тех пор, пока не найдет
-     первую непустую ячейку с числовым значением. Далее вызывает функцию для поиска ячейки с таким же значением
-     на выбранном листе файла отчёта эмитента. Сохраняет координаты обеих ячеек. В случае, если координаты
-     не найдены, рассчитывается значение по умолчанию.
+    """Ищет ячейки определенного столбца в файле аналитической модели с ненулевым числовым значением
+     в индексе значений выбранного листа файла отчёта эмитента и берет первую (сверху) найденную.
+     Сохраняет координаты обеих ячеек. В случае, если координаты не найдены, рассчитывается
+     значение по умолчанию.
 
     Args:
-        selected_sheet_in_model_wb: страница XLSX файла аналитической модели для поиска
-        selected_sheet_in_issuer_wb: страница XLSX файла отчёта эмитента для поиска
+        model_sheet_snapshot: снимок страницы XLSX файла аналитической модели для поиска
+        issuer_sheet_snapshot: снимок страницы XLSX файла отчёта эмитента для поиска
         number_of_column_including_needed_cell: номер колонки для поиска ячейки
 
     Returns:
         координаты ячеек для старта в аналитической модели и в отчете эмитента
     """
-    # находим координаты первой ячейки с численным значением (ячейка для начала обработки)
-    for cell in next(selected_sheet_in_model_wb.iter_cols(min_col=number_of_column_including_needed_cell,
-                                                          max_col=number_of_column_including_needed_cell)):
-        if (isinstance(cell.value, int) or isinstance(cell.value, float)) and cell.value != 0:
-            coordinates_of_cell_for_start_in_model = cell.coordinate
-            coordinates_of_cell_for_start_in_filling = find_coordinates_for_start_in_filling(
-                                                                        selected_sheet_in_issuer_wb, cell.value)
-            if coordinates_of_cell_for_start_in_filling:
-                return coordinates_of_cell_for_start_in_model, coordinates_of_cell_for_start_in_filling
+    column_is_numeric = model_sheet_snapshot.get_column(model_sheet_snapshot.is_numeric,
+                                                        number_of_column_including_needed_cell)
+    column_numbers = model_sheet_snapshot.get_column(model_sheet_snapshot.numbers,
+                                                     number_of_column_including_needed_cell)
+    # ячейки с ненулевым численным значением (кандидаты для начала обработки) сверху вниз
+    candidate_rows = np.flatnonzero(column_is_numeric & (column_numbers != 0))
+    # все кандидаты ищутся в индексе значений страницы эмитента за один вызов, берется первый найденный
+    value_location_index = issuer_sheet_snapshot.get_value_location_index(min_column=2)
+    positions = value_location_index.find_positions(column_numbers[candidate_rows])
+    found_candidates = np.flatnonzero(positions >= 0)
+    if found_candidates.size:
+        first_found_candidate = found_candidates[0]
+        coordinates_of_cell_for_start_in_model = model_sheet_snapshot.get_coordinate(
+                                                                int(candidate_rows[first_found_candidate]) + 1,
+                                                                number_of_column_including_needed_cell)
+        coordinates_of_cell_for_start_in_filling = value_location_index.get_coordinate(
+                                                                positions[first_found_candidate])
+        return coordinates_of_cell_for_start_in_model, coordinates_of_cell_for_start_in_filling
     # Если координаты не вычислены, передается значение по умолчанию
-    else:
-        # для заполнения по умолчанию берем столбец B (то есть второй)
-        index_of_column_for_autofill = 2
-        column_for_autofill_in_filling = next(selected_sheet_in_issuer_wb.iter_cols(
-                                                          min_col=index_of_column_for_autofill,
-                                                          max_col=index_of_column_for_autofill))
-        # ищем верхнюю ячейку с числовым значением
-        default_address_in_filling = find_first_numeric_cell_in_column(column_for_autofill_in_filling)
-        # странным сложным способом получаем букву нужной колонки
-        default_column_letter = next(selected_sheet_in_model_wb.iter_cols(min_col=number_of_column_including_needed_cell,
-                                                                          max_col=number_of_column_including_needed_cell)
-                                                                          )[0].column_letter
-        return f'{default_column_letter}4', default_address_in_filling
+    # для заполнения по умолчанию берем столбец B (то есть второй), в нем ищем верхнюю ячейку с числовым значением
+    index_of_column_for_autofill = 2
+    default_address_in_filling = find_first_numeric_cell_in_column(issuer_sheet_snapshot,
+                                                                   index_of_column_for_autofill)
+    default_column_letter = get_column_letter(number_of_column_including_needed_cell)
+    return f'{default_column_letter}4', default_address_in_filling
 
 
 def specify_function_for_cell_address_searching(model_binary_stream: BytesIO, issuer_binary_stream: BytesIO,
@@ -138,38 +199,61 @@ def specify_function_for_cell_address_searching(model_binary_stream: BytesIO, is
     Returns:
         координаты ячеек для начала обработки в файле аналитической модели и в файле отчёта эмитента
     """
-    model_workbook = openpyxl.load_workbook(model_binary_stream)
-    issuer_workbook = openpyxl.load_workbook(issuer_binary_stream)
-    selected_sheet_in_model_wb = model_workbook[selected_model_sheet]
-    selected_sheet_in_issuer_wb = issuer_workbook[selected_issuer_sheet]
-    if 'Баланс' in selected_sheet_in_model_wb.title or 'Balance' in selected_sheet_in_model_wb.title:
-        index_of_last_column = selected_sheet_in_model_wb.max_column
-        # проверяем последнюю непустую колонку действительно ли она непустая
-        # получаем номер колонки, которую необходимо обработать
-        for column_index in range(index_of_last_column, 1, -1):
-            for column in selected_sheet_in_model_wb.iter_cols(min_col=column_index, max_col=column_index):
-                if not is_empty_array(column):
-                    # если координаты не найдены, возвращается значение по умолчанию
-                    address_start_cell_in_model, address_start_cell_in_filling = \
-                        get_coordinates_of_cells_in_column_with_same_fiscal_period(selected_sheet_in_model_wb,
-                                                                                   selected_sheet_in_issuer_wb,
-                                                                                   column_index)
-                    return address_start_cell_in_model, address_start_cell_in_filling
-    else:
-        # названия столбцов записаны во втором ряду
-        row_in_model_to_start = 2
-        first_prognosis_column_number = define_first_prognosis_column_number(selected_sheet_in_model_wb,
-                                                                             row_in_model_to_start)
-        # Берём прогнозный столбик - 1, т. к. нужен последний столбик с данными из отчетов
+    # снимки страниц строятся за один потоковый проход и кэшируются по хэшу содержимого файла
+    with measure_stage('workbook_parsing') as stage:
+        model_sheet_snapshot = load_sheet_snapshot_with_cache(model_binary_stream, selected_model_sheet)
+        issuer_sheet_snapshot = load_sheet_snapshot_with_cache(issuer_binary_stream, selected_issuer_sheet,
+                                                               use_disk_cache=True)
+        count_snapshot_cells(stage, model_sheet_snapshot, issuer_sheet_snapshot)
+    with measure_stage('start_cell_detection'):
+        return find_addresses_of_start(model_sheet_snapshot, issuer_sheet_snapshot)
+
+
+def count_snapshot_cells(stage, *sheet_snapshots: SheetSnapshot):
+    """Добавляет в счетчики этапа количество рядов и ячеек снимков страниц."""
+    for sheet_snapshot in sheet_snapshots:
+        stage.count('rows', sheet_snapshot.max_row)
+        stage.count('cells', sheet_snapshot.numbers.size)
+
+
+def find_addresses_of_start(model_sheet_snapshot: SheetSnapshot, issuer_sheet_snapshot: SheetSnapshot):
+    """Ищет координаты ячеек для начала обработки по снимкам страниц (см. specify_function_for_cell_address_searching).
+    Args:
+        model_sheet_snapshot: снимок выбранной страницы аналитической модели
+        issuer_sheet_snapshot: снимок выбранной страницы отчета эмитента
+
+    Returns:
+        координаты ячеек для начала обработки в файле аналитической модели и в файле отчёта эмитента
+    """
+    index_of_last_column = find_last_historical_column_number(model_sheet_snapshot)
+    if index_of_last_column is not None:
         # если координаты не найдены, возвращается значение по умолчанию
         address_start_cell_in_model, address_start_cell_in_filling = \
-            get_coordinates_of_cells_in_column_with_same_fiscal_period(selected_sheet_in_model_wb,
-                                                                       selected_sheet_in_issuer_wb,
-                                                                       first_prognosis_column_number - 1)
+            get_coordinates_of_cells_in_column_with_same_fiscal_period(model_sheet_snapshot,
+                                                                       issuer_sheet_snapshot,
+                                                                       index_of_last_column)
         return address_start_cell_in_model, address_start_cell_in_filling
 
 
-def add_similar_statement_tags_from_config(statement_block: str, data_source: str, list_of_equivalents: list):
+def find_last_historical_column_number(model_sheet_snapshot: SheetSnapshot) -> int | None:
+    """Возвращает номер последнего столбца аналитической модели с данными из отчетов (None, если на странице
+    баланса нет непустых столбцов). Если у страницы нет прогнозных периодов (и это не баланс), выбрасывает ValueError.
+    """
+    if 'Баланс' in model_sheet_snapshot.title or 'Balance' in model_sheet_snapshot.title:
+        # получаем номер последней непустой колонки, которую необходимо обработать
+        return find_last_occupied_column_number(model_sheet_snapshot)
+    # названия столбцов записаны во втором ряду
+    row_in_model_to_start = 2
+    first_prognosis_column_number = define_first_prognosis_column_number(model_sheet_snapshot,
+                                                                         row_in_model_to_start)
+    # Берём прогнозный столбик - 1, т. к. нужен последний столбик с данными из отчетов
+    # (если прогноз уже в первом столбце - берем его же)
+    return max(first_prognosis_column_number - 1, 1)
+
+
+def add_similar_statement_tags_from_config(statement_block: str, data_source: str, list_of_equivalents: list,
+                                           scored: bool = False, top_k: int = DEFAULT_TOP_K,
+                                           min_score: float = DEFAULT_MIN_SCORE):
     """По полученным аргументам выбирает какой файл config и источник
     данных необходимо использовать. Сравнивает переданные в списке list_of_equivalents
     названия статей из отчета эмитента с названиями статей из отчетов эмитентов из файла config.
@@ -183,6 +267,52 @@ def add_similar_statement_tags_from_config(statement_block: str, data_source: st
         :type data_source: str
         :param list_of_equivalents: список, состоящий из объектов dataclass Equivalent
         :type list_of_equivalents: list
+        :param scored: ранжированный нечеткий поиск вместо поиска подстроки: в tags_from_config попадают top_k
+                       самых похожих названий статей (со схожестью не ниже min_score), схожесть записывается
+                       в scores_of_tags_from_config
+        :type scored: bool
+        :param top_k: максимальное количество названий статей при ранжированном поиске
+        :type top_k: int
+        :param min_score: минимальная схожесть при ранжированном поиске (от 0 до 1)
+        :type min_score: float
+    """
+    for _ in iter_similar_statement_tags_from_config(statement_block, data_source, list_of_equivalents,
+                                                     scored, top_k, min_score):
+        pass
+
+
+def iter_similar_statement_tags_from_config(statement_block: str, data_source: str, equivalents: Iterable,
+                                            scored: bool = False, top_k: int = DEFAULT_TOP_K,
+                                            min_score: float = DEFAULT_MIN_SCORE) -> Iterator:
+    """Потоковый вариант add_similar_statement_tags_from_config: заполняет tags_from_config каждого объекта
+    Equivalent по мере получения из equivalents (например, из iter_tags_equations) и сразу отдает его дальше.
+    Объекты ProblemRow передаются дальше без изменений. Параметры - как у add_similar_statement_tags_from_config.
+    """
+    path_to_config, used_data_source = get_config_location(statement_block, data_source)
+    # общее количество известно, только если передан список
+    number_of_equivalents = len(equivalents) if hasattr(equivalents, '__len__') else None
+    # в этап входит только поиск в конфиге: получение эквивалентов и их обработка потребителем идут вне его
+    with measure_streamed_stage('config_lookup', lookups=0) as stage:
+        with measure_stage_part(stage):
+            # конфиг разбирается один раз (до изменения файла), поиск идет по обратному индексу раздела
+            config_section_index = get_config_section_index(path_to_config, used_data_source)
+        # одно название статьи эмитента часто встречается в нескольких парах - ранжированный поиск по нему один
+        scored_config_model_tags_by_tag = {}
+        # Берем один dataclass из списка, из него берем тэг из отчета и ищем его среди
+        # всех тэгов эмитентов из конфига (справа после равно).
+        for equivalent in equivalents:
+            if isinstance(equivalent, Equivalent):
+                with measure_stage_part(stage):
+                    add_similar_statement_tags_to_equivalent(config_section_index, equivalent, stage,
+                                                             number_of_equivalents, scored_config_model_tags_by_tag,
+                                                             scored=scored, top_k=top_k, min_score=min_score)
+            yield equivalent
+
+
+def get_config_location(statement_block: str, data_source: str) -> tuple:
+    """Определяет файл конфига по блоку статей и раздел конфига по источнику данных.
+    Returns:
+        путь до файла конфига и название раздела
     """
     # создаём путь до общей папки с конфигами
     # data_folder = Path(__file__).parent.parent.resolve().joinpath('data')
@@ -212,21 +342,40 @@ def add_similar_statement_tags_from_config(statement_block: str, data_source: st
         case 'PDF':
             used_data_source = 'PDF statements'
 
-    used_config = configparser.ConfigParser()
-    used_config.read(path_to_config, encoding='UTF-8')
-    # Берем один dataclass из списка, из него берем тэг из отчета и сравниваем его со
-    # всеми тэгами эмитентов из конфига (справа после равно), перебирая поэлементно словарь ({ключ: тэг, тэг, тэг}).
-    for equivalent in list_of_equivalents:
-        # Так как для каждого эквивалента нужно пройтись по всему конфигу и собрать все совпадения
-        list_of_config_model_tags = []
-        for config_model_tag, config_issuer_tags in used_config[used_data_source].items():
-            # Если тэг из переданного отчета эмитента является частью одного из тэгов из правой части конфига,
-            # добавляем в список list_of_config_model_tags соответствующее название статьи из левой части конфига
-            if any(equivalent.tag_from_filling.lower() in value.lower() for value in config_issuer_tags.split('\n')):
-                # записываем статью из конфига с заглавной буквы (чтоб красиво было :) )
-                list_of_config_model_tags.append(config_model_tag.capitalize())
-        # Полученный список присваиваем tags_from_config из dataclass.
-        equivalent.tags_from_config = list_of_config_model_tags
+    return path_to_config, used_data_source
+
+
+def add_similar_statement_tags_to_equivalent(config_section_index, equivalent: Equivalent, stage,
+                                             number_of_equivalents: int | None,
+                                             scored_config_model_tags_by_tag: dict, *,
+                                             scored: bool, top_k: int, min_score: float):
+    """Ищет названия статей в индексе раздела конфига для одного объекта Equivalent
+    (см. add_similar_statement_tags_from_config). Количество поисков и найденных названий
+    записывается в счетчики этапа stage."""
+    if stage.counters['lookups'] % PROGRESS_REPORT_INTERVAL == 0:
+        report_progress('config_lookup', stage.counters['lookups'], number_of_equivalents)
+    stage.count('lookups')
+    if scored:
+        # берем названия статей из левой части конфига, варианты которых больше всего похожи на тэг
+        # из отчета эмитента (с учетом формы слов, знаков препинания и уточнений вроде «нетто»)
+        scored_config_model_tags = scored_config_model_tags_by_tag.get(equivalent.tag_from_filling)
+        if scored_config_model_tags is None:
+            scored_config_model_tags = config_section_index.find_scored_model_tags(
+                equivalent.tag_from_filling, top_k, min_score)
+            scored_config_model_tags_by_tag[equivalent.tag_from_filling] = scored_config_model_tags
+        list_of_config_model_tags = [config_model_tag.capitalize()
+                                     for config_model_tag, _ in scored_config_model_tags]
+        equivalent.scores_of_tags_from_config = [score for _, score in scored_config_model_tags]
+    else:
+        # Если тэг из переданного отчета эмитента является частью одного из тэгов из правой части конфига,
+        # берем соответствующее название статьи из левой части конфига
+        # и записываем его с заглавной буквы (чтоб красиво было :) )
+        list_of_config_model_tags = [config_model_tag.capitalize()
+                                     for config_model_tag in config_section_index.find_model_tags(
+                                                                                equivalent.tag_from_filling)]
+    # Полученный список присваиваем tags_from_config из dataclass.
+    equivalent.tags_from_config = list_of_config_model_tags
+    stage.count('found_config_tags', len(list_of_config_model_tags))
 
 
 def get_sheetnames_with_binary_stream(xlsx_binary_stream: BytesIO) -> list[str]:
@@ -238,8 +387,8 @@ def get_sheetnames_with_binary_stream(xlsx_binary_stream: BytesIO) -> list[str]:
     Returns:
         список названий страниц WB
     """
-    workbook = openpyxl.load_workbook(xlsx_binary_stream)
-    return workbook.sheetnames
+    # читается только workbook.xml, сами страницы не разбираются
+    return read_sheetnames_from_workbook_xml(xlsx_binary_stream)
 
 
 def check_cell_address_input(address_of_start: str) -> [str or None]:
@@ -257,11 +406,84 @@ def check_cell_address_input(address_of_start: str) -> [str or None]:
         return address_of_start
 
 
+def find_matching_rows_exactly(model_values: list, issuer_values: list, issuer_rows: list) -> Iterator[tuple]:
+    """Находит пары ячеек с равными значениями (дробные значения усекаются до целых).
+    Args:
+        model_values: значения столбца модели
+        issuer_values: значения столбца эмитента
+        issuer_rows: номера рядов, которым соответствуют значения эмитента
+    Returns:
+        итератор пар (позиция значения модели, номер ряда эмитента) по порядку обхода столбцов
+    """
+    # индекс значений столбца эмитента строится один раз, далее каждая ячейка модели - один поиск по словарю
+    issuer_value_index = create_value_index(zip(issuer_rows, issuer_values))
+    for model_position, cell_value in enumerate(model_values):
+        if cell_value is None:
+            continue
+        # одно значение может встречаться в нескольких рядах отчета эмитента - обходим их все по порядку
+        for comparative_cell_row in issuer_value_index.get(normalize_value_for_comparison(cell_value), ()):
+            yield model_position, comparative_cell_row
+
+
+def find_matching_rows_with_tolerance(model_values: list, issuer_values: list, issuer_rows: list, *,
+                                      absolute_tolerance: float = 0.0, relative_tolerance: float = 0.0,
+                                      detect_scale: bool = False) -> Iterator[tuple]:
+    """Находит пары числовых ячеек, значения которых совпадают с допустимым отклонением, с учетом масштаба
+    (значения сортируются и сопоставляются бинарным поиском, без усечения до целых).
+    Args:
+        model_values: значения столбца модели
+        issuer_values: значения столбца эмитента
+        issuer_rows: номера рядов, которым соответствуют значения эмитента
+        absolute_tolerance: допустимое абсолютное отклонение (в единицах отчета эмитента)
+        relative_tolerance: допустимое относительное отклонение (доля от значения)
+        detect_scale: определять ли масштаб отчета эмитента относительно модели
+    Returns:
+        итератор пар (позиция значения модели, номер ряда эмитента) по порядку обхода столбцов
+    """
+    model_numbers = convert_values_to_numbers(model_values)
+    issuer_numbers = convert_values_to_numbers(issuer_values)
+    scale_factor = 1.0
+    if detect_scale:
+        scale_factor = detect_scale_factor(model_numbers, issuer_numbers,
+                                           relative_tolerance=relative_tolerance or SCALE_DETECTION_RELATIVE_TOLERANCE)
+    model_positions, issuer_positions = join_with_tolerance(model_numbers, issuer_numbers, absolute_tolerance,
+                                                            relative_tolerance, scale_factor)
+    for model_position, issuer_position in zip(model_positions.tolist(), issuer_positions.tolist()):
+        yield model_position, issuer_rows[issuer_position]
+
+
+def is_model_tag_cell_to_match(tag_cell, tag_cell_fill_color: str | None, model_cell_coordinate: str) -> bool:
+    """Проверяет ячейку с названием статьи в модели напротив найденного совпадения значений.
+    Args:
+        :param tag_cell: значение ячейки с названием статьи
+        :param tag_cell_fill_color: цвет заливки ячейки с названием статьи (fgColor.index)
+        :type tag_cell_fill_color: str | None
+        :param model_cell_coordinate: координаты ячейки с названием статьи (для сообщения об ошибке)
+        :type model_cell_coordinate: str
+    Returns:
+        True, если статью нужно добавить в список эквивалентов, False - если ее нужно пропустить
+    """
+    # чтобы не было случая, когда напротив найденного значения в столбце с тегами ничего не написано
+    if not tag_cell:
+        raise EmptyTagCellInModel(f'Совпадение значений найдено, '
+                                  f'но ячейка с названием статьи в модели ({model_cell_coordinate}) - пуста')
+    # пропускаем процентные значения, т. к. они округляются до нуля
+    if '%' in tag_cell:
+        return False
+    # если ячейка уже залита жёлтым, т.е. прошла автоматизацию и закачивает значение - можно её уже не брать
+    if tag_cell_fill_color == 'FFFFFF00':
+        return False
+    return True
+
+
 def tags_equations_creator(*, model_binary_stream: BytesIO, issuer_binary_stream: BytesIO,
                            selected_model_sheet: str, selected_issuer_sheet: str,
                            model_address_of_start: str, issuer_address_of_start: str,
                            index_of_model_column_with_tags: int = 2,
-                           index_of_issuer_column_with_tags: int = 1) -> list[tuple]:
+                           index_of_issuer_column_with_tags: int = 1,
+                           absolute_tolerance: float = 0.0, relative_tolerance: float = 0.0,
+                           detect_scale: bool = False,
+                           excluded_tags_from_filling: [set|frozenset] = frozenset()) -> list[tuple]:
     """Отдает список эквивалентных названий статей, совпадающих по значениям за одинаковый фискальный период
     Args:
         :param model_binary_stream: бинарный поток XLSX файла аналитической модели
@@ -283,63 +505,359 @@ def tags_equations_creator(*, model_binary_stream: BytesIO, issuer_binary_stream
         :type index_of_model_column_with_tags: int
         :param index_of_issuer_column_with_tags: индекс столбца с названиями статей в отчете эмитента (по умолчанию 1)
         :type index_of_issuer_column_with_tags: int
+        :param absolute_tolerance: допустимое абсолютное отклонение значений (по умолчанию 0 - точное сравнение)
+        :type absolute_tolerance: float
+        :param relative_tolerance: допустимое относительное отклонение значений, доля (по умолчанию 0)
+        :type relative_tolerance: float
+        :param detect_scale: определять ли масштаб отчета эмитента относительно модели (тысячи, миллионы)
+        :type detect_scale: bool
+        :param excluded_tags_from_filling: названия статей эмитента, ряды которых не сопоставляются (например,
+                                           уже подтвержденные аналитиком, см. automation_assistance_mapping_store)
+        :type excluded_tags_from_filling: set | frozenset
     Returns:
         список кортежей эквивалентных названий статей, где 1-ый элемент кортежа — название в аналитической модели, а
         2-ой элемент — название статьи в отчете эмитента
         """
-    # создаем workbook из каждого бинарного потока
-    model_workbook = openpyxl.load_workbook(model_binary_stream, data_only=True)
-    issuer_workbook = openpyxl.load_workbook(issuer_binary_stream, data_only=True)
-    # создаем worksheet по названию каждого из переданных листов
-    model_worksheet = model_workbook[selected_model_sheet]
-    issuer_worksheet = issuer_workbook[selected_issuer_sheet]
-    # сохраняем номера столбцов и рядов для обхода столбца для сравнения
-    model_index_of_column = model_worksheet[model_address_of_start].column
-    model_index_of_row = model_worksheet[model_address_of_start].row
-    issuer_index_of_column = issuer_worksheet[issuer_address_of_start].column
-    issuer_index_of_row = issuer_worksheet[issuer_address_of_start].row
-    # создаем два итератора для перебора ячеек одного столбца
-    model_column = next(model_worksheet.iter_cols(min_col=model_index_of_column,
-                                                  max_col=model_index_of_column,
-                                                  min_row=model_index_of_row))
-    issuer_column = next(issuer_worksheet.iter_cols(min_col=issuer_index_of_column,
-                                                    max_col=issuer_index_of_column,
-                                                    min_row=issuer_index_of_row))
-    list_of_equivalents = []
-    # сравниваем значение каждой ячейки в столбце из файла аналитической модели с ячейками из файла отчета эмитента
-    for cell in model_column:
-        cell_value = cell.value
-        if cell_value is None:
+    return collect_equivalents(iter_tags_equations(
+        model_binary_stream=model_binary_stream, issuer_binary_stream=issuer_binary_stream,
+        selected_model_sheet=selected_model_sheet, selected_issuer_sheet=selected_issuer_sheet,
+        model_address_of_start=model_address_of_start, issuer_address_of_start=issuer_address_of_start,
+        index_of_model_column_with_tags=index_of_model_column_with_tags,
+        index_of_issuer_column_with_tags=index_of_issuer_column_with_tags,
+        absolute_tolerance=absolute_tolerance, relative_tolerance=relative_tolerance, detect_scale=detect_scale,
+        excluded_tags_from_filling=excluded_tags_from_filling))
+
+
+def iter_tags_equations(*, model_binary_stream: BytesIO, issuer_binary_stream: BytesIO,
+                        selected_model_sheet: str, selected_issuer_sheet: str,
+                        model_address_of_start: str, issuer_address_of_start: str,
+                        index_of_model_column_with_tags: int = 2,
+                        index_of_issuer_column_with_tags: int = 1,
+                        absolute_tolerance: float = 0.0, relative_tolerance: float = 0.0,
+                        detect_scale: bool = False,
+                        excluded_tags_from_filling: [set|frozenset] = frozenset()) -> Iterator:
+    """Потоковый вариант tags_equations_creator (параметры те же): отдает объекты Equivalent по мере нахождения
+    совпадений, не собирая список. Если напротив совпадения ячейка с названием статьи в модели пуста, вместо
+    исключения отдается объект ProblemRow и сопоставление продолжается.
+    Returns:
+        итератор по объектам Equivalent и ProblemRow
+    """
+    # сохраняем номера столбцов для обхода столбца для сравнения
+    model_index_of_column = coordinate_to_tuple(model_address_of_start)[1]
+    issuer_index_of_column = coordinate_to_tuple(issuer_address_of_start)[1]
+    model_columns, issuer_columns = extract_columns_to_match(
+        model_binary_stream, issuer_binary_stream, selected_model_sheet, selected_issuer_sheet,
+        model_address_of_start, issuer_address_of_start,
+        index_of_model_column_with_tags=index_of_model_column_with_tags,
+        index_of_issuer_column_with_tags=index_of_issuer_column_with_tags)
+    # в этап входит только поиск совпадений, а не обработка отданных объектов потребителем
+    yield from measure_iterator_stage('value_matching', lambda stage: iter_equivalents_of_extracted_columns(
+        model_columns, issuer_columns, stage,
+        model_index_of_column=model_index_of_column, issuer_index_of_column=issuer_index_of_column,
+        index_of_model_column_with_tags=index_of_model_column_with_tags,
+        index_of_issuer_column_with_tags=index_of_issuer_column_with_tags,
+        absolute_tolerance=absolute_tolerance, relative_tolerance=relative_tolerance,
+        detect_scale=detect_scale, excluded_tags_from_filling=excluded_tags_from_filling))
+
+
+def extract_columns_to_match(model_binary_stream: BytesIO, issuer_binary_stream: BytesIO,
+                             selected_model_sheet: str, selected_issuer_sheet: str,
+                             model_address_of_start: str, issuer_address_of_start: str, *,
+                             index_of_model_column_with_tags: int = 2, index_of_issuer_column_with_tags: int = 1):
+    """Извлекает столбцы для сравнения и столбцы с названиями статей модели и эмитента, начиная с ряда старта
+    (см. iter_tags_equations). У столбца с названиями статей модели извлекается и цвет заливки ячеек.
+    Returns:
+        извлеченные столбцы модели и извлеченные столбцы эмитента (ExtractedColumns)
+    """
+    # извлекаем только столбцы для сравнения и столбцы с названиями статей (начиная с ряда старта);
+    # страница эмитента (один отчет часто загружают несколько аналитиков) берется из кэша на диске
+    with measure_stage('workbook_parsing') as stage:
+        model_columns = extract_model_columns_to_match(model_binary_stream, selected_model_sheet,
+                                                       model_address_of_start, index_of_model_column_with_tags)
+        issuer_columns = extract_issuer_columns_to_match(issuer_binary_stream, selected_issuer_sheet,
+                                                         issuer_address_of_start, index_of_issuer_column_with_tags)
+        count_extracted_cells(stage, model_columns, issuer_columns)
+    return model_columns, issuer_columns
+
+
+def extract_model_columns_to_match(model_binary_stream: BytesIO, selected_model_sheet: str,
+                                   model_address_of_start: str, index_of_model_column_with_tags: int = 2):
+    """Извлекает столбец для сравнения и столбец с названиями статей модели (с цветом заливки), начиная с ряда
+    старта, из колоночного представления страницы (см. extract_columns_to_match). Страница, уже разобранная
+    вместе с цветами заливки столбца с названиями статей (при ранжировании страниц эмитента или в режиме всей
+    модели), повторно не разбирается."""
+    model_index_of_column, model_index_of_row = coordinate_to_tuple(model_address_of_start)[::-1]
+    return load_columnar_sheet_with_cache(model_binary_stream, selected_model_sheet, data_only=True,
+                                          fill_column_indexes=(index_of_model_column_with_tags,)).extract_columns(
+        (model_index_of_column, index_of_model_column_with_tags), min_row=model_index_of_row)
+
+
+def extract_issuer_columns_to_match(issuer_binary_stream: BytesIO, selected_issuer_sheet: str,
+                                    issuer_address_of_start: str, index_of_issuer_column_with_tags: int = 1):
+    """Извлекает столбец для сравнения и столбец с названиями статей эмитента, начиная с ряда старта,
+    из колоночного представления страницы (см. extract_columns_to_match)."""
+    issuer_index_of_column, issuer_index_of_row = coordinate_to_tuple(issuer_address_of_start)[::-1]
+    return load_columnar_sheet_with_cache(issuer_binary_stream, selected_issuer_sheet, data_only=True,
+                                          use_disk_cache=True).extract_columns(
+        (issuer_index_of_column, index_of_issuer_column_with_tags), min_row=issuer_index_of_row)
+
+
+def count_extracted_cells(stage, *extracted_columns_list):
+    """Добавляет в счетчики этапа количество рядов и ячеек, извлеченных потоковым чтением."""
+    for extracted_columns in extracted_columns_list:
+        stage.count('rows', len(extracted_columns.rows))
+        stage.count('cells', len(extracted_columns.rows) * len(extracted_columns.values))
+
+
+def iter_equivalents_of_extracted_columns(model_columns, issuer_columns, stage, **matching_arguments) -> Iterator:
+    """Сопоставляет значения извлеченных столбцов модели и эмитента и отдает эквивалентные названия статей
+    (см. iter_tags_equations). Количество сравнений, найденных пар и проблемных рядов записывается в счетчики
+    этапа stage. Параметры сопоставления - как у iter_positioned_equivalents_of_extracted_columns."""
+    for _, item in iter_positioned_equivalents_of_extracted_columns(model_columns, issuer_columns, stage,
+                                                                    **matching_arguments):
+        yield item
+
+
+def get_issuer_values_to_match(issuer_columns, issuer_index_of_column: int, index_of_issuer_column_with_tags: int,
+                               excluded_tags_from_filling: [set|frozenset] = frozenset()) -> list:
+    """Отдает значения столбца эмитента для сравнения: ряды эмитента с исключенными названиями статей
+    считаются пустыми и ни с чем не совпадают."""
+    issuer_values = issuer_columns.values[issuer_index_of_column]
+    if not excluded_tags_from_filling:
+        return issuer_values
+    return [None if str(tag_comparative_cell) in excluded_tags_from_filling else value
+            for tag_comparative_cell, value in zip(issuer_columns.values[index_of_issuer_column_with_tags],
+                                                   issuer_values)]
+
+
+def find_matching_rows(model_values: list, issuer_values: list, issuer_rows: list, *, absolute_tolerance: float,
+                       relative_tolerance: float, detect_scale: bool) -> Iterator[tuple]:
+    """Выбирает способ сравнения: точное (поиск по словарю) или с допустимым отклонением и масштабом
+    (бинарный поиск). Аргументы - как у find_matching_rows_with_tolerance."""
+    if absolute_tolerance or relative_tolerance or detect_scale:
+        return find_matching_rows_with_tolerance(model_values, issuer_values, issuer_rows,
+                                                 absolute_tolerance=absolute_tolerance,
+                                                 relative_tolerance=relative_tolerance,
+                                                 detect_scale=detect_scale)
+    return find_matching_rows_exactly(model_values, issuer_values, issuer_rows)
+
+
+def iter_positioned_equivalents_of_extracted_columns(model_columns, issuer_columns, stage, *,
+                                                     model_index_of_column: int, issuer_index_of_column: int,
+                                                     index_of_model_column_with_tags: int,
+                                                     index_of_issuer_column_with_tags: int,
+                                                     absolute_tolerance: float, relative_tolerance: float,
+                                                     detect_scale: bool,
+                                                     excluded_tags_from_filling: [set|frozenset] = frozenset(),
+                                                     model_positions_to_match: [set|frozenset] = None) -> Iterator:
+    """Сопоставляет значения извлеченных столбцов модели и эмитента (см. iter_equivalents_of_extracted_columns).
+    Args:
+        :param model_positions_to_match: позиции значений модели (от ряда старта), которые нужно сопоставить
+                                         (по умолчанию - все; см. automation_assistance_incremental)
+        :type model_positions_to_match: set | frozenset
+    Returns:
+        итератор пар (позиция значения модели, объект Equivalent или ProblemRow) по порядку рядов модели
+    """
+    # названия статей эмитента по номеру ряда
+    issuer_tags = dict(zip(issuer_columns.rows, issuer_columns.values[index_of_issuer_column_with_tags]))
+    model_values = model_columns.values[model_index_of_column]
+    if model_positions_to_match is not None:
+        # остальные значения модели считаются пустыми
+        model_values = [value if model_position in model_positions_to_match else None
+                        for model_position, value in enumerate(model_values)]
+    issuer_values = get_issuer_values_to_match(issuer_columns, issuer_index_of_column,
+                                               index_of_issuer_column_with_tags, excluded_tags_from_filling)
+    # каждое непустое значение модели ищется среди значений эмитента один раз (поиск по словарю или бинарный поиск)
+    stage.count('comparisons', sum(value is not None for value in model_values))
+    matched_rows = find_matching_rows(model_values, issuer_values, issuer_columns.rows,
+                                      absolute_tolerance=absolute_tolerance, relative_tolerance=relative_tolerance,
+                                      detect_scale=detect_scale)
+    stage.count('matched_pairs', 0)
+    stage.count('equivalents', 0)
+    # если значения ячеек равны, приравниваем значения названий статей и отдаем пару названий (str)
+    for model_position, comparative_cell_row in matched_rows:
+        stage.count('matched_pairs')
+        if stage.counters['matched_pairs'] % PROGRESS_REPORT_INTERVAL == 0:
+            report_progress('value_matching', stage.counters['matched_pairs'])
+        cell_row = model_columns.rows[model_position]
+        tag_cell = model_columns.values[index_of_model_column_with_tags][model_position]
+        tag_cell_fill_color = model_columns.fill_colors[index_of_model_column_with_tags][model_position]
+        tag_comparative_cell = issuer_tags[comparative_cell_row]
+        model_cell_coordinate = f'{get_column_letter(index_of_model_column_with_tags)}{cell_row}'
+        try:
+            if not is_model_tag_cell_to_match(tag_cell, tag_cell_fill_color, model_cell_coordinate):
+                continue
+        except EmptyTagCellInModel as error:
+            stage.count('problem_rows')
+            yield model_position, ProblemRow(model_cell_coordinate=model_cell_coordinate, message=str(error),
+                                             tag_from_filling=str(tag_comparative_cell))
             continue
-        for comparative_cell in issuer_column:
-            comparative_cell_value = comparative_cell.value
-            if comparative_cell_value is None:
+        stage.count('equivalents')
+        yield model_position, Equivalent(model_tag=str(tag_cell), tag_from_filling=str(tag_comparative_cell))
+
+
+def multi_period_tags_equations_creator(*, model_binary_stream: BytesIO, issuer_binary_stream: BytesIO,
+                                        selected_model_sheet: str, selected_issuer_sheet: str,
+                                        model_address_of_start: str, issuer_address_of_start: str,
+                                        index_of_model_column_with_tags: int = 2,
+                                        index_of_issuer_column_with_tags: int = 1,
+                                        row_with_model_periods: int = 2,
+                                        min_confidence: float = 0.5,
+                                        excluded_tags_from_filling: [set|frozenset] = frozenset()) -> list[Equivalent]:
+    """Отдает список эквивалентных названий статей, сопоставленных сразу по всем историческим периодам модели.
+    Исторические столбцы модели (левее первого прогнозного) сопоставляются со столбцами отчета эмитента
+    по общим значениям, затем ряды сопоставляются по вектору значений за все сопоставленные периоды за один проход.
+    Случайные совпадения одного значения (нули, повторяющиеся итоги, маленькие округленные числа) отсекаются
+    порогом уверенности.
+    Args:
+        :param model_binary_stream: бинарный поток XLSX файла аналитической модели
+        :type model_binary_stream: BytesIO
+        :param issuer_binary_stream: бинарный поток XLSX файла отчета эмитента
+        :type issuer_binary_stream: BytesIO
+        :param selected_model_sheet: название выбранной для сравнения ws из файла аналитической модели
+        :type selected_model_sheet: str
+        :param selected_issuer_sheet: название выбранной для сравнения ws из файла отчета эмитента
+        :type selected_issuer_sheet: str
+        :param model_address_of_start: адрес верхней ячейки столбца для сравнения в файле аналитической модели
+                                       (используется ряд, с которого начинается сравнение)
+        :type model_address_of_start: str
+        :param issuer_address_of_start: адрес верхней ячейки столбца для сравнения в файле отчета эмитента
+                                        (используется ряд, с которого начинается сравнение)
+        :type issuer_address_of_start: str
+        :param index_of_model_column_with_tags: индекс столбца с названиями статей в аналитической модели
+                                                 (по умолчанию 2)
+        :type index_of_model_column_with_tags: int
+        :param index_of_issuer_column_with_tags: индекс столбца с названиями статей в отчете эмитента (по умолчанию 1)
+        :type index_of_issuer_column_with_tags: int
+        :param row_with_model_periods: ряд с названиями периодов в аналитической модели (по умолчанию 2)
+        :type row_with_model_periods: int
+        :param min_confidence: минимальная доля совпавших периодов для пары рядов (по умолчанию 0.5)
+        :type min_confidence: float
+        :param excluded_tags_from_filling: названия статей эмитента, ряды которых не сопоставляются
+        :type excluded_tags_from_filling: set | frozenset
+    Returns:
+        список объектов Equivalent с заполненной уверенностью сопоставления (confidence)
+    """
+    return collect_equivalents(iter_multi_period_tags_equations(
+        model_binary_stream=model_binary_stream, issuer_binary_stream=issuer_binary_stream,
+        selected_model_sheet=selected_model_sheet, selected_issuer_sheet=selected_issuer_sheet,
+        model_address_of_start=model_address_of_start, issuer_address_of_start=issuer_address_of_start,
+        index_of_model_column_with_tags=index_of_model_column_with_tags,
+        index_of_issuer_column_with_tags=index_of_issuer_column_with_tags,
+        row_with_model_periods=row_with_model_periods, min_confidence=min_confidence,
+        excluded_tags_from_filling=excluded_tags_from_filling))
+
+
+def iter_multi_period_tags_equations(*, model_binary_stream: BytesIO, issuer_binary_stream: BytesIO,
+                                     selected_model_sheet: str, selected_issuer_sheet: str,
+                                     model_address_of_start: str, issuer_address_of_start: str,
+                                     index_of_model_column_with_tags: int = 2,
+                                     index_of_issuer_column_with_tags: int = 1,
+                                     row_with_model_periods: int = 2,
+                                     min_confidence: float = 0.5,
+                                     excluded_tags_from_filling: [set|frozenset] = frozenset()) -> Iterator:
+    """Потоковый вариант multi_period_tags_equations_creator (параметры те же). Ряды сопоставляются за один
+    проход по матрицам, а объекты Equivalent создаются и отдаются по одному; вместо исключения для пустой ячейки
+    с названием статьи в модели отдается объект ProblemRow.
+    Returns:
+        итератор по объектам Equivalent и ProblemRow
+    """
+    model_index_of_row = coordinate_to_tuple(model_address_of_start)[0]
+    issuer_index_of_row = coordinate_to_tuple(issuer_address_of_start)[0]
+    with measure_stage('workbook_parsing') as stage:
+        model_sheet_snapshot = load_sheet_snapshot_with_cache(
+            model_binary_stream, selected_model_sheet, data_only=True,
+            fill_column_indexes=(index_of_model_column_with_tags,))
+        issuer_sheet_snapshot = load_sheet_snapshot_with_cache(issuer_binary_stream, selected_issuer_sheet,
+                                                               data_only=True, use_disk_cache=True)
+        count_snapshot_cells(stage, model_sheet_snapshot, issuer_sheet_snapshot)
+    with measure_stage('value_matching') as stage:
+        excluded_issuer_rows = None
+        if excluded_tags_from_filling:
+            issuer_tags_column = load_columnar_sheet_with_cache(issuer_binary_stream, selected_issuer_sheet,
+                                                                data_only=True, use_disk_cache=True).get_column_values(
+                index_of_issuer_column_with_tags, min_row=issuer_index_of_row)
+            excluded_issuer_rows = np.array([str(tag_comparative_cell) in excluded_tags_from_filling
+                                             for tag_comparative_cell in issuer_tags_column], dtype=bool)
+        matched_rows = match_snapshot_rows_by_signature(
+            model_sheet_snapshot, issuer_sheet_snapshot, stage,
+            model_index_of_row=model_index_of_row, issuer_index_of_row=issuer_index_of_row,
+            index_of_model_column_with_tags=index_of_model_column_with_tags,
+            index_of_issuer_column_with_tags=index_of_issuer_column_with_tags,
+            row_with_model_periods=row_with_model_periods, min_confidence=min_confidence,
+            excluded_issuer_rows=excluded_issuer_rows)
+    if not matched_rows:
+        return
+
+    # названия статей (и заливка ячеек модели) нужны только для найденных рядов
+    with measure_stage('workbook_parsing') as stage:
+        model_columns = load_columnar_sheet_with_cache(
+            model_binary_stream, selected_model_sheet, data_only=True,
+            fill_column_indexes=(index_of_model_column_with_tags,)).extract_columns(
+            (index_of_model_column_with_tags,), min_row=model_index_of_row)
+        issuer_columns = load_columnar_sheet_with_cache(issuer_binary_stream, selected_issuer_sheet,
+                                                        data_only=True, use_disk_cache=True).extract_columns(
+            (index_of_issuer_column_with_tags,), min_row=issuer_index_of_row)
+        count_extracted_cells(stage, model_columns, issuer_columns)
+    model_tags = dict(zip(model_columns.rows, zip(model_columns.values[index_of_model_column_with_tags],
+                                                  model_columns.fill_colors[index_of_model_column_with_tags])))
+    issuer_tags = dict(zip(issuer_columns.rows, issuer_columns.values[index_of_issuer_column_with_tags]))
+    for model_row_index, issuer_row_index, confidence in matched_rows:
+        model_row = model_index_of_row + model_row_index
+        tag_cell, tag_cell_fill_color = model_tags.get(model_row, (None, None))
+        tag_comparative_cell = issuer_tags.get(issuer_index_of_row + issuer_row_index)
+        model_cell_coordinate = f'{get_column_letter(index_of_model_column_with_tags)}{model_row}'
+        try:
+            if not is_model_tag_cell_to_match(tag_cell, tag_cell_fill_color, model_cell_coordinate):
                 continue
-            # в ячейке может быть float - приведем все к целым числам (int)
-            if isinstance(cell_value, float):
-                cell_value = int(cell_value)
-            if isinstance(comparative_cell_value, float):
-                comparative_cell_value = int(comparative_cell_value)
-            # если значения ячеек равны, приравниваем значения названий статей и добавляем в список строк(str)
-            if cell_value == comparative_cell_value:
-                model_cell = model_worksheet.cell(row=cell.row, column=index_of_model_column_with_tags)
-                tag_cell = model_cell.value
-                # чтобы не было случая, когда напротив найденного значения в столбце с тегами ничего не написано
-                if not tag_cell:
-                    raise EmptyTagCellInModel(f'Совпадение значений найдено, '
-                                              f'но ячейка с названием статьи в модели ({model_cell.coordinate}) - пуста')
-                # пропускаем процентные значения, т. к. они округляются до нуля
-                if '%' in tag_cell:
-                    continue
-                # если ячейка уже залита жёлтым, т.е. прошла автоматизацию и закачивает значение - можно её уже не брать
-                if model_cell.fill.fgColor.index == 'FFFFFF00':
-                    continue
-                tag_comparative_cell = issuer_worksheet.cell(row=comparative_cell.row,
-                                                             column=index_of_issuer_column_with_tags).value
-
-                list_of_equivalents.append(Equivalent(model_tag=str(tag_cell),
-                                                      tag_from_filling=str(tag_comparative_cell)))
-    return list_of_equivalents
+        except EmptyTagCellInModel as error:
+            yield ProblemRow(model_cell_coordinate=model_cell_coordinate, message=str(error),
+                             tag_from_filling=str(tag_comparative_cell))
+            continue
+        yield Equivalent(model_tag=str(tag_cell), tag_from_filling=str(tag_comparative_cell), confidence=confidence)
+
+
+def match_snapshot_rows_by_signature(model_sheet_snapshot: SheetSnapshot, issuer_sheet_snapshot: SheetSnapshot,
+                                     stage, *, model_index_of_row: int, issuer_index_of_row: int,
+                                     index_of_model_column_with_tags: int, index_of_issuer_column_with_tags: int,
+                                     row_with_model_periods: int, min_confidence: float,
+                                     excluded_issuer_rows: np.ndarray | None = None) -> list[tuple]:
+    """Сопоставляет исторические столбцы модели со столбцами эмитента и ряды - по вектору значений
+    (см. multi_period_tags_equations_creator). Количество периодов, сравнений и пар записывается в счетчики этапа.
+    Ряды эмитента, отмеченные в маске excluded_issuer_rows (от issuer_index_of_row), не сопоставляются.
+    Returns:
+        список троек (индекс ряда модели от model_index_of_row, индекс ряда эмитента от issuer_index_of_row,
+        уверенность)
+    """
+    # исторические периоды модели - столбцы между столбцом с названиями статей и первым прогнозным столбцом
+    try:
+        first_prognosis_column_number = define_first_prognosis_column_number(model_sheet_snapshot,
+                                                                             row_with_model_periods)
+    except ValueError:
+        # на странице нет прогнозных периодов (например, баланс) - берем все столбцы
+        first_prognosis_column_number = model_sheet_snapshot.max_column + 1
+    model_period_columns = {
+        column: normalize_numbers_for_comparison(
+            model_sheet_snapshot.get_column(model_sheet_snapshot.numbers, column)[model_index_of_row - 1:])
+        for column in range(index_of_model_column_with_tags + 1, first_prognosis_column_number)}
+    issuer_period_columns = {
+        column: normalize_numbers_for_comparison(
+            issuer_sheet_snapshot.get_column(issuer_sheet_snapshot.numbers, column)[issuer_index_of_row - 1:])
+        for column in range(1, issuer_sheet_snapshot.max_column + 1) if column != index_of_issuer_column_with_tags}
+    if excluded_issuer_rows is not None:
+        for issuer_values in issuer_period_columns.values():
+            issuer_values[excluded_issuer_rows] = np.nan
+    column_pairs = align_period_columns(model_period_columns, issuer_period_columns)
+    stage.count('aligned_periods', len(column_pairs))
+    if not column_pairs:
+        return []
+    model_matrix = np.column_stack([model_period_columns[model_column] for model_column, _ in column_pairs])
+    issuer_matrix = np.column_stack([issuer_period_columns[issuer_column] for _, issuer_column in column_pairs])
+    # каждое ненулевое значение модели ищется в индексе своего периода один раз
+    stage.count('comparisons', int(np.count_nonzero(get_evidence_mask(model_matrix))))
+    matched_rows = match_rows_by_signature(model_matrix, issuer_matrix, min_confidence)
+    stage.count('matched_pairs', len(matched_rows))
+    return matched_rows
 
 
 if __name__ == '__main__':
@@ -0,0 +1,277 @@
+"""Module defining a headless batch command that processes many model/issuer file pairs in parallel processes.
+
+Пример запуска (из папки проекта, где лежат конфиги):
+    python automation_assistance_batch.py manifest.jsonl --output results.jsonl --workers 4 --timeout 300
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from io import BytesIO
+from pathlib import Path
+from typing import Callable
+from collections import deque
+from dataclasses import asdict
+from multiprocessing.connection import Connection, wait
+
+from automation_assistance import ProblemRow, specify_function_for_cell_address_searching
+from automation_assistance_config import DEFAULT_TOP_K
+from automation_assistance_exceptions import BatchJobProcessFailed, BatchJobTimeout
+from automation_assistance_instrumentation import PROFILING_MODES, collect_run_metrics, enable_json_logging
+from automation_assistance_mapping_store import (MAPPING_STORE_ENVIRONMENT_VARIABLE, MappingStore,
+                                                 iter_equivalents_with_mapping_store)
+from automation_assistance_sheet_discovery import rank_issuer_sheets
+
+# Обязательные поля строки манифеста
+REQUIRED_JOB_FIELDS = ('model_file', 'issuer_file', 'model_sheet', 'statement_block', 'data_source')
+# Время обработки одной пары файлов по умолчанию, секунды
+DEFAULT_JOB_TIMEOUT = 600
+
+
+def parse_bool(value) -> bool:
+    """Переводит значение флага из манифеста (в CSV все значения - строки) в bool."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'да')
+    return bool(value)
+
+
+def read_manifest(path_to_manifest: Path) -> list[dict]:
+    """Читает манифест пакетной обработки в формате JSONL (объект на строку) или CSV (с заголовком).
+    Относительные пути к файлам считаются от папки манифеста.
+    Args:
+        :param path_to_manifest: путь до файла манифеста
+        :type path_to_manifest: Path
+    Returns:
+        список заданий (словарей с полями манифеста)
+    """
+    with open(path_to_manifest, encoding='UTF-8', newline='') as manifest_file:
+        if path_to_manifest.suffix.lower() == '.csv':
+            jobs = [dict(row) for row in csv.DictReader(manifest_file)]
+        else:
+            jobs = [json.loads(line) for line in manifest_file if line.strip()]
+    for job in jobs:
+        for field_name in ('model_file', 'issuer_file'):
+            if job.get(field_name):
+                job[field_name] = str(path_to_manifest.parent.joinpath(job[field_name]))
+    return jobs
+
+
+def run_batch_job(job: dict) -> dict:
+    """Обрабатывает одну пару файлов: поиск ячеек для начала обработки (если адреса не переданы),
+    сопоставление статей и поиск названий в конфиге. Если в задании указан эмитент (поле issuer), пары,
+    подтвержденные для него ранее, берутся из хранилища (см. automation_assistance_mapping_store).
+    Если страница эмитента (поле issuer_sheet) не указана, выбирается страница с наибольшим пересечением
+    значений с моделью (см. automation_assistance_sheet_discovery).
+    Ряды с пустой ячейкой названия статьи в модели не прерывают обработку и записываются в поле problem_rows.
+    Args:
+        :param job: задание из манифеста
+        :type job: dict
+    Returns:
+        страница эмитента, адреса ячеек для начала обработки, список эквивалентов и список проблемных рядов
+        (в виде словарей)
+    """
+    missing_fields = [field_name for field_name in REQUIRED_JOB_FIELDS if not job.get(field_name)]
+    if missing_fields:
+        raise ValueError(f'В задании не заполнены поля: {", ".join(missing_fields)}')
+    model_binary_stream = BytesIO(Path(job['model_file']).read_bytes())
+    issuer_binary_stream = BytesIO(Path(job['issuer_file']).read_bytes())
+    issuer_sheet = job.get('issuer_sheet')
+    if not issuer_sheet:
+        sheet_ranks = rank_issuer_sheets(model_binary_stream, issuer_binary_stream, job['model_sheet'])
+        if not sheet_ranks or not sheet_ranks[0].overlap:
+            raise ValueError('Не удалось определить страницу эмитента: укажите поле issuer_sheet')
+        issuer_sheet = sheet_ranks[0].sheet_name
+    model_address_of_start = job.get('model_address_of_start')
+    issuer_address_of_start = job.get('issuer_address_of_start')
+    if not (model_address_of_start and issuer_address_of_start):
+        default_model_address_of_start, default_issuer_address_of_start = \
+            specify_function_for_cell_address_searching(model_binary_stream, issuer_binary_stream,
+                                                        job['model_sheet'], issuer_sheet)
+        model_address_of_start = model_address_of_start or default_model_address_of_start
+        issuer_address_of_start = issuer_address_of_start or default_issuer_address_of_start
+    arguments = dict(model_binary_stream=model_binary_stream, issuer_binary_stream=issuer_binary_stream,
+                     selected_model_sheet=job['model_sheet'], selected_issuer_sheet=issuer_sheet,
+                     model_address_of_start=model_address_of_start, issuer_address_of_start=issuer_address_of_start)
+    results = iter_equivalents_with_mapping_store(
+        MappingStore() if job.get('issuer') else None, job.get('issuer'),
+        statement_block=job['statement_block'], data_source=job['data_source'],
+        multi_period_mode=parse_bool(job.get('multi_period', False)),
+        matching_options={'absolute_tolerance': float(job.get('absolute_tolerance') or 0),
+                          'relative_tolerance': float(job.get('relative_tolerance') or 0),
+                          'detect_scale': parse_bool(job.get('detect_scale', False))},
+        config_lookup_options={'scored': parse_bool(job.get('scored_config_lookup', False)),
+                               'top_k': int(job.get('top_k') or DEFAULT_TOP_K)},
+        **arguments)
+    equivalents, problem_rows = [], []
+    for item in results:
+        # в словари переводятся по одному, чтобы не держать в памяти и объекты, и словари
+        (problem_rows if isinstance(item, ProblemRow) else equivalents).append(asdict(item))
+    return {'issuer_sheet': issuer_sheet,
+            'model_address_of_start': model_address_of_start,
+            'issuer_address_of_start': issuer_address_of_start,
+            'equivalents': equivalents,
+            'problem_rows': problem_rows}
+
+
+def process_batch_job(job_number: int, job: dict, profiling_mode: str | None = None,
+                      run_job: Callable[[dict], dict] = run_batch_job) -> dict:
+    """Обрабатывает задание в его процессе. Любая ошибка записывается в результат задания и не прерывает
+    остальную обработку. Замеры этапов обработки записываются в результат (поле stages).
+    Args:
+        :param job_number: номер задания в манифесте (с нуля)
+        :type job_number: int
+        :param job: задание из манифеста
+        :type job: dict
+        :param profiling_mode: режим профилирования этапов ('cprofile' или 'tracemalloc')
+        :type profiling_mode: str | None
+        :param run_job: функция обработки задания (по умолчанию - run_batch_job)
+        :type run_job: Callable[[dict], dict]
+    Returns:
+        запись результата для JSONL
+    """
+    result = {'job_number': job_number, 'job': job}
+    with collect_run_metrics(profiling_mode) as run_metrics:
+        try:
+            result.update(run_job(job))
+            result['status'] = 'ok'
+        except Exception as error:
+            result.update({'status': 'error', 'error_type': type(error).__name__, 'error': str(error),
+                           'traceback': traceback.format_exc()})
+    result['stages'] = run_metrics.to_records()
+    return result
+
+
+def send_batch_job_result(connection: Connection, job_number: int, job: dict, profiling_mode: str | None,
+                          json_log: bool, run_job: Callable[[dict], dict]):
+    """Точка входа процесса задания: обрабатывает задание и передает результат родительскому процессу."""
+    if json_log:
+        enable_json_logging()
+    connection.send(process_batch_job(job_number, job, profiling_mode, run_job))
+    connection.close()
+
+
+def get_failed_job_result(job_number: int, job: dict, error: Exception) -> dict:
+    """Запись результата задания, процесс которого не передал результат."""
+    return {'job_number': job_number, 'job': job, 'status': 'error', 'error_type': type(error).__name__,
+            'error': str(error)}
+
+
+def run_batch(jobs: list[dict], output_stream, max_workers: int = None,
+              timeout: float | None = DEFAULT_JOB_TIMEOUT, profiling_mode: str | None = None,
+              json_log: bool = False, run_job: Callable[[dict], dict] = run_batch_job) -> dict:
+    """Обрабатывает задания параллельно, каждое в своем процессе, и записывает результаты в JSONL по мере
+    готовности. Время обработки ограничивает родительский процесс: процесс задания, не уложившегося в время,
+    завершается (terminate), поэтому ограничение действует на любой платформе и во время разбора файлов
+    в коде на C. Аварийное завершение процесса (нехватка памяти, сигнал ОС) затрагивает только его задание.
+    Args:
+        :param jobs: задания из манифеста
+        :type jobs: list[dict]
+        :param output_stream: текстовый поток для записи результатов (по строке JSON на задание)
+        :param max_workers: количество одновременно работающих процессов (по умолчанию - количество процессоров)
+        :type max_workers: int
+        :param timeout: ограничение времени обработки одного задания в секундах (None или 0 - без ограничения)
+        :type timeout: float | None
+        :param profiling_mode: режим профилирования этапов ('cprofile' или 'tracemalloc')
+        :type profiling_mode: str | None
+        :param json_log: писать ли в stderr JSON записи замеров этапов обработки (см. enable_json_logging)
+        :type json_log: bool
+        :param run_job: функция обработки задания (по умолчанию - run_batch_job); должна быть доступна
+                        процессу задания по имени модуля (при запуске через spawn)
+        :type run_job: Callable[[dict], dict]
+    Returns:
+        количество успешно обработанных заданий и заданий с ошибками
+    """
+    summary = {'ok': 0, 'error': 0}
+
+    def write_result(result: dict):
+        summary[result['status']] += 1
+        output_stream.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+        output_stream.flush()
+
+    max_workers = max_workers or os.cpu_count() or 1
+    jobs_to_start = deque(enumerate(jobs))
+    # {соединение с процессом задания: (номер задания, процесс, время окончания срока или None)}
+    running_jobs = {}
+    while jobs_to_start or running_jobs:
+        while jobs_to_start and len(running_jobs) < max_workers:
+            job_number, job = jobs_to_start.popleft()
+            receiving_connection, sending_connection = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=send_batch_job_result, daemon=True,
+                                              args=(sending_connection, job_number, job, profiling_mode,
+                                                    json_log, run_job))
+            process.start()
+            # у родителя остается только читающий конец: если процесс завершится, не передав результат,
+            # чтение вернет EOFError
+            sending_connection.close()
+            running_jobs[receiving_connection] = (job_number, process,
+                                                  time.monotonic() + timeout if timeout else None)
+        deadlines = [deadline for _, _, deadline in running_jobs.values() if deadline is not None]
+        wait_timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+        for connection in wait(list(running_jobs), wait_timeout):
+            job_number, process, _ = running_jobs.pop(connection)
+            try:
+                result = connection.recv()
+            except EOFError:
+                process.join()
+                result = get_failed_job_result(job_number, jobs[job_number], BatchJobProcessFailed(
+                    f'Процесс обработки задания завершился аварийно (код завершения {process.exitcode})'))
+            connection.close()
+            process.join()
+            write_result(result)
+        now = time.monotonic()
+        for connection, (job_number, process, deadline) in list(running_jobs.items()):
+            if deadline is not None and deadline <= now:
+                del running_jobs[connection]
+                # процесс завершается, даже если он занят разбором файла в коде на C
+                process.terminate()
+                process.join()
+                connection.close()
+                write_result(get_failed_job_result(job_number, jobs[job_number],
+                                                   BatchJobTimeout('Превышено время обработки задания')))
+    return summary
+
+
+def main(arguments: list[str] = None) -> int:
+    """Точка входа командной строки пакетной обработки."""
+    parser = argparse.ArgumentParser(description='Пакетная обработка пар файлов аналитической модели и '
+                                                 'отчета эмитента без веб интерфейса.')
+    parser.add_argument('manifest', type=Path,
+                        help='манифест JSONL или CSV с полями ' + ', '.join(REQUIRED_JOB_FIELDS)
+                             + ' (необязательные: issuer_sheet, model_address_of_start, issuer_address_of_start, '
+                               'absolute_tolerance, relative_tolerance, detect_scale, multi_period, issuer, '
+                               'scored_config_lookup, top_k)')
+    parser.add_argument('-o', '--output', type=Path, help='файл для результатов JSONL (по умолчанию - stdout)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='количество одновременно работающих процессов')
+    parser.add_argument('-t', '--timeout', type=float, default=DEFAULT_JOB_TIMEOUT,
+                        help='ограничение времени обработки одного задания, секунды (0 - без ограничения)')
+    parser.add_argument('-p', '--profiling', choices=PROFILING_MODES, default=None,
+                        help='подробное профилирование этапов обработки (результаты - в поле stages)')
+    parser.add_argument('-m', '--mapping-store', type=Path, default=None,
+                        help='файл хранилища подтвержденных пар для заданий с полем issuer (по умолчанию - '
+                             f'{MAPPING_STORE_ENVIRONMENT_VARIABLE} или файл в папке запуска)')
+    parser.add_argument('-j', '--json-log', action='store_true',
+                        help='писать в stderr JSON записи замеров этапов обработки (по записи на строку)')
+    parsed_arguments = parser.parse_args(arguments)
+
+    if parsed_arguments.mapping_store:
+        # процессы заданий наследуют переменные окружения
+        os.environ[MAPPING_STORE_ENVIRONMENT_VARIABLE] = str(parsed_arguments.mapping_store.resolve())
+    jobs = read_manifest(parsed_arguments.manifest)
+    if parsed_arguments.output:
+        with open(parsed_arguments.output, 'w', encoding='UTF-8') as output_stream:
+            summary = run_batch(jobs, output_stream, parsed_arguments.workers, parsed_arguments.timeout,
+                                parsed_arguments.profiling, parsed_arguments.json_log)
+    else:
+        summary = run_batch(jobs, sys.stdout, parsed_arguments.workers, parsed_arguments.timeout,
+                            parsed_arguments.profiling, parsed_arguments.json_log)
+    print(f'Обработано заданий: {summary["ok"]}, с ошибками: {summary["error"]}', file=sys.stderr)
+    return 1 if summary['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
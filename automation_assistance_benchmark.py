@@ -0,0 +1,184 @@
+"""Module with a benchmark runner measuring time and peak memory of the main functions on synthetic data.
+
+Пример запуска:
+    python automation_assistance_benchmark.py --sizes small,medium
+    python automation_assistance_benchmark.py --sizes small,medium --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import itertools
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from contextlib import contextmanager
+
+from automation_assistance import (get_sheetnames_with_binary_stream,
+                                   tags_equations_creator,
+                                   add_similar_statement_tags_from_config,
+                                   specify_function_for_cell_address_searching)
+from automation_assistance_config import clear_config_cache
+from automation_assistance_disk_cache import disk_cache
+from automation_assistance_incremental import PreviousRuns, iter_incremental_equivalents
+from automation_assistance_sheet_discovery import rank_issuer_sheets
+from automation_assistance_synthetic_data import SIZES, generate_configs, generate_workbooks
+from automation_assistance_workbook_cache import workbook_cache
+
+PATH_TO_BASELINE = Path(__file__).parent.joinpath('benchmark_baseline.json')
+# Во сколько раз время может превысить базовое, прежде чем результат считается регрессией
+REGRESSION_THRESHOLD = 1.5
+
+
+@contextmanager
+def working_directory(path: Path):
+    """Временно меняет рабочую папку (конфиги ищутся в рабочей папке)."""
+    previous_working_directory = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous_working_directory)
+
+
+def clear_caches():
+    """Сбрасывает кэши разобранных файлов (в памяти и на диске) и конфигов, чтобы каждый запуск был «холодным»."""
+    workbook_cache.clear()
+    disk_cache.clear()
+    clear_config_cache()
+
+
+def measure(function, repeats: int) -> dict:
+    """Запускает функцию repeats раз и возвращает минимальное время в секундах, а затем еще раз - под tracemalloc
+    (он сильно замедляет выполнение, поэтому время с ним не измеряется) - пиковый объем памяти Python в байтах.
+    Кэши сбрасываются перед каждым запуском."""
+    times = []
+    for _ in range(repeats):
+        clear_caches()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    clear_caches()
+    tracemalloc.start()
+    try:
+        function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'peak_memory_bytes': peak_memory}
+
+
+def run_benchmarks(size_names: list[str], data_folder: Path, repeats: int = 3) -> dict:
+    """Генерирует данные каждого размера и измеряет основные функции.
+    Args:
+        :param size_names: названия размеров из SIZES
+        :type size_names: list[str]
+        :param data_folder: папка для синтетических файлов
+        :type data_folder: Path
+        :param repeats: количество запусков каждой функции
+        :type repeats: int
+    Returns:
+        {'размер/функция': {'seconds': ..., 'peak_memory_bytes': ...}}
+    """
+    results = {}
+    # у бенчмарка своя папка кэша на диске, чтобы не очищать общий кэш
+    disk_cache.directory = data_folder.joinpath('disk_cache')
+    for size_name in size_names:
+        size = SIZES[size_name]
+        size_folder = data_folder.joinpath(size_name)
+        path_to_model, path_to_issuer = generate_workbooks(size, size_folder)
+        generate_configs(size, size_folder)
+        model_binary_stream = BytesIO(path_to_model.read_bytes())
+        issuer_binary_stream = BytesIO(path_to_issuer.read_bytes())
+        model_address_of_start, issuer_address_of_start = specify_function_for_cell_address_searching(
+            model_binary_stream, issuer_binary_stream, 'Model', 'page-1-table-1')
+        list_of_equivalents = tags_equations_creator(model_binary_stream=model_binary_stream,
+                                                     issuer_binary_stream=issuer_binary_stream,
+                                                     selected_model_sheet='Model',
+                                                     selected_issuer_sheet='page-1-table-1',
+                                                     model_address_of_start=model_address_of_start,
+                                                     issuer_address_of_start=issuer_address_of_start)
+        # повторный запуск с другим источником данных (файлы не изменились): повторяется только поиск в конфиге
+        incremental_runs = PreviousRuns()
+        data_sources = itertools.cycle(('PDF', 'XLSX'))
+
+        def rerun_with_other_data_source():
+            return list(iter_incremental_equivalents(
+                size_name, statement_block='Баланс', data_source=next(data_sources), runs=incremental_runs,
+                model_binary_stream=model_binary_stream, issuer_binary_stream=issuer_binary_stream,
+                selected_model_sheet='Model', selected_issuer_sheet='page-1-table-1',
+                model_address_of_start=model_address_of_start, issuer_address_of_start=issuer_address_of_start))
+
+        benchmarks = {
+            'get_sheetnames_with_binary_stream': lambda: get_sheetnames_with_binary_stream(issuer_binary_stream),
+            'specify_function_for_cell_address_searching': lambda: specify_function_for_cell_address_searching(
+                model_binary_stream, issuer_binary_stream, 'Model', 'page-1-table-1'),
+            'rank_issuer_sheets': lambda: rank_issuer_sheets(model_binary_stream, issuer_binary_stream, 'Model'),
+            'tags_equations_creator': lambda: tags_equations_creator(
+                model_binary_stream=model_binary_stream, issuer_binary_stream=issuer_binary_stream,
+                selected_model_sheet='Model', selected_issuer_sheet='page-1-table-1',
+                model_address_of_start=model_address_of_start, issuer_address_of_start=issuer_address_of_start),
+            'add_similar_statement_tags_from_config': lambda: add_similar_statement_tags_from_config(
+                'Баланс', 'PDF', list_of_equivalents),
+            'add_similar_statement_tags_from_config_scored': lambda: add_similar_statement_tags_from_config(
+                'Баланс', 'PDF', list_of_equivalents, scored=True),
+            'iter_incremental_equivalents_config_only': rerun_with_other_data_source,
+        }
+        with working_directory(size_folder):
+            # первый (полный) запуск, с которым сравниваются повторные
+            rerun_with_other_data_source()
+            for function_name, function in benchmarks.items():
+                results[f'{size_name}/{function_name}'] = measure(function, repeats)
+    return results
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Печатает таблицу результатов с отношением к базовым значениям и возвращает список регрессий."""
+    regressions = []
+    print(f'{"benchmark":<60} {"seconds":>10} {"peak MiB":>10} {"x time":>8} {"x memory":>9}')
+    for benchmark_name, result in results.items():
+        base_result = baseline.get(benchmark_name)
+        time_ratio = memory_ratio = ''
+        if base_result:
+            time_ratio = result['seconds'] / max(base_result['seconds'], 1e-9)
+            memory_ratio = result['peak_memory_bytes'] / max(base_result['peak_memory_bytes'], 1)
+            if time_ratio > threshold or memory_ratio > threshold:
+                regressions.append(benchmark_name)
+            time_ratio, memory_ratio = f'{time_ratio:.2f}', f'{memory_ratio:.2f}'
+        print(f'{benchmark_name:<60} {result["seconds"]:>10.4f} {result["peak_memory_bytes"] / 2**20:>10.2f} '
+              f'{time_ratio:>8} {memory_ratio:>9}')
+    return regressions
+
+
+def main(arguments: list[str] = None) -> int:
+    """Точка входа командной строки бенчмарка."""
+    parser = argparse.ArgumentParser(description='Бенчмарк основных функций на синтетических данных.')
+    parser.add_argument('--sizes', default='small,medium',
+                        help=f'размеры данных через запятую (доступные: {", ".join(SIZES)})')
+    parser.add_argument('--repeats', type=int, default=3, help='количество запусков каждой функции')
+    parser.add_argument('--baseline', type=Path, default=PATH_TO_BASELINE, help='файл с базовыми результатами')
+    parser.add_argument('--save-baseline', action='store_true', help='сохранить результаты как базовые')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='допустимое отношение к базовым результатам')
+    parsed_arguments = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory() as data_folder:
+        results = run_benchmarks(parsed_arguments.sizes.split(','), Path(data_folder), parsed_arguments.repeats)
+    baseline = {}
+    if parsed_arguments.baseline.exists():
+        baseline = json.loads(parsed_arguments.baseline.read_text(encoding='UTF-8'))
+    regressions = compare_with_baseline(results, baseline, parsed_arguments.threshold)
+    if parsed_arguments.save_baseline:
+        parsed_arguments.baseline.write_text(json.dumps({**baseline, **results}, indent=2), encoding='UTF-8')
+        return 0
+    if regressions:
+        print(f'Регрессии: {", ".join(regressions)}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
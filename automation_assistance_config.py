@@ -0,0 +1,262 @@
+"""Module for reading statement-tag configs once and searching them with a reverse n-gram index."""
+
+import os
+import re
+import threading
+import configparser
+from pathlib import Path
+
+import numpy as np
+
+# Длина n-граммы индекса. Запросы не длиннее неё проверяются перебором всех вариантов раздела
+N_GRAM_LENGTH = 3
+# Количество названий статей из конфига с наибольшей схожестью при ранжированном поиске
+DEFAULT_TOP_K = 5
+# Минимальная схожесть (коэффициент Дайса по триграммам нормализованных названий) при ранжированном поиске
+DEFAULT_MIN_SCORE = 0.5
+# Служебные слова и уточнения, которые не меняют смысл названия статьи («нетто», «брутто» и т.п.)
+STOP_WORDS = frozenset({'а', 'в', 'во', 'для', 'за', 'и', 'из', 'их', 'к', 'ко', 'на', 'о', 'об', 'от', 'по',
+                        'с', 'со', 'у', 'нетто', 'брутто', 'net', 'gross'})
+# Признаки итоговой строки: «Итого выручка» - не то же, что «Выручка», поэтому признак остается в нормализованном
+# названии - одним словом TOTAL_TOKEN в конце (независимо от слова и его места в названии)
+TOTAL_MARKERS = frozenset({'итого', 'всего', 'total'})
+TOTAL_TOKEN = 'итог'
+# Окончания русских слов, которые отбрасываются при нормализации (сначала ищутся самые длинные)
+RUSSIAN_ENDINGS = tuple(sorted({'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ией', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя',
+                                'ое', 'ее', 'ие', 'ые', 'ых', 'их', 'ым', 'им', 'ыми', 'ими', 'ом', 'ем', 'ого',
+                                'его', 'ому', 'ему', 'ую', 'юю', 'ов', 'ев', 'ам', 'ям', 'ия', 'ья', 'ье', 'ьи',
+                                'ию', 'ью', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'},
+                               key=len, reverse=True))
+# Минимальная длина основы слова после отбрасывания окончания
+MIN_STEM_LENGTH = 3
+TOKEN_PATTERN = re.compile(r'[a-zа-я0-9]+')
+
+
+def split_into_n_grams(text: str, length: int) -> set[str]:
+    """Возвращает множество всех подстрок заданной длины в строке."""
+    return {text[index:index + length] for index in range(len(text) - length + 1)}
+
+
+def stem_russian_word(word: str) -> str:
+    """Упрощенный стемминг: отбрасывает самое длинное окончание из RUSSIAN_ENDINGS,
+    если основа остается не короче MIN_STEM_LENGTH."""
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def normalize_tag(tag: str) -> str:
+    """Приводит название статьи к виду для нечеткого сравнения: нижний регистр, ё -> е, без знаков препинания,
+    без служебных слов и уточнений (STOP_WORDS), слова заменены основами, признак итоговой строки (TOTAL_MARKERS)
+    заменен словом TOTAL_TOKEN в конце.
+    Например, «Денежные средства и их эквиваленты» и «Денежные средства и эквиваленты» дают одну строку,
+    «Итого выручка» и «Выручка всего» - одну строку, отличную от «Выручка»."""
+    tokens = TOKEN_PATTERN.findall(tag.lower().replace('ё', 'е'))
+    words = [token for token in tokens if token not in STOP_WORDS and token not in TOTAL_MARKERS]
+    if any(token in TOTAL_MARKERS for token in tokens):
+        return ' '.join([stem_russian_word(word) for word in words] + [TOTAL_TOKEN])
+    # название только из служебных слов сравнивается целиком
+    return ' '.join(stem_russian_word(word) for word in words or tokens)
+
+
+def get_trigrams_of_normalized_tag(normalized_tag: str) -> set[str]:
+    """Триграммы нормализованного названия; пробелы по краям дают отдельные триграммы началу и концу названия."""
+    return split_into_n_grams(f' {normalized_tag} ', 3)
+
+
+class TrigramIndex:
+    """Обратный индекс триграмм нормализованных вариантов названий для ранжированного нечеткого поиска.
+
+    Схожесть запроса с каждым вариантом - коэффициент Дайса по множествам триграмм. Количество общих триграмм
+    считается одним np.bincount по спискам вариантов для триграмм запроса, поэтому время поиска зависит от длины
+    этих списков, а не от попарного сравнения строк со всеми вариантами.
+    """
+
+    def __init__(self, variants: list[str]):
+        """
+        Args:
+            :param variants: варианты названий статей
+            :type variants: list[str]
+        """
+        postings = {}
+        numbers_of_trigrams = []
+        for variant_number, variant in enumerate(variants):
+            trigrams = get_trigrams_of_normalized_tag(normalize_tag(variant))
+            numbers_of_trigrams.append(len(trigrams))
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(variant_number)
+        self.number_of_variants = len(variants)
+        # {триграмма: номера вариантов, в которых она встречается}
+        self.postings = {trigram: np.array(variant_numbers, dtype=np.int32)
+                         for trigram, variant_numbers in postings.items()}
+        self.numbers_of_trigrams = np.array(numbers_of_trigrams, dtype=np.int32)
+
+    def score_variants(self, tag: str) -> tuple[np.ndarray, np.ndarray]:
+        """Возвращает номера вариантов, имеющих общие триграммы с названием статьи, и их схожесть (от 0 до 1)."""
+        query_trigrams = get_trigrams_of_normalized_tag(normalize_tag(tag))
+        postings = [self.postings[trigram] for trigram in query_trigrams if trigram in self.postings]
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        overlaps = np.bincount(np.concatenate(postings), minlength=self.number_of_variants)
+        variant_numbers = np.flatnonzero(overlaps)
+        scores = 2 * overlaps[variant_numbers] / (len(query_trigrams) + self.numbers_of_trigrams[variant_numbers])
+        return variant_numbers, scores
+
+
+class ConfigSectionIndex:
+    """Обратный индекс одного раздела конфига (XBRL template, XLSX statements, PDF statements).
+
+    Каждая строка из правой части конфига (вариант названия статьи эмитента) приводится к нижнему регистру
+    и раскладывается на n-граммы длины N_GRAM_LENGTH, списки вариантов по n-граммам хранятся массивами int32.
+    Поиск подстроки сводится к пересечению списков вариантов по n-граммам запроса и проверке только оставшихся
+    кандидатов, без обхода всего раздела. Короткие запросы (не длиннее n-граммы) проверяются перебором вариантов.
+    """
+
+    def __init__(self, section_items):
+        """
+        Args:
+            :param section_items: пары (название статьи для модели, варианты названий через перевод строки)
+            :type section_items: Iterable[tuple[str, str]]
+        """
+        # названия статей из левой части конфига в порядке следования в файле
+        self.model_tags = []
+        # варианты названий в нижнем регистре и номер статьи (из model_tags), к которой они относятся
+        self.variants = []
+        self.variant_model_tag_numbers = []
+        # индекс для ранжированного поиска строится при первом обращении (см. get_trigram_index)
+        self._trigram_index = None
+        n_gram_postings = {}
+        for config_model_tag, config_issuer_tags in section_items:
+            model_tag_number = len(self.model_tags)
+            self.model_tags.append(config_model_tag)
+            for value in config_issuer_tags.split('\n'):
+                self._add_variant(value.lower(), model_tag_number, n_gram_postings)
+        # {n-грамма: возрастающие номера вариантов, в которых она встречается}
+        self.n_gram_postings = {n_gram: np.array(variant_numbers, dtype=np.int32)
+                                for n_gram, variant_numbers in n_gram_postings.items()}
+
+    def _add_variant(self, variant: str, model_tag_number: int, n_gram_postings: dict):
+        variant_number = len(self.variants)
+        self.variants.append(variant)
+        self.variant_model_tag_numbers.append(model_tag_number)
+        for n_gram in split_into_n_grams(variant, N_GRAM_LENGTH):
+            n_gram_postings.setdefault(n_gram, []).append(variant_number)
+
+    def find_variant_numbers(self, tag: str) -> set[int]:
+        """Возвращает номера вариантов, в которые входит переданное название статьи (в нижнем регистре)."""
+        if not tag:
+            # пустая строка входит в любую строку
+            return set(range(len(self.variants)))
+        if len(tag) <= N_GRAM_LENGTH:
+            # короткие запросы не раскладываются на n-граммы индекса - перебираем все варианты
+            return {variant_number for variant_number, variant in enumerate(self.variants) if tag in variant}
+        # начинаем пересечение с самых редких n-грамм, чтобы список кандидатов сразу был маленьким
+        empty_posting = np.empty(0, dtype=np.int32)
+        postings = sorted((self.n_gram_postings.get(n_gram, empty_posting)
+                           for n_gram in split_into_n_grams(tag, N_GRAM_LENGTH)), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if not candidates.size:
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return {variant_number for variant_number in candidates.tolist() if tag in self.variants[variant_number]}
+
+    def find_model_tags(self, tag_from_filling: str) -> list[str]:
+        """Возвращает названия статей из левой части конфига (в порядке следования в файле), в вариантах которых
+        встретилось переданное название статьи из отчета эмитента. Сравнение без учета регистра."""
+        model_tag_numbers = {self.variant_model_tag_numbers[variant_number]
+                             for variant_number in self.find_variant_numbers(tag_from_filling.lower())}
+        return [self.model_tags[model_tag_number] for model_tag_number in sorted(model_tag_numbers)]
+
+    def get_trigram_index(self) -> TrigramIndex:
+        """Индекс триграмм нормализованных вариантов (строится один раз; повторное построение из параллельного
+        потока безопасно - индекс присваивается целиком)."""
+        if self._trigram_index is None:
+            self._trigram_index = TrigramIndex(self.variants)
+        return self._trigram_index
+
+    def find_scored_model_tags(self, tag_from_filling: str, top_k: int = DEFAULT_TOP_K,
+                               min_score: float = DEFAULT_MIN_SCORE) -> list[tuple[str, float]]:
+        """Ранжированный нечеткий поиск: названия статей из левой части конфига, варианты которых больше всего
+        похожи на переданное название статьи из отчета эмитента (после нормализации, см. normalize_tag).
+        Args:
+            :param tag_from_filling: название статьи из отчета эмитента
+            :type tag_from_filling: str
+            :param top_k: максимальное количество названий статей
+            :type top_k: int
+            :param min_score: минимальная схожесть
+            :type min_score: float
+        Returns:
+            список пар (название статьи из конфига, схожесть) по убыванию схожести
+            (схожесть статьи - наибольшая схожесть ее вариантов)
+        """
+        if top_k < 1:
+            raise ValueError(f'Количество названий статей top_k должно быть не меньше 1, передано: {top_k}')
+        variant_numbers, scores = self.get_trigram_index().score_variants(tag_from_filling)
+        selected = scores >= min_score
+        variant_numbers, scores = variant_numbers[selected], scores[selected]
+        scored_model_tags = []
+        used_model_tag_numbers = set()
+        # при равной схожести - в порядке следования в файле
+        for position in np.argsort(-scores, kind='stable').tolist():
+            model_tag_number = self.variant_model_tag_numbers[variant_numbers[position]]
+            if model_tag_number in used_model_tag_numbers:
+                continue
+            used_model_tag_numbers.add(model_tag_number)
+            scored_model_tags.append((self.model_tags[model_tag_number], round(float(scores[position]), 4)))
+            if len(scored_model_tags) == top_k:
+                break
+        return scored_model_tags
+
+
+class _ParsedConfig:
+    """Разобранный файл конфига и лениво построенные индексы его разделов."""
+
+    def __init__(self, path_to_config: Path, modification_time: int):
+        self.modification_time = modification_time
+        self.config = configparser.ConfigParser()
+        self.config.read(path_to_config, encoding='UTF-8')
+        self.section_indexes = {}
+
+    def get_section_index(self, section: str) -> ConfigSectionIndex:
+        if section not in self.section_indexes:
+            self.section_indexes[section] = ConfigSectionIndex(self.config[section].items())
+        return self.section_indexes[section]
+
+
+_parsed_configs = {}
+# Блокировки отдельных файлов конфигов: разбор одного конфига и построение индексов его разделов
+# не задерживают поиск в других конфигах
+_config_locks = {}
+_parsed_configs_lock = threading.Lock()
+
+
+def get_config_section_index(path_to_config: [str | Path], section: str) -> ConfigSectionIndex:
+    """Отдает индекс раздела конфига. Файл разбирается один раз и перечитывается только при изменении
+    времени его модификации (mtime).
+    Args:
+        :param path_to_config: путь до файла конфига
+        :type path_to_config: str | Path
+        :param section: название раздела конфига (XBRL template, XLSX statements, PDF statements)
+        :type section: str
+    Returns:
+        индекс раздела конфига
+    """
+    path_to_config = Path(path_to_config).resolve()
+    modification_time = os.stat(path_to_config).st_mtime_ns
+    with _parsed_configs_lock:
+        config_lock = _config_locks.setdefault(path_to_config, threading.Lock())
+    with config_lock:
+        parsed_config = _parsed_configs.get(path_to_config)
+        if parsed_config is None or parsed_config.modification_time != modification_time:
+            parsed_config = _ParsedConfig(path_to_config, modification_time)
+            with _parsed_configs_lock:
+                _parsed_configs[path_to_config] = parsed_config
+        return parsed_config.get_section_index(section)
+
+
+def clear_config_cache():
+    """Сбрасывает все разобранные конфиги и их индексы."""
+    with _parsed_configs_lock:
+        _parsed_configs.clear()
@@ -0,0 +1,399 @@
+"""Module defining a columnar NumPy form of a worksheet and a persistent content-addressed on-disk cache for it.
+
+Страница разбирается openpyxl один раз, затем ее значения хранятся на диске в файлах .npy (ключ - SHA-256
+содержимого файла, название страницы и режим загрузки) и загружаются через memory-map без копирования.
+Кэш общий для всех пользователей (процессов) на сервере, его объем ограничен, давно не использованные
+страницы вытесняются. На диск записываются только страницы, для которых это явно запрошено (отчеты эмитентов -
+публичные документы, которые загружают многие аналитики); модели аналитиков хранятся только в памяти процесса.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO
+from datetime import date, datetime, time, timedelta
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from automation_assistance_streaming import ExtractedColumns, read_rows_of_sheets
+from automation_assistance_workbook_cache import get_hash_of_binary_stream, workbook_cache
+
+# Папка кэша (по умолчанию - во временной папке системы) и ограничение его объема
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = 'AUTOMATION_ASSISTANCE_CACHE_DIR'
+DEFAULT_CACHE_DIRECTORY = Path(tempfile.gettempdir()).joinpath('automation_assistance_cache')
+MAX_DISK_CACHE_SIZE_IN_BYTES = 2 * 1024 * 1024 * 1024
+# Версия формата файлов кэша: при изменении формата старые записи не читаются
+COLUMNAR_SHEET_FORMAT_VERSION = 2
+# Массивы ColumnarSheet, которые хранятся в отдельных файлах .npy
+COLUMNAR_SHEET_ARRAYS = ('kinds', 'numbers', 'string_rows', 'string_columns', 'string_offsets', 'string_data')
+METADATA_FILE_NAME = 'metadata.json'
+# Оценочный объем памяти на один цвет заливки в списке (ссылка на общий объект)
+ESTIMATED_FILL_COLOR_SIZE_IN_BYTES = 8
+
+# Типы значений ячеек в матрице kinds
+EMPTY_KIND = 0
+INTEGER_KIND = 1
+FLOAT_KIND = 2
+BOOLEAN_KIND = 3
+STRING_KIND = 4
+DATETIME_KIND = 5
+# Прочие значения (например, формулы массива в режиме формул) хранятся строкой
+OTHER_KIND = 6
+DATE_KIND = 7
+TIME_KIND = 8
+# Длительность (формат ячейки [h]:mm:ss) хранится числом секунд
+TIMEDELTA_KIND = 9
+NUMERIC_KINDS = (INTEGER_KIND, FLOAT_KIND, BOOLEAN_KIND)
+# Типы, значения которых хранятся в строковом буфере (даты и время - в формате ISO 8601)
+TEXT_KINDS = (STRING_KIND, DATETIME_KIND, OTHER_KIND, DATE_KIND, TIME_KIND)
+
+
+@dataclass
+class ColumnarSheet:
+    """Значения страницы XLSX файла в виде массивов NumPy (ряд 1 и столбец 1 страницы - индекс 0 матриц).
+
+    Числовые значения хранятся в матрице numbers (целые - без потери точности до 2**53), строковые - в одном
+    буфере UTF-8 с границами строк (как в Arrow), с координатами ячеек, упорядоченными по рядам.
+    """
+
+    # Название страницы
+    title: str
+    # Тип значения каждой ячейки (EMPTY_KIND, INTEGER_KIND, ...)
+    kinds: np.ndarray
+    # Числовые значения ячеек, для остальных ячеек - NaN
+    numbers: np.ndarray
+    # Номера рядов и столбцов (с нуля) ячеек со строковыми значениями
+    string_rows: np.ndarray
+    string_columns: np.ndarray
+    # Границы строк в буфере: строка i - string_data[string_offsets[i]:string_offsets[i + 1]]
+    string_offsets: np.ndarray
+    # Строки в кодировке UTF-8 подряд
+    string_data: np.ndarray
+    # {номер столбца: список цветов заливки (fgColor.index) по рядам начиная с первого} для столбцов, заливка
+    # которых нужна (например, столбца с названиями статей модели); хранятся только в памяти, не на диске
+    fill_colors: dict = field(default_factory=dict)
+
+    @property
+    def max_row(self) -> int:
+        return self.kinds.shape[0]
+
+    @property
+    def max_column(self) -> int:
+        return self.kinds.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        number_of_fill_colors = sum(len(fill_colors) for fill_colors in self.fill_colors.values())
+        return (sum(getattr(self, array_name).nbytes for array_name in COLUMNAR_SHEET_ARRAYS)
+                + number_of_fill_colors * ESTIMATED_FILL_COLOR_SIZE_IN_BYTES)
+
+    def get_string(self, string_number: int) -> str:
+        """Декодирует строку из буфера по ее номеру."""
+        start, end = self.string_offsets[string_number], self.string_offsets[string_number + 1]
+        return bytes(self.string_data[start:end]).decode('UTF-8', 'surrogatepass')
+
+    def get_strings_of_column(self, column_number: int) -> dict:
+        """Возвращает строковые значения столбца страницы: {номер ряда: строка}."""
+        string_numbers = np.flatnonzero(self.string_columns == column_number - 1)
+        return {int(self.string_rows[string_number]) + 1: self.get_string(string_number)
+                for string_number in string_numbers}
+
+    def get_column_values(self, column_number: int, min_row: int = 1) -> list:
+        """Восстанавливает значения ячеек столбца (начиная с ряда min_row) в том виде, в каком их отдает openpyxl:
+        int, float, bool, str, datetime, date, time, timedelta или None для пустых ячеек."""
+        if not 1 <= column_number <= self.max_column or min_row > self.max_row:
+            return [None] * max(self.max_row - min_row + 1, 0)
+        kinds = self.kinds[min_row - 1:, column_number - 1].tolist()
+        numbers = self.numbers[min_row - 1:, column_number - 1].tolist()
+        strings = self.get_strings_of_column(column_number) if any(kind in TEXT_KINDS for kind in kinds) else {}
+        values = []
+        for row_number, (kind, number) in enumerate(zip(kinds, numbers), start=min_row):
+            if kind == EMPTY_KIND:
+                values.append(None)
+            elif kind == INTEGER_KIND:
+                values.append(int(number))
+            elif kind == FLOAT_KIND:
+                values.append(number)
+            elif kind == BOOLEAN_KIND:
+                values.append(bool(number))
+            elif kind == DATETIME_KIND:
+                values.append(datetime.fromisoformat(strings[row_number]))
+            elif kind == DATE_KIND:
+                values.append(date.fromisoformat(strings[row_number]))
+            elif kind == TIME_KIND:
+                values.append(time.fromisoformat(strings[row_number]))
+            elif kind == TIMEDELTA_KIND:
+                values.append(timedelta(seconds=number))
+            else:
+                values.append(strings[row_number])
+        return values
+
+    def extract_columns(self, column_indexes: [list[int]|tuple[int]], *, min_row: int = 1) -> ExtractedColumns:
+        """Извлекает значения нужных столбцов начиная с ряда min_row (и цвета заливки тех из них, для которых
+        они сохранены), не разбирая XLSX файл повторно."""
+        column_indexes = list(dict.fromkeys(column_indexes))
+        return ExtractedColumns(rows=list(range(min_row, self.max_row + 1)),
+                                values={column_index: self.get_column_values(column_index, min_row)
+                                        for column_index in column_indexes},
+                                fill_colors={column_index: self.fill_colors[column_index][min_row - 1:]
+                                             for column_index in column_indexes if column_index in self.fill_colors})
+
+
+def create_columnar_sheet(xlsx_binary_stream: BinaryIO, sheet_name: str, data_only: bool = False) -> ColumnarSheet:
+    """Создает колоночное представление страницы за один потоковый проход по ней (openpyxl read_only).
+    Args:
+        :param xlsx_binary_stream: бинарный поток XLSX файла
+        :type xlsx_binary_stream: BinaryIO
+        :param sheet_name: название страницы
+        :type sheet_name: str
+        :param data_only: режим загрузки openpyxl (True - значения вместо формул)
+        :type data_only: bool
+    Returns:
+        колоночное представление страницы
+    """
+    rows, _ = read_rows_of_sheets(xlsx_binary_stream, [sheet_name], data_only=data_only)[sheet_name]
+    return create_columnar_sheet_from_rows(sheet_name, rows)
+
+
+def create_columnar_sheet_from_rows(sheet_name: str, rows: list, fill_colors: dict = None) -> ColumnarSheet:
+    """Создает колоночное представление страницы из значений ее рядов и цветов заливки столбцов
+    (см. read_rows_of_sheets)."""
+    number_of_rows = len(rows)
+    number_of_columns = max((len(row) for row in rows), default=0)
+    kinds = np.zeros((number_of_rows, number_of_columns), dtype=np.int8)
+    numbers = np.full((number_of_rows, number_of_columns), np.nan)
+    string_rows, string_columns, encoded_strings = [], [], []
+    for row_index, row in enumerate(rows):
+        for column_index, value in enumerate(row):
+            if value is None:
+                continue
+            # bool проверяется раньше int, т.к. является его подклассом
+            if isinstance(value, bool):
+                kinds[row_index, column_index] = BOOLEAN_KIND
+                numbers[row_index, column_index] = value
+                continue
+            if isinstance(value, int):
+                kinds[row_index, column_index] = INTEGER_KIND
+                numbers[row_index, column_index] = value
+                continue
+            if isinstance(value, float):
+                kinds[row_index, column_index] = FLOAT_KIND
+                numbers[row_index, column_index] = value
+                continue
+            if isinstance(value, timedelta):
+                kinds[row_index, column_index] = TIMEDELTA_KIND
+                numbers[row_index, column_index] = value.total_seconds()
+                continue
+            if isinstance(value, str):
+                kinds[row_index, column_index] = STRING_KIND
+            # datetime проверяется раньше date, т.к. является его подклассом
+            elif isinstance(value, datetime):
+                kinds[row_index, column_index] = DATETIME_KIND
+                value = value.isoformat()
+            elif isinstance(value, date):
+                kinds[row_index, column_index] = DATE_KIND
+                value = value.isoformat()
+            elif isinstance(value, time):
+                kinds[row_index, column_index] = TIME_KIND
+                value = value.isoformat()
+            else:
+                kinds[row_index, column_index] = OTHER_KIND
+                value = str(value)
+            string_rows.append(row_index)
+            string_columns.append(column_index)
+            encoded_strings.append(value.encode('UTF-8', 'surrogatepass'))
+    string_offsets = np.zeros(len(encoded_strings) + 1, dtype=np.int64)
+    np.cumsum([len(encoded_string) for encoded_string in encoded_strings], out=string_offsets[1:])
+    return ColumnarSheet(title=sheet_name, kinds=kinds, numbers=numbers,
+                         string_rows=np.array(string_rows, dtype=np.int32),
+                         string_columns=np.array(string_columns, dtype=np.int32),
+                         string_offsets=string_offsets,
+                         string_data=np.frombuffer(b''.join(encoded_strings), dtype=np.uint8),
+                         fill_colors=fill_colors or {})
+
+
+def load_array(path_to_array: Path) -> np.ndarray:
+    """Загружает массив .npy через memory-map (только для чтения); пустые массивы memory-map не поддерживает,
+    поэтому они читаются обычным образом."""
+    try:
+        return np.load(path_to_array, mmap_mode='r', allow_pickle=False)
+    except ValueError:
+        return np.load(path_to_array, allow_pickle=False)
+
+
+class DiskCache:
+    """Постоянный кэш колоночных представлений страниц на диске с ограничением объема и вытеснением LRU.
+
+    Запись - папка <SHA-256 файла>/<SHA-256 названия страницы и режима загрузки> с файлами .npy и metadata.json.
+    Время последнего использования - время изменения metadata.json (обновляется при каждом чтении).
+    Запись создается во временной папке и переименовывается целиком, поэтому несколько процессов
+    могут пользоваться кэшем одновременно.
+    """
+
+    def __init__(self, directory: Path, max_size_in_bytes: int = MAX_DISK_CACHE_SIZE_IN_BYTES):
+        self.directory = Path(directory)
+        self.max_size_in_bytes = max_size_in_bytes
+        self._lock = threading.Lock()
+
+    def get_entry_path(self, file_hash: str, sheet_name: str, data_only: bool) -> Path:
+        sheet_key = hashlib.sha256(f'{sheet_name}\0{data_only}'.encode('UTF-8', 'surrogatepass')).hexdigest()
+        return self.directory.joinpath(file_hash, sheet_key)
+
+    def load(self, file_hash: str, sheet_name: str, data_only: bool) -> ColumnarSheet | None:
+        """Загружает колоночное представление страницы из кэша (массивы - через memory-map, без копирования).
+        Returns:
+            колоночное представление или None, если записи нет (или она повреждена)
+        """
+        entry_path = self.get_entry_path(file_hash, sheet_name, data_only)
+        metadata_path = entry_path.joinpath(METADATA_FILE_NAME)
+        try:
+            metadata = json.loads(metadata_path.read_text(encoding='UTF-8'))
+            if metadata.get('format_version') != COLUMNAR_SHEET_FORMAT_VERSION:
+                return None
+            arrays = {array_name: load_array(entry_path.joinpath(f'{array_name}.npy'))
+                      for array_name in COLUMNAR_SHEET_ARRAYS}
+            # отмечаем использование записи для вытеснения LRU
+            os.utime(metadata_path)
+        except (OSError, ValueError):
+            return None
+        return ColumnarSheet(title=metadata['title'], **arrays)
+
+    def save(self, file_hash: str, sheet_name: str, data_only: bool, columnar_sheet: ColumnarSheet):
+        """Сохраняет колоночное представление страницы в кэш и вытесняет давно не использованные записи,
+        если объем кэша превышает ограничение."""
+        entry_path = self.get_entry_path(file_hash, sheet_name, data_only)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = Path(tempfile.mkdtemp(prefix='.incomplete-', dir=entry_path.parent))
+        try:
+            for array_name in COLUMNAR_SHEET_ARRAYS:
+                np.save(temporary_path.joinpath(f'{array_name}.npy'), getattr(columnar_sheet, array_name),
+                        allow_pickle=False)
+            temporary_path.joinpath(METADATA_FILE_NAME).write_text(
+                json.dumps({'format_version': COLUMNAR_SHEET_FORMAT_VERSION, 'title': columnar_sheet.title,
+                            'sheet_name': sheet_name, 'data_only': data_only}, ensure_ascii=False),
+                encoding='UTF-8')
+            os.replace(temporary_path, entry_path)
+        except OSError:
+            # запись уже создана другим процессом (или диск недоступен) - кэш не обязателен для работы
+            shutil.rmtree(temporary_path, ignore_errors=True)
+        self.evict()
+
+    def get_entries(self) -> list[tuple[float, int, Path]]:
+        """Возвращает записи кэша: (время последнего использования, объем в байтах, путь)."""
+        entries = []
+        for metadata_path in self.directory.glob(f'*/*/{METADATA_FILE_NAME}'):
+            entry_path = metadata_path.parent
+            if entry_path.name.startswith('.'):
+                # недописанная или удаляемая запись
+                continue
+            try:
+                entries.append((metadata_path.stat().st_mtime,
+                                sum(file_path.stat().st_size for file_path in entry_path.iterdir()),
+                                entry_path))
+            except OSError:
+                # запись удалена другим процессом
+                continue
+        return entries
+
+    def evict(self):
+        """Удаляет давно не использованные записи, пока объем кэша превышает ограничение."""
+        with self._lock:
+            # остатки записей, которые не удалось удалить целиком при прошлом вытеснении
+            for evicted_path in self.directory.glob('*/.evicted-*'):
+                shutil.rmtree(evicted_path, ignore_errors=True)
+            entries = sorted(self.get_entries())
+            current_size_in_bytes = sum(size_in_bytes for _, size_in_bytes, _ in entries)
+            for _, size_in_bytes, entry_path in entries:
+                if current_size_in_bytes <= self.max_size_in_bytes:
+                    break
+                # запись сначала переносится во временную папку: на Windows это не удается, пока ее файлы
+                # отображены в память (тогда запись остается целой и по-прежнему учитывается в объеме кэша),
+                # а частично удаленная запись не остается в кэше
+                evicted_path = None
+                try:
+                    evicted_path = Path(tempfile.mkdtemp(prefix='.evicted-', dir=entry_path.parent))
+                    os.replace(entry_path, evicted_path.joinpath(entry_path.name))
+                except OSError:
+                    if evicted_path is not None:
+                        shutil.rmtree(evicted_path, ignore_errors=True)
+                    continue
+                shutil.rmtree(evicted_path, ignore_errors=True)
+                current_size_in_bytes -= size_in_bytes
+                try:
+                    # папка файла больше не нужна, если в ней не осталось страниц
+                    entry_path.parent.rmdir()
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Удаляет все записи кэша."""
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+disk_cache = DiskCache(Path(os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_DIRECTORY)))
+
+
+def load_columnar_sheet_with_cache(xlsx_binary_stream: BinaryIO, sheet_name: str, data_only: bool = False,
+                                   fill_column_indexes: [list[int]|tuple[int]] = (),
+                                   use_disk_cache: bool = False) -> ColumnarSheet:
+    """Отдает колоночное представление страницы: из кэша в памяти, из кэша на диске или разбирая файл
+    (результат сохраняется в кэши). Параметры - как у load_columnar_sheets_with_cache."""
+    return load_columnar_sheets_with_cache(xlsx_binary_stream, [sheet_name], data_only, fill_column_indexes,
+                                           use_disk_cache)[sheet_name]
+
+
+def load_columnar_sheets_with_cache(xlsx_binary_stream: BinaryIO, sheet_names: list[str], data_only: bool = False,
+                                    fill_column_indexes: [list[int]|tuple[int]] = (),
+                                    use_disk_cache: bool = False) -> dict[str, ColumnarSheet]:
+    """Отдает колоночные представления нескольких страниц: страницы, которых нет в кэшах, разбираются за один
+    проход по файлу (результат сохраняется в кэши).
+    Args:
+        :param xlsx_binary_stream: бинарный поток XLSX файла
+        :type xlsx_binary_stream: BinaryIO
+        :param sheet_names: названия страниц
+        :type sheet_names: list[str]
+        :param data_only: режим загрузки openpyxl (True - значения вместо формул)
+        :type data_only: bool
+        :param fill_column_indexes: номера столбцов, для которых нужны и цвета заливки ячеек
+                                    (см. ColumnarSheet.fill_colors); страница, сохраненная без них, разбирается
+                                    заново, поэтому все обращения к странице модели передают столбец с названиями
+                                    статей
+        :type fill_column_indexes: list[int] | tuple[int]
+        :param use_disk_cache: использовать общий для всех пользователей кэш на диске; только для файлов
+                               отчетов эмитентов - модели аналитиков на диск не записываются
+        :type use_disk_cache: bool
+    Returns:
+        словарь {название страницы: колоночное представление} в порядке sheet_names
+    """
+    file_hash = get_hash_of_binary_stream(xlsx_binary_stream)
+    columnar_sheets, sheet_names_to_read = {}, []
+    for sheet_name in dict.fromkeys(sheet_names):
+        kind = ('columnar', sheet_name, data_only)
+        columnar_sheet = workbook_cache.get(xlsx_binary_stream, kind)
+        if columnar_sheet is None and use_disk_cache and not fill_column_indexes:
+            # цвета заливки на диске не хранятся
+            columnar_sheet = disk_cache.load(file_hash, sheet_name, data_only)
+            if columnar_sheet is not None:
+                columnar_sheet = workbook_cache.put(xlsx_binary_stream, kind, columnar_sheet, columnar_sheet.nbytes)
+        if columnar_sheet is not None and set(fill_column_indexes) <= columnar_sheet.fill_colors.keys():
+            columnar_sheets[sheet_name] = columnar_sheet
+        else:
+            sheet_names_to_read.append(sheet_name)
+    if sheet_names_to_read:
+        rows_of_sheets = read_rows_of_sheets(xlsx_binary_stream, sheet_names_to_read, data_only=data_only,
+                                             fill_column_indexes=fill_column_indexes)
+        for sheet_name, (rows, fill_colors) in rows_of_sheets.items():
+            columnar_sheet = create_columnar_sheet_from_rows(sheet_name, rows, fill_colors)
+            if use_disk_cache:
+                disk_cache.save(file_hash, sheet_name, data_only, columnar_sheet)
+            # запись без цветов заливки заменяется записью с ними
+            columnar_sheets[sheet_name] = workbook_cache.put(xlsx_binary_stream, ('columnar', sheet_name, data_only),
+                                                             columnar_sheet, columnar_sheet.nbytes,
+                                                             replace=bool(fill_column_indexes))
+    return {sheet_name: columnar_sheets[sheet_name] for sheet_name in dict.fromkeys(sheet_names)}
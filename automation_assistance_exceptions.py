@@ -4,3 +4,19 @@
 class EmptyTagCellInModel(Exception):
     """Ошибка пустой строки в тэгах модели, когда найденное значение за сопоставимые периоды совпадает."""
 
+
+class BatchJobTimeout(Exception):
+    """Ошибка превышения времени обработки одной пары файлов при пакетной обработке."""
+
+
+class BatchJobProcessFailed(Exception):
+    """Процесс, обрабатывавший пару файлов при пакетной обработке, завершился, не передав результат
+    (например, его завершила ОС из-за нехватки памяти)."""
+
+
+class JobCancelled(Exception):
+    """Обработка отменена пользователем (см. automation_assistance_jobs)."""
+
+
+class JobQueueIsFull(Exception):
+    """Очередь фоновых заданий заполнена, новое задание не может быть принято."""
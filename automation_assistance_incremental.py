@@ -0,0 +1,398 @@
+"""Module for incremental re-runs that recompute equivalents only for rows changed since the previous run.
+
+Аналитик часто исправляет несколько ячеек модели или меняет блок статей и снова отправляет файлы на обработку.
+Для каждого запуска (по ключу: файлы, страницы, адреса ячеек для начала обработки и параметры сравнения)
+запоминаются отпечатки рядов - хэши BLAKE2b значения, названия статьи (и заливки в модели) - и найденные пары
+по рядам модели, а также извлеченные столбцы. Новый запуск разбирает только изменившиеся файлы, сравнивает отпечатки
+и сопоставляет заново только ряды модели, которые изменились или значения которых совпадают со старыми либо
+новыми значениями изменившихся рядов эмитента; пары остальных рядов берутся из предыдущего запуска и отдаются
+первыми, новые пары отдаются по мере сопоставления. Если файлы не изменились, а изменились только блок статей,
+источник данных или параметры поиска в конфиге, повторяется только поиск в конфиге.
+Предыдущие запуски хранятся в памяти процесса, их количество и оценочный объем ограничены.
+"""
+
+import os
+import hashlib
+import itertools
+import threading
+from dataclasses import dataclass, replace
+from collections import OrderedDict
+from typing import Hashable, Iterator
+
+import numpy as np
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from automation_assistance import (Equivalent,
+                                   find_matching_rows,
+                                   get_config_location,
+                                   count_extracted_cells,
+                                   get_issuer_values_to_match,
+                                   extract_model_columns_to_match,
+                                   extract_issuer_columns_to_match,
+                                   iter_multi_period_tags_equations,
+                                   iter_similar_statement_tags_from_config,
+                                   iter_positioned_equivalents_of_extracted_columns)
+from automation_assistance_instrumentation import measure_iterator_stage, measure_stage
+from automation_assistance_streaming import ExtractedColumns
+from automation_assistance_workbook_cache import get_hash_of_binary_stream
+
+# Количество запоминаемых запусков (по одному на сочетание файлов, страниц и адресов ячеек)
+DEFAULT_MAX_PREVIOUS_RUNS = 32
+# Ограничение суммарного (оценочного) объема памяти, занимаемого запомненными запусками
+DEFAULT_MAX_PREVIOUS_RUNS_SIZE_IN_BYTES = 256 * 1024 * 1024
+# Оценочный объем памяти на одно значение в списках столбцов (ссылка и объект значения)
+ESTIMATED_CELL_SIZE_IN_BYTES = 64
+# Оценочный объем памяти на один объект Equivalent или ProblemRow (с названиями статей)
+ESTIMATED_ITEM_SIZE_IN_BYTES = 1024
+
+
+@dataclass
+class PreviousRun:
+    """Отпечатки рядов и результаты предыдущего запуска."""
+
+    # Хэши содержимого файлов модели и эмитента
+    model_file_hash: str
+    issuer_file_hash: str
+    # Названия статей эмитента, ряды которых не сопоставлялись (подтвержденные в хранилище)
+    excluded_tags_from_filling: frozenset
+    # Блок статей, источник данных, параметры поиска в конфиге и время изменения файла конфига
+    config_key: tuple
+    # {позиция ряда модели от ряда старта: объекты Equivalent и ProblemRow этого ряда}
+    # (в режиме нескольких периодов ряды не различаются - все объекты под позицией 0)
+    items_by_model_position: dict
+    # Извлеченные столбцы модели и эмитента (None в режиме нескольких периодов): файл, который не изменился
+    # с предыдущего запуска, повторно не разбирается
+    model_columns: ExtractedColumns | None = None
+    issuer_columns: ExtractedColumns | None = None
+    # Отпечатки рядов модели и эмитента (None в режиме нескольких периодов)
+    model_row_fingerprints: np.ndarray | None = None
+    issuer_row_fingerprints: np.ndarray | None = None
+    # Значения эмитента для сравнения: по ним находятся ряды модели, совпадавшие с изменившимися рядами эмитента
+    issuer_values: list | None = None
+
+    @property
+    def nbytes(self) -> int:
+        """Оценочный объем памяти, занимаемый запуском."""
+        number_of_cells = len(self.issuer_values or ())
+        for extracted_columns in (self.model_columns, self.issuer_columns):
+            if extracted_columns is not None:
+                number_of_cells += len(extracted_columns.rows) + sum(
+                    len(column) for columns in (extracted_columns.values, extracted_columns.fill_colors)
+                    for column in columns.values())
+        number_of_items = sum(len(items) for items in self.items_by_model_position.values())
+        return (number_of_cells * ESTIMATED_CELL_SIZE_IN_BYTES + number_of_items * ESTIMATED_ITEM_SIZE_IN_BYTES
+                + sum(row_fingerprints.nbytes for row_fingerprints in (self.model_row_fingerprints,
+                                                                         self.issuer_row_fingerprints)
+                      if row_fingerprints is not None))
+
+
+class PreviousRuns:
+    """LRU хранилище предыдущих запусков в памяти процесса (общее для потоков обработки) с ограничением
+    количества запусков и их суммарного оценочного объема."""
+
+    def __init__(self, max_runs: int = DEFAULT_MAX_PREVIOUS_RUNS,
+                 max_size_in_bytes: int = DEFAULT_MAX_PREVIOUS_RUNS_SIZE_IN_BYTES):
+        self.max_runs = max_runs
+        self.max_size_in_bytes = max_size_in_bytes
+        self.current_size_in_bytes = 0
+        # {ключ: (запуск, оценочный объем в байтах)}
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> PreviousRun | None:
+        with self._lock:
+            if key not in self._runs:
+                return None
+            self._runs.move_to_end(key)
+            return self._runs[key][0]
+
+    def put(self, key: Hashable, previous_run: PreviousRun):
+        size_in_bytes = previous_run.nbytes
+        with self._lock:
+            if key in self._runs:
+                self.current_size_in_bytes -= self._runs.pop(key)[1]
+            self._runs[key] = (previous_run, size_in_bytes)
+            self.current_size_in_bytes += size_in_bytes
+            # вытесняем давно не использованные запуски, но только что запомненный оставляем в любом случае
+            while ((len(self._runs) > self.max_runs or self.current_size_in_bytes > self.max_size_in_bytes)
+                   and len(self._runs) > 1):
+                _, (_, evicted_size_in_bytes) = self._runs.popitem(last=False)
+                self.current_size_in_bytes -= evicted_size_in_bytes
+
+    def clear(self):
+        """Забывает все запуски."""
+        with self._lock:
+            self._runs.clear()
+            self.current_size_in_bytes = 0
+
+
+previous_runs = PreviousRuns()
+
+
+def get_row_fingerprints(rows: list, *columns: list) -> np.ndarray:
+    """Отдает отпечатки рядов: хэш BLAKE2b (8 байт) номера ряда и значений ячеек ряда в переданных столбцах.
+    В отличие от встроенного hash (для строк зависит от PYTHONHASHSEED) отпечатки одинаковы во всех процессах."""
+    return np.fromiter((int.from_bytes(hashlib.blake2b(encode_row(row), digest_size=8).digest(), 'little',
+                                       signed=True)
+                        for row in zip(rows, *columns)), dtype=np.int64, count=len(rows))
+
+
+def encode_row(row: tuple) -> bytes:
+    """Кодирует значения ряда однозначно: тип и repr каждого значения (repr чисел, строк, дат и None не зависит
+    от процесса), разделенные управляющим символом."""
+    return '\x1f'.join(f'{type(value).__name__}:{value!r}' for value in row).encode('UTF-8', 'surrogatepass')
+
+
+def find_changed_positions(previous_fingerprints: np.ndarray, fingerprints: np.ndarray) -> np.ndarray:
+    """Отдает позиции рядов, отпечатки которых отличаются; появившиеся и пропавшие ряды тоже считаются
+    изменившимися."""
+    number_of_common_rows = min(len(previous_fingerprints), len(fingerprints))
+    changed_positions = np.flatnonzero(previous_fingerprints[:number_of_common_rows]
+                                       != fingerprints[:number_of_common_rows])
+    return np.concatenate([changed_positions,
+                           np.arange(number_of_common_rows, max(len(previous_fingerprints), len(fingerprints)))])
+
+
+def find_model_positions_to_match(previous_run: PreviousRun | None, model_values: list,
+                                  model_row_fingerprints: np.ndarray, issuer_values: list,
+                                  issuer_row_fingerprints: np.ndarray, *, absolute_tolerance: float = 0.0,
+                                  relative_tolerance: float = 0.0, detect_scale: bool = False) -> set | None:
+    """Находит ряды модели, пары которых могли измениться с предыдущего запуска.
+    Args:
+        :param previous_run: предыдущий запуск (None - сопоставить все ряды)
+        :type previous_run: PreviousRun | None
+        :param model_values: значения столбца модели для сравнения
+        :type model_values: list
+        :param model_row_fingerprints: отпечатки рядов модели
+        :type model_row_fingerprints: np.ndarray
+        :param issuer_values: значения столбца эмитента для сравнения
+        :type issuer_values: list
+        :param issuer_row_fingerprints: отпечатки рядов эмитента
+        :type issuer_row_fingerprints: np.ndarray
+        :param absolute_tolerance: допустимое абсолютное отклонение значений
+        :type absolute_tolerance: float
+        :param relative_tolerance: допустимое относительное отклонение значений
+        :type relative_tolerance: float
+        :param detect_scale: определять ли масштаб отчета эмитента относительно модели
+        :type detect_scale: bool
+    Returns:
+        позиции рядов модели от ряда старта; None - сопоставить все ряды
+    """
+    if previous_run is None:
+        return None
+    changed_model_positions = find_changed_positions(previous_run.model_row_fingerprints, model_row_fingerprints)
+    changed_issuer_positions = find_changed_positions(previous_run.issuer_row_fingerprints,
+                                                      issuer_row_fingerprints)
+    if detect_scale and (changed_model_positions.size or changed_issuer_positions.size):
+        # масштаб определяется по всем значениям, поэтому после любого изменения сопоставляются все ряды
+        return None
+    model_positions_to_match = set(changed_model_positions.tolist())
+    # изменившиеся ряды эмитента: пары могли пропасть у рядов модели, совпадавших со старыми значениями,
+    # и появиться у рядов модели, совпадающих с новыми
+    changed_issuer_values = [values[issuer_position]
+                             for values in (previous_run.issuer_values, issuer_values)
+                             for issuer_position in changed_issuer_positions.tolist()
+                             if issuer_position < len(values)]
+    if changed_issuer_values:
+        for model_position, _ in find_matching_rows(model_values, changed_issuer_values,
+                                                    range(len(changed_issuer_values)),
+                                                    absolute_tolerance=absolute_tolerance,
+                                                    relative_tolerance=relative_tolerance,
+                                                    detect_scale=detect_scale):
+            model_positions_to_match.add(model_position)
+    return model_positions_to_match
+
+
+def get_config_key(statement_block: str, data_source: str, config_lookup_options: dict) -> tuple:
+    """Отдает ключ поиска в конфиге: результаты поиска действительны, пока ключ не изменился
+    (в том числе время изменения файла конфига)."""
+    path_to_config, used_data_source = get_config_location(statement_block, data_source)
+    return (path_to_config, used_data_source, tuple(sorted(config_lookup_options.items())),
+            os.stat(path_to_config).st_mtime_ns)
+
+
+def iter_incremental_equivalents(run_key: Hashable, *, statement_block: str, data_source: str,
+                                 multi_period_mode: bool = False, matching_options: dict = None,
+                                 config_lookup_options: dict = None,
+                                 excluded_tags_from_filling: [set|frozenset] = frozenset(),
+                                 runs: PreviousRuns = previous_runs, **creator_arguments) -> Iterator:
+    """Сопоставляет статьи модели и эмитента и ищет названия в конфиге, повторно используя результаты
+    предыдущего запуска с тем же ключом: сопоставляются только ряды, изменившиеся с предыдущего запуска
+    (в режиме нескольких периодов столбцы сопоставляются по всей странице, поэтому результаты используются
+    повторно, только если файлы не изменились), а названия в конфиге ищутся только для новых пар - или для всех,
+    если изменились блок статей, источник данных или параметры поиска. Извлеченные столбцы и отпечатки рядов
+    хранятся вместе с результатами, поэтому файл, который не изменился, повторно не разбирается.
+    Результаты отдаются потоково: сначала пары неизменившихся рядов из предыдущего запуска, затем новые пары
+    по мере сопоставления; названия в конфиге ищутся для каждой пары перед тем, как она отдается.
+    Args:
+        :param run_key: ключ запуска (например, сессия и имена загруженных файлов); страницы, адреса ячеек
+                        для начала обработки и параметры сравнения добавляются к ключу автоматически
+        :type run_key: Hashable
+        :param statement_block: блок статей (определяет конфиг)
+        :type statement_block: str
+        :param data_source: источник данных (определяет раздел конфига)
+        :type data_source: str
+        :param multi_period_mode: сопоставлять ли ряды по всем историческим периодам модели
+        :type multi_period_mode: bool
+        :param matching_options: параметры сравнения значений (допустимое отклонение, определение масштаба)
+        :type matching_options: dict
+        :param config_lookup_options: параметры поиска в конфиге (ранжированный поиск, top_k, min_score)
+        :type config_lookup_options: dict
+        :param excluded_tags_from_filling: названия статей эмитента, ряды которых не сопоставляются
+        :type excluded_tags_from_filling: set | frozenset
+        :param runs: хранилище предыдущих запусков
+        :type runs: PreviousRuns
+        :param creator_arguments: файлы, страницы и адреса ячеек для начала обработки
+    Returns:
+        итератор по объектам Equivalent и ProblemRow: пары из предыдущего запуска в порядке рядов модели,
+        затем новые пары в порядке рядов модели
+    """
+    matching_options = matching_options or {}
+    config_lookup_options = config_lookup_options or {}
+    excluded_tags_from_filling = frozenset(excluded_tags_from_filling)
+    key = (run_key, multi_period_mode,
+           tuple(sorted((name, value) for name, value in creator_arguments.items()
+                        if not name.endswith('binary_stream'))),
+           tuple(sorted(matching_options.items())))
+    previous_run = runs.get(key)
+    current_run = PreviousRun(
+        model_file_hash=get_hash_of_binary_stream(creator_arguments['model_binary_stream']),
+        issuer_file_hash=get_hash_of_binary_stream(creator_arguments['issuer_binary_stream']),
+        excluded_tags_from_filling=excluded_tags_from_filling,
+        config_key=get_config_key(statement_block, data_source, config_lookup_options),
+        items_by_model_position={})
+
+    if (previous_run is not None and previous_run.model_file_hash == current_run.model_file_hash
+            and previous_run.issuer_file_hash == current_run.issuer_file_hash
+            and previous_run.excluded_tags_from_filling == excluded_tags_from_filling):
+        # файлы не изменились - сопоставлять нечего, столбцы и отпечатки остаются прежними
+        reused_items_by_model_position = previous_run.items_by_model_position
+        positioned_new_items = iter(())
+        current_run = replace(previous_run, config_key=current_run.config_key, items_by_model_position={})
+    elif multi_period_mode:
+        reused_items_by_model_position = {}
+        positioned_new_items = ((0, item) for item in iter_multi_period_tags_equations(
+            **creator_arguments, excluded_tags_from_filling=excluded_tags_from_filling))
+    else:
+        model_positions_to_match = prepare_changed_rows(previous_run, current_run, matching_options,
+                                                        **creator_arguments)
+        reused_items_by_model_position = {}
+        if model_positions_to_match is not None:
+            # пары остальных рядов (кроме пропавших) берутся из предыдущего запуска
+            reused_items_by_model_position = {
+                model_position: items for model_position, items in previous_run.items_by_model_position.items()
+                if model_position not in model_positions_to_match
+                and model_position < len(current_run.model_row_fingerprints)}
+        positioned_new_items = iter_positioned_equivalents_of_changed_rows(current_run, model_positions_to_match,
+                                                                           matching_options, **creator_arguments)
+
+    items_to_look_up = []
+    if previous_run is not None and previous_run.config_key == current_run.config_key:
+        # названия из конфига у пар из предыдущего запуска уже найдены - они отдаются сразу
+        for model_position in sorted(reused_items_by_model_position):
+            current_run.items_by_model_position[model_position] = reused_items_by_model_position[model_position]
+            yield from reused_items_by_model_position[model_position]
+    else:
+        # у пар из предыдущего запуска названия из конфига ищутся заново (в копиях - списки
+        # предыдущего запуска не меняются)
+        for model_position in sorted(reused_items_by_model_position):
+            items = [replace(item, tags_from_config=None, scores_of_tags_from_config=None)
+                     if isinstance(item, Equivalent) else item
+                     for item in reused_items_by_model_position[model_position]]
+            current_run.items_by_model_position[model_position] = items
+            items_to_look_up.extend(items)
+
+    def iter_new_items() -> Iterator:
+        for model_position, item in positioned_new_items:
+            current_run.items_by_model_position.setdefault(model_position, []).append(item)
+            yield item
+
+    # названия из конфига ищутся для каждой пары по мере ее получения
+    yield from iter_similar_statement_tags_from_config(statement_block, data_source,
+                                                       itertools.chain(items_to_look_up, iter_new_items()),
+                                                       **config_lookup_options)
+    # запуск запоминается, только если результаты получены полностью (например, не отменены)
+    runs.put(key, current_run)
+
+
+def prepare_changed_rows(previous_run: PreviousRun | None, current_run: PreviousRun, matching_options: dict, *,
+                         model_binary_stream, issuer_binary_stream, selected_model_sheet: str,
+                         selected_issuer_sheet: str, model_address_of_start: str, issuer_address_of_start: str,
+                         index_of_model_column_with_tags: int = 2,
+                         index_of_issuer_column_with_tags: int = 1) -> set | None:
+    """Заполняет в current_run извлеченные столбцы, отпечатки рядов и значения эмитента (столбцы и отпечатки
+    файла, который не изменился, берутся из предыдущего запуска) и находит ряды модели, которые нужно сопоставить
+    (см. iter_incremental_equivalents).
+    Returns:
+        позиции рядов модели от ряда старта; None - сопоставить все ряды
+    """
+    model_index_of_column = coordinate_to_tuple(model_address_of_start)[1]
+    issuer_index_of_column = coordinate_to_tuple(issuer_address_of_start)[1]
+    is_model_unchanged = previous_run is not None and previous_run.model_file_hash == current_run.model_file_hash
+    is_issuer_unchanged = previous_run is not None and previous_run.issuer_file_hash == current_run.issuer_file_hash
+    with measure_stage('workbook_parsing') as stage:
+        if is_model_unchanged:
+            current_run.model_columns = previous_run.model_columns
+        else:
+            current_run.model_columns = extract_model_columns_to_match(
+                model_binary_stream, selected_model_sheet, model_address_of_start, index_of_model_column_with_tags)
+            count_extracted_cells(stage, current_run.model_columns)
+        if is_issuer_unchanged:
+            current_run.issuer_columns = previous_run.issuer_columns
+        else:
+            current_run.issuer_columns = extract_issuer_columns_to_match(
+                issuer_binary_stream, selected_issuer_sheet, issuer_address_of_start,
+                index_of_issuer_column_with_tags)
+            count_extracted_cells(stage, current_run.issuer_columns)
+
+    model_columns, issuer_columns = current_run.model_columns, current_run.issuer_columns
+    model_values = model_columns.values[model_index_of_column]
+    with measure_stage('row_fingerprinting') as stage:
+        if is_model_unchanged:
+            current_run.model_row_fingerprints = previous_run.model_row_fingerprints
+        else:
+            current_run.model_row_fingerprints = get_row_fingerprints(
+                model_columns.rows, model_values, model_columns.values[index_of_model_column_with_tags],
+                model_columns.fill_colors[index_of_model_column_with_tags])
+        if is_issuer_unchanged and previous_run.excluded_tags_from_filling == current_run.excluded_tags_from_filling:
+            current_run.issuer_values = previous_run.issuer_values
+            current_run.issuer_row_fingerprints = previous_run.issuer_row_fingerprints
+        else:
+            current_run.issuer_values = get_issuer_values_to_match(issuer_columns, issuer_index_of_column,
+                                                                   index_of_issuer_column_with_tags,
+                                                                   current_run.excluded_tags_from_filling)
+            current_run.issuer_row_fingerprints = get_row_fingerprints(
+                issuer_columns.rows, current_run.issuer_values,
+                issuer_columns.values[index_of_issuer_column_with_tags])
+        model_positions_to_match = find_model_positions_to_match(
+            previous_run, model_values, current_run.model_row_fingerprints, current_run.issuer_values,
+            current_run.issuer_row_fingerprints, **matching_options)
+        stage.count('rows', len(current_run.model_row_fingerprints) + len(current_run.issuer_row_fingerprints))
+        stage.count('rows_to_match', len(model_values) if model_positions_to_match is None
+                    else len(model_positions_to_match))
+    return model_positions_to_match
+
+
+def iter_positioned_equivalents_of_changed_rows(current_run: PreviousRun, model_positions_to_match: set | None,
+                                                matching_options: dict, *, model_address_of_start: str,
+                                                issuer_address_of_start: str, index_of_model_column_with_tags: int = 2,
+                                                index_of_issuer_column_with_tags: int = 1,
+                                                **creator_arguments) -> Iterator[tuple]:
+    """Потоково сопоставляет ряды модели, найденные prepare_changed_rows, по столбцам из current_run.
+    Returns:
+        итератор пар (позиция ряда модели, объект Equivalent или ProblemRow) по порядку рядов модели
+    """
+    if model_positions_to_match is not None and not model_positions_to_match:
+        return
+    # в этап входит только поиск совпадений, а не обработка отданных объектов потребителем
+    yield from measure_iterator_stage('value_matching', lambda stage: iter_positioned_equivalents_of_extracted_columns(
+        current_run.model_columns, current_run.issuer_columns, stage,
+        model_index_of_column=coordinate_to_tuple(model_address_of_start)[1],
+        issuer_index_of_column=coordinate_to_tuple(issuer_address_of_start)[1],
+        index_of_model_column_with_tags=index_of_model_column_with_tags,
+        index_of_issuer_column_with_tags=index_of_issuer_column_with_tags,
+        absolute_tolerance=matching_options.get('absolute_tolerance', 0.0),
+        relative_tolerance=matching_options.get('relative_tolerance', 0.0),
+        detect_scale=matching_options.get('detect_scale', False),
+        excluded_tags_from_filling=current_run.excluded_tags_from_filling,
+        model_positions_to_match=model_positions_to_match))
@@ -0,0 +1,253 @@
+"""Module for per-stage instrumentation (wall time, counters, memory) emitted as structured JSON log records.
+
+Замеры дешевые и включены всегда: время (perf_counter), счетчики этапа и пиковый объем памяти процесса (max RSS).
+Для подробного разбора можно включить режим профилирования переменной окружения
+AUTOMATION_ASSISTANCE_PROFILING (cprofile или tracemalloc) или параметром collect_run_metrics.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import logging
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+
+try:
+    import resource
+except ImportError:
+    # на Windows модуля resource нет - пиковый объем памяти процесса не измеряется
+    resource = None
+
+logger = logging.getLogger('automation_assistance.instrumentation')
+
+PROFILING_MODE_ENVIRONMENT_VARIABLE = 'AUTOMATION_ASSISTANCE_PROFILING'
+PROFILING_MODES = ('cprofile', 'tracemalloc')
+# Количество функций в отчете cProfile по этапу
+NUMBER_OF_PROFILED_FUNCTIONS_TO_REPORT = 20
+
+# Замеры текущего запуска и текущий (внешний) этап
+_current_run_metrics = ContextVar('current_run_metrics', default=None)
+_current_stage = ContextVar('current_stage', default=None)
+# cProfile нельзя включить дважды, поэтому во вложенных этапах профилировщик не запускается
+_is_profiler_active = ContextVar('is_profiler_active', default=False)
+# Признак окончания итератора в measure_iterator_stage
+_END_OF_ITERATION = object()
+
+
+@dataclass
+class StageMetrics:
+    """Замеры одного этапа обработки."""
+
+    # Название этапа (например, workbook_parsing, start_cell_detection, value_matching, config_lookup)
+    stage: str
+    # Время выполнения, секунды
+    seconds: float = 0.0
+    # Счетчики этапа: ячейки, ряды, сравнения и т.п.
+    counters: dict = field(default_factory=dict)
+    # Пиковый объем памяти процесса (max RSS) к концу этапа, байты
+    max_rss_bytes: int | None = None
+    # Пиковый объем памяти Python за время этапа, байты (только в режиме tracemalloc)
+    traced_peak_memory_bytes: int | None = None
+    # Самые затратные функции этапа (только в режиме cprofile)
+    profile: str | None = None
+
+    def count(self, counter_name: str, number: int = 1):
+        """Увеличивает счетчик этапа."""
+        self.counters[counter_name] = self.counters.get(counter_name, 0) + number
+
+
+@dataclass
+class RunMetrics:
+    """Замеры всех этапов одного запуска обработки."""
+
+    # Режим профилирования: None, 'cprofile' или 'tracemalloc'
+    profiling_mode: str | None = None
+    stages: list[StageMetrics] = field(default_factory=list)
+
+    @property
+    def total_seconds(self) -> float:
+        """Суммарное время этапов верхнего уровня."""
+        return sum(stage.seconds for stage in self.stages)
+
+    def to_records(self) -> list[dict]:
+        """Замеры этапов в виде словарей (для JSON и таблицы в веб интерфейсе)."""
+        return [asdict(stage) for stage in self.stages]
+
+
+def enable_json_logging(stream=None):
+    """Включает вывод JSON записей замеров этапов (по записи на строку) в поток stream (по умолчанию - stderr).
+    Настраивается только логгер замеров, поэтому повторный вызов (например, при перезапуске скрипта Streamlit)
+    не добавляет второй обработчик и не меняет настройки логирования остальных библиотек."""
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+
+def get_profiling_mode_from_environment() -> str | None:
+    """Возвращает режим профилирования из переменной окружения (или None, если он не задан или неизвестен)."""
+    profiling_mode = os.environ.get(PROFILING_MODE_ENVIRONMENT_VARIABLE, '').strip().lower()
+    return profiling_mode if profiling_mode in PROFILING_MODES else None
+
+
+def get_max_rss_bytes() -> int | None:
+    """Пиковый объем памяти процесса в байтах (на Linux ru_maxrss в килобайтах, на macOS - в байтах)."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+@contextmanager
+def collect_run_metrics(profiling_mode: str | None = None):
+    """Собирает замеры всех этапов, выполненных внутри блока with.
+    Args:
+        :param profiling_mode: режим профилирования ('cprofile' или 'tracemalloc'),
+                               по умолчанию - из переменной окружения AUTOMATION_ASSISTANCE_PROFILING
+        :type profiling_mode: str | None
+    Returns:
+        объект RunMetrics, который заполняется по мере выполнения этапов
+    """
+    if profiling_mode is not None and profiling_mode not in PROFILING_MODES:
+        raise ValueError(f'Неизвестный режим профилирования: {profiling_mode}')
+    run_metrics = RunMetrics(profiling_mode=profiling_mode or get_profiling_mode_from_environment())
+    token = _current_run_metrics.set(run_metrics)
+    try:
+        yield run_metrics
+    finally:
+        _current_run_metrics.reset(token)
+
+
+@contextmanager
+def measure_stage(stage_name: str, **counters):
+    """Замеряет этап обработки: время, пиковый объем памяти и счетчики, которые этап добавляет через count().
+    По завершении этапа пишет JSON запись в лог и добавляет замеры в текущий RunMetrics (если он собирается).
+    Вложенные этапы попадают в лог, но в RunMetrics добавляются только этапы верхнего уровня.
+    Args:
+        :param stage_name: название этапа
+        :type stage_name: str
+        :param counters: начальные значения счетчиков этапа
+    Returns:
+        объект StageMetrics текущего этапа
+    """
+    run_metrics = _current_run_metrics.get()
+    profiling_mode = run_metrics.profiling_mode if run_metrics else get_profiling_mode_from_environment()
+    parent_stage = _current_stage.get()
+    stage = StageMetrics(stage=stage_name, counters=dict(counters))
+    stage_token = _current_stage.set(stage)
+
+    profiler = profiler_token = None
+    is_tracemalloc_started_here = False
+    if profiling_mode == 'cprofile' and not _is_profiler_active.get():
+        profiler = cProfile.Profile()
+        profiler_token = _is_profiler_active.set(True)
+        profiler.enable()
+    elif profiling_mode == 'tracemalloc':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            is_tracemalloc_started_here = True
+        # пик внешнего этапа до сброса сохраняется, чтобы вложенный этап его не потерял
+        if parent_stage is not None:
+            parent_stage.traced_peak_memory_bytes = max(parent_stage.traced_peak_memory_bytes or 0,
+                                                        tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        stage.seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            _is_profiler_active.reset(profiler_token)
+            profile_stream = io.StringIO()
+            pstats.Stats(profiler, stream=profile_stream).sort_stats('cumulative').print_stats(
+                NUMBER_OF_PROFILED_FUNCTIONS_TO_REPORT)
+            stage.profile = profile_stream.getvalue()
+        if profiling_mode == 'tracemalloc':
+            stage.traced_peak_memory_bytes = max(stage.traced_peak_memory_bytes or 0,
+                                                 tracemalloc.get_traced_memory()[1])
+            if parent_stage is not None:
+                parent_stage.traced_peak_memory_bytes = max(parent_stage.traced_peak_memory_bytes or 0,
+                                                            stage.traced_peak_memory_bytes)
+            if is_tracemalloc_started_here:
+                tracemalloc.stop()
+        _current_stage.reset(stage_token)
+        record_stage(stage, run_metrics, parent_stage)
+
+
+def record_stage(stage: StageMetrics, run_metrics: RunMetrics | None, parent_stage: StageMetrics | None):
+    """Завершает замер этапа: пиковый объем памяти процесса, JSON запись в лог и добавление в RunMetrics
+    (только для этапов верхнего уровня)."""
+    stage.max_rss_bytes = get_max_rss_bytes()
+    if run_metrics is not None and parent_stage is None:
+        run_metrics.stages.append(stage)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': 'stage_metrics', **asdict(stage)}, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def measure_streamed_stage(stage_name: str, **counters):
+    """Замеряет этап потоковой обработки, который выполняется частями между выдачей результатов генератором.
+    Время внутри блока with само по себе не учитывается - в этап входят только части, выполненные внутри
+    measure_stage_part. Поэтому время обработки результатов потребителем (и время соседних этапов потоковой
+    обработки) в этап не попадает. Замеры записываются при выходе из блока with.
+    Режимы профилирования (cprofile, tracemalloc) для таких этапов не применяются.
+    Args:
+        :param stage_name: название этапа
+        :type stage_name: str
+        :param counters: начальные значения счетчиков этапа
+    Returns:
+        объект StageMetrics этапа
+    """
+    run_metrics = _current_run_metrics.get()
+    parent_stage = _current_stage.get()
+    stage = StageMetrics(stage=stage_name, counters=dict(counters))
+    try:
+        yield stage
+    finally:
+        record_stage(stage, run_metrics, parent_stage)
+
+
+@contextmanager
+def measure_stage_part(stage: StageMetrics):
+    """Добавляет время выполнения блока with к этапу потоковой обработки (см. measure_streamed_stage)."""
+    start = time.perf_counter()
+    stage_token = _current_stage.set(stage)
+    try:
+        yield stage
+    finally:
+        stage.seconds += time.perf_counter() - start
+        _current_stage.reset(stage_token)
+
+
+def measure_iterator_stage(stage_name: str, create_iterable: Callable[[StageMetrics], Iterable],
+                           **counters) -> Iterator:
+    """Замеряет этап, который целиком состоит из получения элементов итератора (например, генератор пар
+    совпавших значений): учитывается время получения каждого элемента, но не время его обработки потребителем.
+    Args:
+        :param stage_name: название этапа
+        :type stage_name: str
+        :param create_iterable: функция, которая получает StageMetrics этапа (для счетчиков) и возвращает
+                                итерируемый объект с результатами этапа
+        :type create_iterable: Callable[[StageMetrics], Iterable]
+        :param counters: начальные значения счетчиков этапа
+    Returns:
+        итератор по результатам этапа
+    """
+    with measure_streamed_stage(stage_name, **counters) as stage:
+        with measure_stage_part(stage):
+            iterator = iter(create_iterable(stage))
+        while True:
+            with measure_stage_part(stage):
+                item = next(iterator, _END_OF_ITERATION)
+            if item is _END_OF_ITERATION:
+                return
+            yield item
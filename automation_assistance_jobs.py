@@ -0,0 +1,257 @@
+"""Module defining a bounded background worker pool with a fair job queue, progress reporting and cancellation.
+
+Задания выполняются в потоках (а не в процессах): прогресс и флаг отмены - общие объекты задания, а разбор
+XLSX (распаковка zip и разбор XML) частично выполняется без GIL. Отмена кооперативная: длительные циклы обработки
+вызывают report_progress (или check_cancelled), который выбрасывает JobCancelled, если задание отменено; разбор XLSX
+проверяет отмену перед каждой страницей и через каждые PROGRESS_REPORT_INTERVAL рядов, но не во время разбора
+общих частей файла при его открытии (стили и общие строки разбирает openpyxl.load_workbook). Потоковая обработка отдает
+готовые результаты через report_result, и они видны до завершения задания (Job.partial_results).
+Очередь справедливая: задания разных владельцев (сессий веб интерфейса) запускаются по кругу, поэтому один
+пользователь с несколькими заданиями не задерживает остальных.
+"""
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from automation_assistance_exceptions import JobCancelled, JobQueueIsFull
+from automation_assistance_instrumentation import RunMetrics, collect_run_metrics
+
+# Количество потоков обработки по умолчанию
+DEFAULT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Ограничение количества заданий в очереди (ожидающих запуска)
+DEFAULT_MAX_QUEUED_JOBS = 100
+# Через сколько секунд после завершения забытое (не полученное) задание удаляется
+FINISHED_JOB_TIME_TO_LIVE = 60 * 60
+# Через сколько итераций длительные циклы обработки сообщают о прогрессе (и проверяют отмену)
+PROGRESS_REPORT_INTERVAL = 1000
+
+# Задание, которое выполняется в текущем потоке
+_current_job = ContextVar('current_job', default=None)
+
+
+@dataclass(eq=False)
+class Job:
+    """Фоновое задание и его состояние."""
+
+    job_id: str
+    # Владелец задания (например, идентификатор сессии веб интерфейса), по нему распределяется очередь
+    owner: str
+    function: Callable = field(repr=False)
+    arguments: dict = field(repr=False)
+    # queued, running, done, error или cancelled
+    status: str = 'queued'
+    # Прогресс: текущий этап, сколько обработано и сколько всего (если известно)
+    stage: str | None = None
+    done: int = 0
+    total: int | None = None
+    result: Any = field(default=None, repr=False)
+    # Результаты, готовые до завершения задания (см. report_result)
+    partial_results: list = field(default_factory=list, repr=False)
+    error: BaseException | None = None
+    # Замеры этапов обработки (см. automation_assistance_instrumentation)
+    run_metrics: RunMetrics | None = field(default=None, repr=False)
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: float | None = None
+    finished_at: float | None = None
+    _cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'error', 'cancelled')
+
+    @property
+    def is_cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """Запрашивает отмену задания: задание из очереди не будет запущено, выполняющееся задание
+        остановится при ближайшем сообщении о прогрессе."""
+        self._cancel_event.set()
+
+
+def report_progress(stage: str, done: int, total: int | None = None):
+    """Сообщает о прогрессе задания, которое выполняется в текущем потоке, и проверяет его отмену.
+    Вне фонового задания (например, при пакетной обработке) ничего не делает.
+    Args:
+        :param stage: название этапа обработки
+        :type stage: str
+        :param done: сколько обработано (рядов, пар значений, названий статей)
+        :type done: int
+        :param total: сколько всего нужно обработать (None, если неизвестно)
+        :type total: int | None
+    """
+    job = _current_job.get()
+    if job is None:
+        return
+    job.stage, job.done, job.total = stage, done, total
+    check_cancelled()
+
+
+def check_cancelled():
+    """Выбрасывает JobCancelled, если отменено задание, которое выполняется в текущем потоке (прогресс
+    не меняется: например, при разборе нескольких страниц параллельно). Вне фонового задания ничего не делает."""
+    job = _current_job.get()
+    if job is not None and job.is_cancel_requested:
+        raise JobCancelled('Обработка отменена')
+
+
+def report_result(item):
+    """Добавляет готовый результат потоковой обработки к частичным результатам задания, которое выполняется
+    в текущем потоке (веб интерфейс показывает их до завершения задания). Вне фонового задания ничего не делает.
+    Args:
+        :param item: готовый результат (например, объект Equivalent)
+    """
+    job = _current_job.get()
+    if job is not None:
+        # добавление в список атомарно, поэтому поток веб интерфейса может читать список без блокировки
+        job.partial_results.append(item)
+
+
+class JobManager:
+    """Ограниченный пул потоков обработки со справедливой очередью заданий."""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_queued_jobs: int = DEFAULT_MAX_QUEUED_JOBS):
+        self.max_workers = max_workers
+        self.max_queued_jobs = max_queued_jobs
+        # {владелец: очередь его заданий}, порядок словаря - порядок обхода владельцев по кругу
+        self._queues = OrderedDict()
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._is_shut_down = False
+        self._workers = [threading.Thread(target=self._work, name=f'automation-assistance-worker-{number}',
+                                          daemon=True)
+                         for number in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, owner: str, function: Callable, **arguments) -> Job:
+        """Ставит задание в очередь владельца.
+        Args:
+            :param owner: владелец задания (например, идентификатор сессии веб интерфейса)
+            :type owner: str
+            :param function: функция обработки, вызывается с именованными аргументами arguments
+            :type function: Callable
+        Returns:
+            задание (его состояние обновляется по мере выполнения)
+        """
+        with self._condition:
+            if self._is_shut_down:
+                raise RuntimeError('Пул обработки остановлен')
+            self._forget_expired_jobs()
+            if sum(len(queue) for queue in self._queues.values()) >= self.max_queued_jobs:
+                raise JobQueueIsFull('Слишком много заданий в очереди, попробуйте позже')
+            job = Job(job_id=uuid.uuid4().hex, owner=owner, function=function, arguments=arguments)
+            self._jobs[job.job_id] = job
+            self._queues.setdefault(owner, deque()).append(job)
+            self._condition.notify()
+        return job
+
+    def get_job(self, job_id: str) -> Job | None:
+        """Возвращает задание по идентификатору (None, если задания нет или оно уже удалено)."""
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Отменяет задание: задание из очереди сразу становится отмененным, выполняющееся - останавливается
+        при ближайшем сообщении о прогрессе."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.cancel()
+            if job.status == 'queued':
+                queue = self._queues.get(job.owner)
+                if queue is not None and job in queue:
+                    queue.remove(job)
+                    if not queue:
+                        del self._queues[job.owner]
+                job.status, job.finished_at = 'cancelled', time.monotonic()
+
+    def forget(self, job_id: str):
+        """Удаляет завершенное задание (и его результат) из пула."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and job.is_finished:
+                del self._jobs[job_id]
+
+    def get_queue_position(self, job: Job) -> int | None:
+        """Возвращает количество заданий, которые будут запущены раньше задания из очереди
+        (None, если задание уже не в очереди)."""
+        with self._condition:
+            # порядок запуска при обходе владельцев по кругу
+            queues = [[queued_job for queued_job in queue if not queued_job.is_cancel_requested]
+                      for queue in self._queues.values()]
+            position = 0
+            for round_number in range(max(map(len, queues), default=0)):
+                for queue in queues:
+                    if round_number < len(queue):
+                        if queue[round_number] is job:
+                            return position
+                        position += 1
+            return None
+
+    def shutdown(self, cancel_running_jobs: bool = True):
+        """Останавливает пул: задания из очереди отменяются, потоки завершаются после текущих заданий."""
+        with self._condition:
+            self._is_shut_down = True
+            for job in self._jobs.values():
+                if job.status == 'queued' or (cancel_running_jobs and job.status == 'running'):
+                    job.cancel()
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _take_next_job(self) -> Job | None:
+        """Берет первое задание следующего по кругу владельца (вызывается под self._condition)."""
+        while self._queues:
+            owner, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                # владелец с оставшимися заданиями встает в конец круга
+                self._queues[owner] = queue
+            if job.is_cancel_requested:
+                job.status, job.finished_at = 'cancelled', time.monotonic()
+                continue
+            job.status, job.started_at = 'running', time.monotonic()
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._take_next_job()
+                while job is None:
+                    if self._is_shut_down:
+                        return
+                    self._condition.wait()
+                    job = self._take_next_job()
+            self._run(job)
+
+    @staticmethod
+    def _run(job: Job):
+        token = _current_job.set(job)
+        try:
+            with collect_run_metrics() as run_metrics:
+                job.run_metrics = run_metrics
+                job.result = job.function(**job.arguments)
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as error:
+            job.error, job.status = error, 'error'
+        finally:
+            job.finished_at = time.monotonic()
+            _current_job.reset(token)
+
+    def _forget_expired_jobs(self):
+        """Удаляет задания, завершенные давно и не полученные владельцем (вызывается под self._condition)."""
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.is_finished and now - job.finished_at > FINISHED_JOB_TIME_TO_LIVE]:
+            del self._jobs[job_id]
@@ -0,0 +1,334 @@
+"""Module defining a local SQLite store of analyst-confirmed equivalents that short-circuits repeated matching.
+
+Аналитики каждый квартал подтверждают одни и те же пары названий статей модели и отчета эмитента.
+Подтвержденные пары (вместе с найденными названиями из конфига) хранятся по эмитенту, блоку статей и источнику
+данных. При новой обработке ряды эмитента с уже известными названиями статей берутся из хранилища, а сопоставление
+по значениям и поиск в конфиге выполняются только для остальных рядов.
+
+Пример выгрузки подтвержденных пар в формате конфига (для пополнения INI конфигов):
+    python automation_assistance_mapping_store.py export-config Баланс PDF --output balance_seed.ini
+"""
+
+import io
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import configparser
+from pathlib import Path
+from datetime import datetime
+from contextlib import closing
+from typing import Hashable, Iterable, Iterator
+
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from automation_assistance import (Equivalent,
+                                   iter_tags_equations,
+                                   collect_equivalents,
+                                   iter_multi_period_tags_equations,
+                                   iter_similar_statement_tags_from_config)
+from automation_assistance_disk_cache import load_columnar_sheet_with_cache
+from automation_assistance_incremental import iter_incremental_equivalents
+from automation_assistance_instrumentation import measure_stage
+
+MAPPING_STORE_ENVIRONMENT_VARIABLE = 'AUTOMATION_ASSISTANCE_MAPPING_STORE'
+# Файл хранилища по умолчанию (как и конфиги, ищется в папке запуска)
+DEFAULT_MAPPING_STORE_PATH = 'confirmed_equivalents.sqlite3'
+# Количество названий статей в одном запросе поиска (ограничение SQLite на число параметров запроса - 999)
+LOOKUP_CHUNK_SIZE = 500
+# Поля записи подтвержденной пары при выгрузке и загрузке
+RECORD_FIELDS = ('issuer', 'statement_block', 'data_source', 'tag_from_filling', 'model_tag', 'tags_from_config')
+
+# Первичный ключ начинается с (эмитент, блок, источник, название статьи эмитента) - он же индекс для поиска
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS confirmed_equivalents (
+    issuer TEXT NOT NULL,
+    statement_block TEXT NOT NULL,
+    data_source TEXT NOT NULL,
+    tag_from_filling TEXT NOT NULL,
+    model_tag TEXT NOT NULL,
+    tags_from_config TEXT NOT NULL,
+    confirmed_at TEXT NOT NULL,
+    PRIMARY KEY (issuer, statement_block, data_source, tag_from_filling, model_tag)
+) WITHOUT ROWID
+'''
+_UPSERT = '''
+INSERT INTO confirmed_equivalents (issuer, statement_block, data_source, tag_from_filling, model_tag,
+                                   tags_from_config, confirmed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (issuer, statement_block, data_source, tag_from_filling, model_tag)
+DO UPDATE SET tags_from_config = excluded.tags_from_config, confirmed_at = excluded.confirmed_at
+'''
+
+
+def get_mapping_store_path_from_environment() -> Path:
+    """Путь до файла хранилища из переменной окружения AUTOMATION_ASSISTANCE_MAPPING_STORE (или по умолчанию)."""
+    return Path(os.environ.get(MAPPING_STORE_ENVIRONMENT_VARIABLE) or DEFAULT_MAPPING_STORE_PATH)
+
+
+class MappingStore:
+    """Хранилище подтвержденных пар названий статей в файле SQLite.
+
+    Соединение открывается на каждую операцию, поэтому один объект можно использовать из потоков веб интерфейса
+    и из процессов пакетной обработки одновременно (запись сериализует сама SQLite).
+    """
+
+    def __init__(self, path: [str | Path] = None):
+        """
+        Args:
+            :param path: путь до файла хранилища (по умолчанию - из переменной окружения или в папке запуска)
+            :type path: str | Path
+        """
+        self.path = Path(path) if path else get_mapping_store_path_from_environment()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(_SCHEMA)
+        return connection
+
+    def confirm(self, issuer: str, statement_block: str, data_source: str, list_of_equivalents: Iterable):
+        """Сохраняет подтвержденные аналитиком пары названий статей (повторное подтверждение обновляет
+        названия из конфига и время подтверждения).
+        Args:
+            :param issuer: эмитент
+            :type issuer: str
+            :param statement_block: блок статей (Баланс, Финансовые результаты, Сегменты,
+                                    Отчет о движении денежных средств)
+            :type statement_block: str
+            :param data_source: источник данных (XBRL, XLSX, PDF)
+            :type data_source: str
+            :param list_of_equivalents: объекты Equivalent
+            :type list_of_equivalents: Iterable[Equivalent]
+        """
+        self.import_records({'issuer': issuer, 'statement_block': statement_block, 'data_source': data_source,
+                             'tag_from_filling': equivalent.tag_from_filling, 'model_tag': equivalent.model_tag,
+                             'tags_from_config': equivalent.tags_from_config or []}
+                            for equivalent in list_of_equivalents)
+
+    def lookup(self, issuer: str, statement_block: str, data_source: str,
+               tags_from_filling: Iterable[str]) -> dict[str, list[Equivalent]]:
+        """Ищет подтвержденные пары для списка названий статей эмитента (одним запросом на LOOKUP_CHUNK_SIZE названий).
+        Args:
+            :param issuer: эмитент
+            :type issuer: str
+            :param statement_block: блок статей
+            :type statement_block: str
+            :param data_source: источник данных
+            :type data_source: str
+            :param tags_from_filling: названия статей из отчета эмитента
+            :type tags_from_filling: Iterable[str]
+        Returns:
+            словарь {название статьи эмитента: подтвержденные объекты Equivalent}; неизвестных названий в нем нет
+        """
+        tags_from_filling = list(dict.fromkeys(tags_from_filling))
+        known_equivalents = {}
+        with closing(self._connect()) as connection:
+            for chunk_start in range(0, len(tags_from_filling), LOOKUP_CHUNK_SIZE):
+                chunk = tags_from_filling[chunk_start:chunk_start + LOOKUP_CHUNK_SIZE]
+                rows = connection.execute(
+                    'SELECT tag_from_filling, model_tag, tags_from_config FROM confirmed_equivalents '
+                    'WHERE issuer = ? AND statement_block = ? AND data_source = ? '
+                    f'AND tag_from_filling IN ({", ".join("?" * len(chunk))}) '
+                    'ORDER BY tag_from_filling, model_tag',
+                    (issuer, statement_block, data_source, *chunk))
+                for tag_from_filling, model_tag, tags_from_config in rows:
+                    known_equivalents.setdefault(tag_from_filling, []).append(
+                        Equivalent(tag_from_filling=tag_from_filling, model_tag=model_tag,
+                                   tags_from_config=json.loads(tags_from_config)))
+        # в порядке переданных названий статей
+        return {tag_from_filling: known_equivalents[tag_from_filling] for tag_from_filling in tags_from_filling
+                if tag_from_filling in known_equivalents}
+
+    def export_records(self, issuer: str = None, statement_block: str = None,
+                       data_source: str = None) -> Iterator[dict]:
+        """Отдает подтвержденные пары в виде словарей с полями RECORD_FIELDS (и confirmed_at).
+        Незаполненные аргументы не ограничивают выгрузку."""
+        conditions = {'issuer': issuer, 'statement_block': statement_block, 'data_source': data_source}
+        conditions = {field_name: value for field_name, value in conditions.items() if value is not None}
+        where = ' AND '.join(f'{field_name} = ?' for field_name in conditions)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f'SELECT {", ".join(RECORD_FIELDS)}, confirmed_at FROM confirmed_equivalents '
+                + (f'WHERE {where} ' if where else '')
+                + 'ORDER BY issuer, statement_block, data_source, tag_from_filling, model_tag',
+                tuple(conditions.values()))
+            for row in rows:
+                record = dict(zip((*RECORD_FIELDS, 'confirmed_at'), row))
+                record['tags_from_config'] = json.loads(record['tags_from_config'])
+                yield record
+
+    def import_records(self, records: Iterable[dict]) -> int:
+        """Загружает подтвержденные пары (словари с полями RECORD_FIELDS) одной транзакцией.
+        Returns:
+            количество загруженных записей
+        """
+        confirmed_at = datetime.now().isoformat(timespec='seconds')
+        parameters = [(record['issuer'], record['statement_block'], record['data_source'],
+                       str(record['tag_from_filling']), str(record['model_tag']),
+                       json.dumps(list(record.get('tags_from_config') or []), ensure_ascii=False),
+                       record.get('confirmed_at') or confirmed_at)
+                      for record in records]
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(_UPSERT, parameters)
+        return len(parameters)
+
+    def export_config_section(self, statement_block: str, data_source: str, issuer: str = None) -> str:
+        """Выгружает подтвержденные пары в формате раздела конфига: название статьи модели слева, названия статей
+        эмитента (по одному на строку) справа. Текст можно добавить в соответствующий INI конфиг.
+        Args:
+            :param statement_block: блок статей (определяет конфиг)
+            :type statement_block: str
+            :param data_source: источник данных (XBRL, XLSX, PDF - определяет раздел конфига)
+            :type data_source: str
+            :param issuer: эмитент (по умолчанию - пары всех эмитентов)
+            :type issuer: str
+        Returns:
+            текст раздела конфига
+        """
+        variants_of_model_tags = {}
+        for record in self.export_records(issuer, statement_block, data_source):
+            variants_of_model_tags.setdefault(record['model_tag'], {})[record['tag_from_filling']] = None
+        config = configparser.ConfigParser(interpolation=None)
+        # названия статей модели записываются без приведения к нижнему регистру
+        config.optionxform = str
+        section = {'XBRL': 'XBRL template', 'XLSX': 'XLSX statements', 'PDF': 'PDF statements'}[data_source]
+        # конфиги читаются с интерполяцией (BasicInterpolation), поэтому '%' в названиях экранируется как '%%'
+        config[section] = {model_tag: '\n'.join(variant.replace('%', '%%') for variant in variants)
+                           for model_tag, variants in variants_of_model_tags.items()}
+        config_stream = io.StringIO()
+        config.write(config_stream)
+        return config_stream.getvalue()
+
+
+def create_equivalents_with_mapping_store(mapping_store: MappingStore | None, issuer: str | None, *,
+                                          statement_block: str, data_source: str, multi_period_mode: bool = False,
+                                          matching_options: dict = None, config_lookup_options: dict = None,
+                                          run_key: Hashable = None, **creator_arguments) -> list[Equivalent]:
+    """Сопоставляет статьи модели и эмитента и ищет названия в конфиге, пропуская ряды эмитента, названия статей
+    которых уже подтверждены для этого эмитента, блока статей и источника данных: для них объекты Equivalent
+    берутся из хранилища (вместе с названиями из конфига). Без хранилища или эмитента обрабатываются все ряды.
+    Args:
+        :param mapping_store: хранилище подтвержденных пар (None - не использовать)
+        :type mapping_store: MappingStore | None
+        :param issuer: эмитент (None или пустая строка - не использовать хранилище)
+        :type issuer: str | None
+        :param statement_block: блок статей (определяет конфиг)
+        :type statement_block: str
+        :param data_source: источник данных (определяет раздел конфига)
+        :type data_source: str
+        :param multi_period_mode: сопоставлять ли ряды по всем историческим периодам модели
+        :type multi_period_mode: bool
+        :param matching_options: параметры сравнения значений (допустимое отклонение, определение масштаба)
+        :type matching_options: dict
+        :param config_lookup_options: параметры поиска в конфиге (ранжированный поиск, top_k, min_score)
+        :type config_lookup_options: dict
+        :param run_key: ключ запуска для повторного использования результатов предыдущего запуска
+                        (None - обрабатывать все ряды; см. automation_assistance_incremental)
+        :type run_key: Hashable
+        :param creator_arguments: файлы, страницы и адреса ячеек для начала обработки
+    Returns:
+        список объектов Equivalent: сначала подтвержденные (в порядке рядов эмитента), затем новые
+    """
+    return collect_equivalents(iter_equivalents_with_mapping_store(
+        mapping_store, issuer, statement_block=statement_block, data_source=data_source,
+        multi_period_mode=multi_period_mode, matching_options=matching_options,
+        config_lookup_options=config_lookup_options, run_key=run_key, **creator_arguments))
+
+
+def iter_equivalents_with_mapping_store(mapping_store: MappingStore | None, issuer: str | None, *,
+                                        statement_block: str, data_source: str, multi_period_mode: bool = False,
+                                        matching_options: dict = None, config_lookup_options: dict = None,
+                                        run_key: Hashable = None, **creator_arguments) -> Iterator:
+    """Потоковый вариант create_equivalents_with_mapping_store (параметры те же): сначала отдаются подтвержденные
+    объекты Equivalent, затем новые - по мере сопоставления и поиска в конфиге. Ряды с пустой ячейкой названия
+    статьи в модели отдаются объектами ProblemRow (см. automation_assistance.iter_tags_equations).
+    Returns:
+        итератор по объектам Equivalent и ProblemRow
+    """
+    known_equivalents = {}
+    if mapping_store is not None and issuer:
+        issuer_index_of_row = coordinate_to_tuple(creator_arguments['issuer_address_of_start'])[0]
+        # столбец с названиями статей эмитента берется из кэша разобранных страниц (его же читает сопоставление)
+        issuer_columnar_sheet = load_columnar_sheet_with_cache(creator_arguments['issuer_binary_stream'],
+                                                               creator_arguments['selected_issuer_sheet'],
+                                                               data_only=True, use_disk_cache=True)
+        issuer_tags_column = issuer_columnar_sheet.get_column_values(
+            creator_arguments.get('index_of_issuer_column_with_tags', 1), min_row=issuer_index_of_row)
+        tags_from_filling = [str(tag_comparative_cell) for tag_comparative_cell in issuer_tags_column
+                             if tag_comparative_cell is not None]
+        with measure_stage('mapping_lookup', lookups=len(set(tags_from_filling))) as stage:
+            known_equivalents = mapping_store.lookup(issuer, statement_block, data_source, tags_from_filling)
+            stage.count('known_tags', len(known_equivalents))
+
+    for equivalents in known_equivalents.values():
+        yield from equivalents
+    excluded_tags_from_filling = frozenset(known_equivalents)
+    if run_key is not None:
+        # сопоставляются только ряды, изменившиеся с предыдущего запуска с тем же ключом
+        yield from iter_incremental_equivalents(run_key, statement_block=statement_block, data_source=data_source,
+                                                multi_period_mode=multi_period_mode,
+                                                matching_options=matching_options,
+                                                config_lookup_options=config_lookup_options,
+                                                excluded_tags_from_filling=excluded_tags_from_filling,
+                                                **creator_arguments)
+        return
+    if multi_period_mode:
+        new_equivalents = iter_multi_period_tags_equations(**creator_arguments,
+                                                           excluded_tags_from_filling=excluded_tags_from_filling)
+    else:
+        new_equivalents = iter_tags_equations(**creator_arguments, **(matching_options or {}),
+                                              excluded_tags_from_filling=excluded_tags_from_filling)
+    # названия из конфига ищутся только для новых пар
+    yield from iter_similar_statement_tags_from_config(statement_block, data_source, new_equivalents,
+                                                       **(config_lookup_options or {}))
+
+
+def main(arguments: list[str] = None) -> int:
+    """Точка входа командной строки: выгрузка и загрузка подтвержденных пар (JSONL) и выгрузка в формате конфига."""
+    parser = argparse.ArgumentParser(description='Хранилище подтвержденных пар названий статей модели и '
+                                                 'отчета эмитента.')
+    parser.add_argument('-s', '--store', type=Path, default=None,
+                        help=f'файл хранилища (по умолчанию - {MAPPING_STORE_ENVIRONMENT_VARIABLE} '
+                             f'или {DEFAULT_MAPPING_STORE_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='выгрузить пары в JSONL')
+    export_parser.add_argument('--issuer')
+    export_parser.add_argument('--statement-block')
+    export_parser.add_argument('--data-source')
+    export_parser.add_argument('-o', '--output', type=Path, help='файл JSONL (по умолчанию - stdout)')
+    import_parser = commands.add_parser('import', help='загрузить пары из JSONL')
+    import_parser.add_argument('input', type=Path, help='файл JSONL с полями ' + ', '.join(RECORD_FIELDS))
+    export_config_parser = commands.add_parser('export-config', help='выгрузить пары в формате раздела конфига')
+    export_config_parser.add_argument('statement_block')
+    export_config_parser.add_argument('data_source', choices=('XBRL', 'XLSX', 'PDF'))
+    export_config_parser.add_argument('--issuer')
+    export_config_parser.add_argument('-o', '--output', type=Path, help='файл INI (по умолчанию - stdout)')
+    parsed_arguments = parser.parse_args(arguments)
+
+    mapping_store = MappingStore(parsed_arguments.store)
+    match parsed_arguments.command:
+        case 'export':
+            output_text = ''.join(json.dumps(record, ensure_ascii=False) + '\n'
+                                  for record in mapping_store.export_records(parsed_arguments.issuer,
+                                                                             parsed_arguments.statement_block,
+                                                                             parsed_arguments.data_source))
+        case 'import':
+            with open(parsed_arguments.input, encoding='UTF-8') as input_file:
+                number_of_records = mapping_store.import_records(json.loads(line) for line in input_file
+                                                                 if line.strip())
+            print(f'Загружено пар: {number_of_records}', file=sys.stderr)
+            return 0
+        case 'export-config':
+            output_text = mapping_store.export_config_section(parsed_arguments.statement_block,
+                                                              parsed_arguments.data_source, parsed_arguments.issuer)
+    if parsed_arguments.output:
+        parsed_arguments.output.write_text(output_text, encoding='UTF-8')
+    else:
+        sys.stdout.write(output_text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Module of array-level algorithms for matching rows of an analyst's model with rows of an issuer's filing."""
+
+from collections import Counter
+
+import numpy as np
+
+from automation_assistance_jobs import PROGRESS_REPORT_INTERVAL, report_progress
+
+# Минимальное количество общих значений, при котором столбцы модели и эмитента считаются одним периодом
+MIN_PERIOD_COLUMNS_OVERLAP = 2
+# Степени десяти, среди которых ищется масштаб (единицы, тысячи, миллионы...) значений эмитента относительно модели
+SCALE_EXPONENTS = range(-9, 10)
+# Количество значений модели, по которым определяется масштаб
+SCALE_DETECTION_SAMPLE_SIZE = 1000
+# Относительная погрешность, с которой сравниваются значения при определении масштаба (округление в отчетах)
+SCALE_DETECTION_RELATIVE_TOLERANCE = 0.005
+# Минимальная относительная погрешность сравнения масштабированных значений: умножение на степень десяти дает
+# ошибку округления float (4.35 * 100 = 434.99999999999994), поэтому точное сравнение пропускало бы совпадения
+SCALED_VALUES_RELATIVE_EPSILON = 1e-9
+
+
+def normalize_numbers_for_comparison(numbers: np.ndarray) -> np.ndarray:
+    """Векторный аналог normalize_value_for_comparison: дробные значения усекаются до целых (как int())."""
+    return np.trunc(numbers)
+
+
+def get_evidence_mask(numbers: np.ndarray) -> np.ndarray:
+    """Маска значений, совпадение которых считается доказательством: нули и пустые ячейки (NaN) совпадают
+    слишком часто, поэтому не учитываются."""
+    return ~np.isnan(numbers) & (numbers != 0)
+
+
+def align_period_columns(model_columns: dict, issuer_columns: dict,
+                         min_overlap: int = MIN_PERIOD_COLUMNS_OVERLAP) -> list[tuple[int, int]]:
+    """Сопоставляет столбцы периодов модели со столбцами отчета эмитента по количеству общих значений.
+    Пары выбираются жадно, начиная с наибольшего пересечения; каждый столбец участвует не более чем в одной паре.
+    Args:
+        :param model_columns: {номер столбца модели: нормализованные значения столбца}
+        :type model_columns: dict[int, np.ndarray]
+        :param issuer_columns: {номер столбца эмитента: нормализованные значения столбца}
+        :type issuer_columns: dict[int, np.ndarray]
+        :param min_overlap: минимальное количество общих уникальных значений для пары столбцов
+        :type min_overlap: int
+    Returns:
+        список пар (номер столбца модели, номер столбца эмитента), упорядоченный по столбцам модели
+    """
+    unique_model_values = {column: np.unique(values[get_evidence_mask(values)])
+                           for column, values in model_columns.items()}
+    unique_issuer_values = {column: np.unique(values[get_evidence_mask(values)])
+                            for column, values in issuer_columns.items()}
+    overlaps = []
+    for model_column, model_values in unique_model_values.items():
+        for issuer_column, issuer_values in unique_issuer_values.items():
+            overlap = np.intersect1d(model_values, issuer_values, assume_unique=True).size
+            if overlap >= min_overlap:
+                overlaps.append((overlap, model_column, issuer_column))
+    # при равном пересечении предпочтение отдается левым столбцам
+    overlaps.sort(key=lambda item: (-item[0], item[1], item[2]))
+    aligned_model_columns, aligned_issuer_columns, column_pairs = set(), set(), []
+    for _, model_column, issuer_column in overlaps:
+        if model_column in aligned_model_columns or issuer_column in aligned_issuer_columns:
+            continue
+        aligned_model_columns.add(model_column)
+        aligned_issuer_columns.add(issuer_column)
+        column_pairs.append((model_column, issuer_column))
+    return sorted(column_pairs)
+
+
+def match_rows_by_signature(model_matrix: np.ndarray, issuer_matrix: np.ndarray,
+                            min_confidence: float = 0.5) -> list[tuple[int, int, float]]:
+    """Сопоставляет ряды модели с рядами отчета эмитента по вектору значений за несколько периодов.
+
+    Для каждого периода строится хэш-индекс {значение: ряды эмитента}; ряд модели получает по одному голосу
+    для каждого ряда эмитента за каждый период, в котором совпали ненулевые значения. Кандидаты - только ряды
+    эмитента, получившие хотя бы один голос. Уверенность - доля периодов с совпадением среди всех сопоставленных
+    периодов (периоды, где значения нулевые или пустые у обоих рядов, тоже считаются совпавшими).
+    Для ряда модели берутся ряды эмитента с наибольшей уверенностью (все, если таких несколько).
+    Args:
+        :param model_matrix: нормализованные значения модели (ряды x сопоставленные периоды)
+        :type model_matrix: np.ndarray
+        :param issuer_matrix: нормализованные значения эмитента (ряды x те же периоды в том же порядке)
+        :type issuer_matrix: np.ndarray
+        :param min_confidence: минимальная уверенность, при которой пара рядов попадает в результат
+        :type min_confidence: float
+    Returns:
+        список троек (индекс ряда модели, индекс ряда эмитента, уверенность) по порядку рядов
+    """
+    issuer_evidence_mask = get_evidence_mask(issuer_matrix)
+    period_indexes = []
+    for period in range(issuer_matrix.shape[1]):
+        period_index = {}
+        for issuer_row in np.flatnonzero(issuer_evidence_mask[:, period]):
+            period_index.setdefault(issuer_matrix[issuer_row, period], []).append(int(issuer_row))
+        period_indexes.append(period_index)
+
+    model_evidence_mask = get_evidence_mask(model_matrix)
+    number_of_periods = model_matrix.shape[1]
+    matched_rows = []
+    model_rows_with_evidence = np.flatnonzero(model_evidence_mask.any(axis=1))
+    for number_of_model_row, model_row in enumerate(model_rows_with_evidence):
+        if number_of_model_row % PROGRESS_REPORT_INTERVAL == 0:
+            report_progress('value_matching', number_of_model_row, len(model_rows_with_evidence))
+        votes = Counter()
+        for period in np.flatnonzero(model_evidence_mask[model_row]):
+            votes.update(period_indexes[period].get(model_matrix[model_row, period], ()))
+        if not votes:
+            continue
+        candidate_rows = np.fromiter(votes.keys(), dtype=int, count=len(votes))
+        # периоды, в которых и у модели, и у кандидата значение нулевое или пустое, тоже считаются совпавшими
+        number_of_common_empty_periods = (~issuer_evidence_mask[candidate_rows][:, ~model_evidence_mask[model_row]]
+                                          ).sum(axis=1)
+        confidences = (np.fromiter(votes.values(), dtype=int, count=len(votes))
+                       + number_of_common_empty_periods) / number_of_periods
+        best_confidence = confidences.max()
+        if best_confidence < min_confidence:
+            continue
+        for issuer_row in np.sort(candidate_rows[confidences == best_confidence]):
+            matched_rows.append((int(model_row), int(issuer_row), float(best_confidence)))
+    return matched_rows
+
+
+def find_tolerance_windows(sorted_values: np.ndarray, values_to_find: np.ndarray, absolute_tolerance: float = 0.0,
+                           relative_tolerance: float = 0.0) -> tuple[np.ndarray, np.ndarray]:
+    """Для каждого искомого значения находит бинарным поиском границы [lower, upper) отрезка отсортированного
+    массива, значения которого отличаются от искомого не больше допустимого отклонения
+    max(absolute_tolerance, relative_tolerance * |значение|)."""
+    tolerances = np.maximum(absolute_tolerance, relative_tolerance * np.abs(values_to_find))
+    lower = np.searchsorted(sorted_values, values_to_find - tolerances, side='left')
+    upper = np.searchsorted(sorted_values, values_to_find + tolerances, side='right')
+    return lower, upper
+
+
+def detect_scale_factor(model_values: np.ndarray, issuer_values: np.ndarray,
+                        relative_tolerance: float = SCALE_DETECTION_RELATIVE_TOLERANCE,
+                        sample_size: int = SCALE_DETECTION_SAMPLE_SIZE) -> float:
+    """Определяет множитель (степень десяти), после умножения на который значения модели чаще всего находятся
+    среди значений эмитента, например 1000, если модель ведется в миллионах, а отчет - в тысячах.
+    Args:
+        :param model_values: значения модели (NaN - пустые и нечисловые ячейки)
+        :type model_values: np.ndarray
+        :param issuer_values: значения эмитента (NaN - пустые и нечисловые ячейки)
+        :type issuer_values: np.ndarray
+        :param relative_tolerance: относительная погрешность сравнения значений
+        :type relative_tolerance: float
+        :param sample_size: количество значений модели, по которым проверяется каждый множитель
+        :type sample_size: int
+    Returns:
+        множитель для значений модели (1.0, если определить масштаб не удалось)
+    """
+    model_values = model_values[get_evidence_mask(model_values)]
+    sorted_issuer_values = np.sort(issuer_values[get_evidence_mask(issuer_values)])
+    if not model_values.size or not sorted_issuer_values.size:
+        return 1.0
+    # равномерная (детерминированная) выборка значений модели
+    sample = model_values[np.linspace(0, model_values.size - 1, min(model_values.size, sample_size)).astype(int)]
+    best_exponent, best_number_of_hits = 0, 0
+    # при равном количестве совпадений предпочтение отдается множителям, ближе к единице
+    for exponent in sorted(SCALE_EXPONENTS, key=abs):
+        lower, upper = find_tolerance_windows(sorted_issuer_values, sample * 10.0 ** exponent,
+                                              relative_tolerance=relative_tolerance)
+        number_of_hits = int(np.count_nonzero(upper > lower))
+        if number_of_hits > best_number_of_hits:
+            best_exponent, best_number_of_hits = exponent, number_of_hits
+    return 10.0 ** best_exponent
+
+
+def join_with_tolerance(model_values: np.ndarray, issuer_values: np.ndarray, absolute_tolerance: float = 0.0,
+                        relative_tolerance: float = 0.0, scale_factor: float = 1.0) -> tuple[np.ndarray, np.ndarray]:
+    """Находит все пары значений модели и эмитента, совпадающие с допустимым отклонением.
+    Значения эмитента сортируются один раз, для каждого значения модели границы совпадающих значений ищутся
+    бинарным поиском, поэтому время работы - O((n + m) log m + количество пар).
+    Args:
+        :param model_values: значения модели (NaN - пустые и нечисловые ячейки)
+        :type model_values: np.ndarray
+        :param issuer_values: значения эмитента (NaN - пустые и нечисловые ячейки)
+        :type issuer_values: np.ndarray
+        :param absolute_tolerance: допустимое абсолютное отклонение (в единицах отчета эмитента)
+        :type absolute_tolerance: float
+        :param relative_tolerance: допустимое относительное отклонение (доля от значения)
+        :type relative_tolerance: float
+        :param scale_factor: множитель для значений модели (см. detect_scale_factor); масштабированные значения
+                             сравниваются с относительной погрешностью не меньше SCALED_VALUES_RELATIVE_EPSILON
+        :type scale_factor: float
+    Returns:
+        индексы значений модели и индексы значений эмитента найденных пар, упорядоченные по индексу модели,
+        а затем по индексу эмитента
+    """
+    if scale_factor != 1.0:
+        relative_tolerance = max(relative_tolerance, SCALED_VALUES_RELATIVE_EPSILON)
+    issuer_indexes = np.flatnonzero(~np.isnan(issuer_values))
+    issuer_order = np.argsort(issuer_values[issuer_indexes], kind='stable')
+    issuer_indexes = issuer_indexes[issuer_order]
+    sorted_issuer_values = issuer_values[issuer_indexes]
+    model_indexes = np.flatnonzero(~np.isnan(model_values))
+    lower, upper = find_tolerance_windows(sorted_issuer_values, model_values[model_indexes] * scale_factor,
+                                          absolute_tolerance, relative_tolerance)
+    # разворачиваем отрезки [lower, upper) в пары индексов
+    numbers_of_pairs = upper - lower
+    pair_model_indexes = np.repeat(model_indexes, numbers_of_pairs)
+    offsets_in_windows = (np.arange(numbers_of_pairs.sum())
+                          - np.repeat(np.cumsum(numbers_of_pairs) - numbers_of_pairs, numbers_of_pairs))
+    pair_issuer_indexes = issuer_indexes[np.repeat(lower, numbers_of_pairs) + offsets_in_windows]
+    pair_order = np.lexsort((pair_issuer_indexes, pair_model_indexes))
+    return pair_model_indexes[pair_order], pair_issuer_indexes[pair_order]
+
+
+def convert_values_to_numbers(values: [list|tuple]) -> np.ndarray:
+    """Переводит значения ячеек в массив чисел: нечисловые и пустые ячейки становятся NaN."""
+    return np.array([value if isinstance(value, (int, float)) else np.nan for value in values], dtype=float)
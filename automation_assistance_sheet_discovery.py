@@ -0,0 +1,203 @@
+"""Module for discovering the issuer sheet that matches the model by overlap of numeric value sketches.
+
+В файлах эмитента, полученных из PDF, десятки страниц вида page-4-table-1. Для каждой страницы строится
+компактный набросок (sketch) - множество ненулевых числовых значений, усеченных до целых (как при сравнении
+значений). Страницы ранжируются по пересечению наброска со значениями последнего исторического столбца модели,
+нормированному на размеры обоих множеств (большая страница со случайными общими числами не опережает нужную).
+Наброски строятся за один проход по архиву: XML каждой страницы распаковывается и разбирается потоково
+один раз, страницы разбираются параллельно, а openpyxl (объекты ячеек, стили) не используется.
+"""
+
+import os
+import zipfile
+import contextvars
+from io import BytesIO
+from typing import BinaryIO
+from dataclasses import dataclass
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from automation_assistance import find_last_historical_column_number
+from automation_assistance_instrumentation import measure_stage
+from automation_assistance_jobs import PROGRESS_REPORT_INTERVAL, check_cancelled
+from automation_assistance_matching import get_evidence_mask, normalize_numbers_for_comparison
+from automation_assistance_snapshot import SheetSnapshot, load_sheet_snapshot_with_cache
+from automation_assistance_streaming import SPREADSHEET_NAMESPACE, read_sheet_parts_from_workbook_xml
+from automation_assistance_workbook_cache import read_binary_stream, workbook_cache
+
+# Количество потоков, разбирающих страницы
+DEFAULT_MAX_WORKERS = min(8, os.cpu_count() or 1)
+# Типы ячеек (атрибут t) с числовым значением: без типа или 'n'
+NUMERIC_CELL_TYPES = (None, 'n')
+CELL_TAG = f'{{{SPREADSHEET_NAMESPACE}}}c'
+VALUE_TAG = f'{{{SPREADSHEET_NAMESPACE}}}v'
+ROW_TAG = f'{{{SPREADSHEET_NAMESPACE}}}row'
+
+
+@dataclass
+class SheetSketch:
+    """Набросок числовых значений одной страницы."""
+
+    sheet_name: str
+    # Отсортированные уникальные ненулевые числовые значения страницы, усеченные до целых
+    values: np.ndarray
+    # Количество числовых ячеек на странице
+    number_of_numeric_cells: int = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+
+@dataclass
+class SheetRank:
+    """Место страницы эмитента при ранжировании по пересечению с моделью."""
+
+    sheet_name: str
+    # Количество значений столбца модели, найденных на странице
+    overlap: int
+    # Доля значений столбца модели, найденных на странице (от 0 до 1)
+    containment: float
+    # Схожесть, по которой ранжируются страницы (от 0 до 1): коэффициент Отиаи
+    # overlap / sqrt(значений модели * значений страницы), то есть доля найденных значений модели,
+    # уменьшенная для страниц, большая часть значений которых в модели не встречается
+    score: float
+
+
+def create_sheet_sketch(content: bytes, sheet_name: str, sheet_part: str) -> SheetSketch:
+    """Потоково разбирает XML одной страницы и строит набросок ее числовых значений (значения формул берутся
+    из сохраненного результата, как при data_only=True).
+    Args:
+        :param content: содержимое XLSX файла
+        :type content: bytes
+        :param sheet_name: название страницы
+        :type sheet_name: str
+        :param sheet_part: путь до XML части страницы в архиве
+        :type sheet_part: str
+    Returns:
+        набросок страницы
+    """
+    check_cancelled()
+    numbers, number_of_rows = [], 0
+    # у каждого потока свой объект архива: позиция чтения общего файла не делится между потоками
+    with zipfile.ZipFile(BytesIO(content)) as archive, archive.open(sheet_part) as sheet_xml:
+        for _, element in ElementTree.iterparse(sheet_xml):
+            if element.tag == CELL_TAG:
+                if element.get('t') in NUMERIC_CELL_TYPES:
+                    value = element.findtext(VALUE_TAG)
+                    if value:
+                        numbers.append(float(value))
+            elif element.tag == ROW_TAG:
+                # разобранные ряды больше не нужны
+                element.clear()
+                number_of_rows += 1
+                if number_of_rows % PROGRESS_REPORT_INTERVAL == 0:
+                    check_cancelled()
+    numbers = normalize_numbers_for_comparison(np.array(numbers, dtype=float))
+    return SheetSketch(sheet_name=sheet_name, values=np.unique(numbers[get_evidence_mask(numbers)]),
+                       number_of_numeric_cells=len(numbers))
+
+
+def create_sheet_sketches(xlsx_binary_stream: BinaryIO, max_workers: int = DEFAULT_MAX_WORKERS) -> list[SheetSketch]:
+    """Строит наброски всех страниц XLSX файла параллельно (каждая страница разбирается один раз).
+    Args:
+        :param xlsx_binary_stream: бинарный поток XLSX файла
+        :type xlsx_binary_stream: BinaryIO
+        :param max_workers: количество потоков
+        :type max_workers: int
+    Returns:
+        наброски страниц в порядке их следования в файле
+    """
+    content = read_binary_stream(xlsx_binary_stream)
+    with zipfile.ZipFile(BytesIO(content)) as archive:
+        sheet_parts = read_sheet_parts_from_workbook_xml(archive)
+    # потоки пула получают контекст вызывающего потока (в нем - фоновое задание), чтобы проверять его отмену;
+    # после отмены страницы, разбор которых еще не начат, не разбираются
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, create_sheet_sketch, content, sheet_name, sheet_part)
+                   for sheet_name, sheet_part in sheet_parts.items()]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def load_sheet_sketches_with_cache(xlsx_binary_stream: BinaryIO) -> list[SheetSketch]:
+    """Отдает наброски страниц из общего кэша (строит их при первом обращении к файлу)."""
+    return workbook_cache.get_or_create(xlsx_binary_stream, ('sheet_sketches',),
+                                        lambda: create_sheet_sketches(xlsx_binary_stream),
+                                        lambda sheet_sketches: sum(sketch.nbytes for sketch in sheet_sketches))
+
+
+def rank_sheets_by_overlap(values_to_find: np.ndarray, sheet_sketches: list[SheetSketch]) -> list[SheetRank]:
+    """Ранжирует страницы по схожести их набросков с искомыми значениями (см. SheetRank.score).
+    Args:
+        :param values_to_find: значения (например, столбца модели); нули и пустые значения не учитываются
+        :type values_to_find: np.ndarray
+        :param sheet_sketches: наброски страниц
+        :type sheet_sketches: list[SheetSketch]
+    Returns:
+        страницы по убыванию схожести (при равной схожести - в порядке следования в файле)
+    """
+    values_to_find = normalize_numbers_for_comparison(values_to_find)
+    values_to_find = np.unique(values_to_find[get_evidence_mask(values_to_find)])
+    sheet_ranks = []
+    for sheet_sketch in sheet_sketches:
+        overlap = np.intersect1d(values_to_find, sheet_sketch.values, assume_unique=True).size
+        if overlap:
+            containment = overlap / values_to_find.size
+            score = overlap / np.sqrt(values_to_find.size * sheet_sketch.values.size)
+        else:
+            containment, score = 0.0, 0.0
+        sheet_ranks.append(SheetRank(sheet_name=sheet_sketch.sheet_name, overlap=overlap,
+                                     containment=containment, score=float(score)))
+    sheet_ranks.sort(key=lambda sheet_rank: -sheet_rank.score)
+    return sheet_ranks
+
+
+def rank_issuer_sheets(model_binary_stream: BinaryIO, issuer_binary_stream: BinaryIO,
+                       selected_model_sheet: str, index_of_model_column_with_tags: int = 2) -> list[SheetRank]:
+    """Ранжирует страницы отчета эмитента по пересечению их числовых значений со значениями последнего
+    исторического столбца выбранной страницы аналитической модели.
+    Args:
+        :param model_binary_stream: бинарный поток XLSX файла аналитической модели
+        :type model_binary_stream: BinaryIO
+        :param issuer_binary_stream: бинарный поток XLSX файла отчета эмитента
+        :type issuer_binary_stream: BinaryIO
+        :param selected_model_sheet: название выбранной страницы аналитической модели
+        :type selected_model_sheet: str
+        :param index_of_model_column_with_tags: номер столбца с названиями статей модели; цвета заливки его ячеек
+                                                сохраняются при разборе страницы, чтобы сопоставление рядов
+                                                не разбирало модель повторно
+        :type index_of_model_column_with_tags: int
+    Returns:
+        страницы эмитента по убыванию схожести; пустой список, если в модели не найден исторический столбец
+    """
+    with measure_stage('sheet_discovery') as stage:
+        model_sheet_snapshot = load_sheet_snapshot_with_cache(
+            model_binary_stream, selected_model_sheet, data_only=True,
+            fill_column_indexes=(index_of_model_column_with_tags,))
+        sheet_sketches = load_sheet_sketches_with_cache(issuer_binary_stream)
+        stage.count('sheets', len(sheet_sketches))
+        stage.count('cells', sum(sheet_sketch.number_of_numeric_cells for sheet_sketch in sheet_sketches))
+        return rank_sheet_sketches_for_model_sheet(model_sheet_snapshot, sheet_sketches)
+
+
+def rank_sheet_sketches_for_model_sheet(model_sheet_snapshot: SheetSnapshot,
+                                        sheet_sketches: list[SheetSketch]) -> list[SheetRank]:
+    """Ранжирует наброски страниц эмитента по пересечению со значениями последнего исторического столбца
+    снимка страницы модели (загруженного в режиме data_only=True), см. rank_issuer_sheets.
+    Returns:
+        страницы эмитента по убыванию схожести; пустой список, если в модели не найден исторический столбец
+    """
+    try:
+        index_of_last_column = find_last_historical_column_number(model_sheet_snapshot)
+    except ValueError:
+        index_of_last_column = None
+    if index_of_last_column is None:
+        return []
+    return rank_sheets_by_overlap(model_sheet_snapshot.get_column(model_sheet_snapshot.numbers,
+                                                                  index_of_last_column), sheet_sketches)
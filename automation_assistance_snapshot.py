@@ -0,0 +1,170 @@
+"""Module defining a columnar NumPy snapshot of a worksheet for vectorized searching of cells."""
+
+from typing import BinaryIO
+from dataclasses import dataclass, field
+
+import numpy as np
+from openpyxl.utils.cell import get_column_letter
+
+from automation_assistance_disk_cache import (EMPTY_KIND, NUMERIC_KINDS, STRING_KIND, ColumnarSheet,
+                                              create_columnar_sheet, load_columnar_sheet_with_cache)
+from automation_assistance_workbook_cache import workbook_cache
+
+# Окончания заголовков прогнозных периодов ('П' - для российских компаний)
+FORECAST_PERIOD_MARKS = ('F', 'П')
+# Количество верхних рядов страницы, строковые значения которых сохраняются в снимке как заголовки
+NUMBER_OF_HEADER_ROWS = 10
+
+
+@dataclass
+class SheetSnapshot:
+    """Снимок страницы XLSX файла в виде матриц NumPy (ряд 1 и столбец 1 страницы - индекс 0 матриц).
+
+    Ячейки за пределами матриц считаются пустыми.
+    """
+
+    # Название страницы
+    title: str
+    # Номер первого непустого ряда страницы (аналог Worksheet.min_row)
+    min_row: int
+    # Числовые значения ячеек (int, float, bool), для остальных ячеек - NaN
+    numbers: np.ndarray
+    # Маска ячеек с числовыми значениями
+    is_numeric: np.ndarray
+    # Маска непустых ячеек (значение не None)
+    is_occupied: np.ndarray
+    # Маска строковых ячеек, заканчивающихся на обозначение прогнозного периода (F или П)
+    is_forecast_header: np.ndarray
+    # Строковые значения ячеек верхних рядов страницы (заголовки): {номер ряда: {номер столбца: строка}}
+    header_strings: dict
+    # Индексы расположения значений, построенные по требованию: {номер первого столбца: ValueLocationIndex}
+    _value_location_indexes: dict = field(default_factory=dict, init=False, repr=False)
+
+    @property
+    def max_row(self) -> int:
+        return self.numbers.shape[0]
+
+    @property
+    def max_column(self) -> int:
+        return self.numbers.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Объем памяти, занимаемый матрицами снимка."""
+        return self.numbers.nbytes + self.is_numeric.nbytes + self.is_occupied.nbytes + self.is_forecast_header.nbytes
+
+    def get_column(self, matrix: np.ndarray, column_number: int) -> np.ndarray:
+        """Отдает столбец одной из матриц снимка по номеру столбца страницы
+        (массив из пустых значений, если столбец вне снимка)."""
+        if 1 <= column_number <= self.max_column:
+            return matrix[:, column_number - 1]
+        return np.zeros(self.max_row, dtype=matrix.dtype)
+
+    @staticmethod
+    def get_coordinate(row: int, column: int) -> str:
+        return f'{get_column_letter(column)}{row}'
+
+    def get_value_location_index(self, min_column: int = 1) -> 'ValueLocationIndex':
+        """Отдает индекс расположения значений страницы (строится один раз для снимка и min_column)."""
+        if min_column not in self._value_location_indexes:
+            self._value_location_indexes[min_column] = ValueLocationIndex.from_sheet_snapshot(self, min_column)
+        return self._value_location_indexes[min_column]
+
+
+@dataclass
+class ValueLocationIndex:
+    """Индекс {числовое значение: расположение} для страницы.
+
+    Для каждого значения хранится первый столбец (при обходе столбцов слева направо), в котором оно встречается,
+    и первый ряд этого столбца с числовым значением. Значения хранятся отсортированными, поиск - бинарный.
+    """
+
+    # Отсортированные уникальные значения
+    values: np.ndarray
+    # Номер первого столбца страницы, в котором встречается значение
+    columns: np.ndarray
+    # Номер первого ряда с числовым значением в этом столбце
+    first_numeric_rows: np.ndarray
+
+    @classmethod
+    def from_sheet_snapshot(cls, sheet_snapshot: SheetSnapshot, min_column: int = 1) -> 'ValueLocationIndex':
+        is_numeric = sheet_snapshot.is_numeric[:, min_column - 1:]
+        # NaN не равен ни одному значению, поэтому в индекс не попадает
+        is_indexed = is_numeric & ~np.isnan(sheet_snapshot.numbers[:, min_column - 1:])
+        row_indexes, column_indexes = np.nonzero(is_indexed)
+        values = sheet_snapshot.numbers[:, min_column - 1:][row_indexes, column_indexes]
+        # сортируем по значению, а при равных значениях - по столбцу, и берем первое вхождение каждого значения
+        order = np.lexsort((column_indexes, values))
+        values, column_indexes = values[order], column_indexes[order]
+        is_first_occurrence = np.ones(values.size, dtype=bool)
+        is_first_occurrence[1:] = values[1:] != values[:-1]
+        values, column_indexes = values[is_first_occurrence], column_indexes[is_first_occurrence]
+        # первый ряд с числовым значением в каждом столбце (в столбце с найденным значением такой ряд всегда есть)
+        first_numeric_rows_of_columns = (is_numeric.argmax(axis=0) if is_numeric.shape[0]
+                                         else np.zeros(is_numeric.shape[1], dtype=int)) + 1
+        return cls(values=values, columns=column_indexes + min_column,
+                   first_numeric_rows=first_numeric_rows_of_columns[column_indexes])
+
+    def find_positions(self, values_to_find: np.ndarray) -> np.ndarray:
+        """Возвращает для каждого искомого значения его позицию в индексе или -1, если значение не найдено."""
+        values_to_find = np.asarray(values_to_find, dtype=float)
+        positions = np.searchsorted(self.values, values_to_find)
+        is_found = positions < self.values.size
+        is_found[is_found] = self.values[positions[is_found]] == values_to_find[is_found]
+        return np.where(is_found, positions, -1)
+
+    def get_coordinate(self, position: int) -> str:
+        """Возвращает координаты первой числовой ячейки столбца, в котором найдено значение из позиции индекса."""
+        return SheetSnapshot.get_coordinate(int(self.first_numeric_rows[position]), int(self.columns[position]))
+
+
+def create_sheet_snapshot_from_columnar_sheet(columnar_sheet: ColumnarSheet) -> SheetSnapshot:
+    """Создает снимок страницы из ее колоночного представления (числовые значения не копируются)."""
+    kinds = np.asarray(columnar_sheet.kinds)
+    is_forecast_header = np.zeros(kinds.shape, dtype=bool)
+    header_strings = {}
+    for string_number in np.flatnonzero(kinds[columnar_sheet.string_rows, columnar_sheet.string_columns]
+                                        == STRING_KIND):
+        row_index = int(columnar_sheet.string_rows[string_number])
+        column_index = int(columnar_sheet.string_columns[string_number])
+        value = columnar_sheet.get_string(string_number)
+        is_forecast_header[row_index, column_index] = value.endswith(FORECAST_PERIOD_MARKS)
+        if row_index < NUMBER_OF_HEADER_ROWS:
+            header_strings.setdefault(row_index + 1, {})[column_index + 1] = value
+    is_occupied = kinds != EMPTY_KIND
+    occupied_rows = np.flatnonzero(is_occupied.any(axis=1))
+    min_row = int(occupied_rows[0]) + 1 if occupied_rows.size else 1
+    return SheetSnapshot(title=columnar_sheet.title, min_row=min_row, numbers=columnar_sheet.numbers,
+                         is_numeric=np.isin(kinds, NUMERIC_KINDS), is_occupied=is_occupied,
+                         is_forecast_header=is_forecast_header, header_strings=header_strings)
+
+
+def create_sheet_snapshot(xlsx_binary_stream: BinaryIO, sheet_name: str, data_only: bool = False) -> SheetSnapshot:
+    """Создает снимок страницы за один потоковый проход по ней (openpyxl read_only).
+    Args:
+        :param xlsx_binary_stream: бинарный поток XLSX файла
+        :type xlsx_binary_stream: BinaryIO
+        :param sheet_name: название страницы
+        :type sheet_name: str
+        :param data_only: режим загрузки openpyxl (True - значения вместо формул)
+        :type data_only: bool
+    Returns:
+        снимок страницы
+    """
+    return create_sheet_snapshot_from_columnar_sheet(create_columnar_sheet(xlsx_binary_stream, sheet_name,
+                                                                           data_only))
+
+
+def load_sheet_snapshot_with_cache(xlsx_binary_stream: BinaryIO, sheet_name: str, data_only: bool = False,
+                                   fill_column_indexes: [list[int]|tuple[int]] = (),
+                                   use_disk_cache: bool = False) -> SheetSnapshot:
+    """Отдает снимок страницы через общий кэш разобранных файлов (по хэшу содержимого, странице и режиму);
+    колоночное представление страницы берется из load_columnar_sheet_with_cache (с теми же fill_column_indexes
+    и use_disk_cache), поэтому отчет эмитента, который уже загружался (в том числе другим пользователем),
+    повторно не разбирается, а цвета заливки, которые понадобятся позже (например, столбца с названиями статей
+    модели), сохраняются при первом разборе."""
+    return workbook_cache.get_or_create(
+        xlsx_binary_stream, ('snapshot', sheet_name, data_only),
+        lambda: create_sheet_snapshot_from_columnar_sheet(load_columnar_sheet_with_cache(
+            xlsx_binary_stream, sheet_name, data_only, fill_column_indexes, use_disk_cache)),
+        lambda sheet_snapshot: sheet_snapshot.nbytes)
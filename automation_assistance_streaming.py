@@ -0,0 +1,123 @@
+"""Module for streaming reading of XLSX sheets and workbook metadata without building the whole workbook."""
+
+import zipfile
+import posixpath
+from typing import BinaryIO, Iterable
+from dataclasses import dataclass, field
+from xml.etree import ElementTree
+
+import openpyxl
+
+from automation_assistance_jobs import PROGRESS_REPORT_INTERVAL, check_cancelled, report_progress
+
+# Пространства имен XML частей XLSX (Office Open XML)
+SPREADSHEET_NAMESPACE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+PACKAGE_RELATIONSHIPS_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+OFFICE_DOCUMENT_RELATIONSHIPS_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+OFFICE_DOCUMENT_RELATIONSHIP_TYPE = f'{OFFICE_DOCUMENT_RELATIONSHIPS_NAMESPACE}/officeDocument'
+DEFAULT_WORKBOOK_PART = 'xl/workbook.xml'
+
+
+@dataclass
+class ExtractedColumns:
+    """Класс для хранения значений нескольких столбцов одной страницы, извлеченных потоково."""
+
+    # Номера рядов (по порядку), которым соответствуют значения в списках столбцов
+    rows: list = field(default_factory=list)
+    # {номер столбца: список значений ячеек}
+    values: dict = field(default_factory=dict)
+    # {номер столбца: список цветов заливки (fgColor.index) или None для пустых ячеек}
+    fill_colors: dict = field(default_factory=dict)
+
+
+def find_workbook_part(archive: zipfile.ZipFile) -> str:
+    """Находит путь до workbook.xml внутри архива XLSX по связям пакета (_rels/.rels)."""
+    try:
+        relationships = ElementTree.fromstring(archive.read('_rels/.rels'))
+    except KeyError:
+        return DEFAULT_WORKBOOK_PART
+    for relationship in relationships.iter(f'{{{PACKAGE_RELATIONSHIPS_NAMESPACE}}}Relationship'):
+        if relationship.get('Type') == OFFICE_DOCUMENT_RELATIONSHIP_TYPE:
+            return posixpath.normpath(relationship.get('Target').lstrip('/'))
+    return DEFAULT_WORKBOOK_PART
+
+
+def read_sheetnames_from_workbook_xml(xlsx_binary_stream: BinaryIO) -> list[str]:
+    """Отдает список названий страниц, читая из архива XLSX только workbook.xml (листы не разбираются).
+    Args:
+        :param xlsx_binary_stream: бинарный поток XLSX файла
+        :type xlsx_binary_stream: BinaryIO
+    Returns:
+        список названий страниц WB в порядке их следования в файле
+    """
+    with zipfile.ZipFile(xlsx_binary_stream) as archive:
+        workbook_xml = ElementTree.fromstring(archive.read(find_workbook_part(archive)))
+    return [sheet.get('name') for sheet in workbook_xml.iter(f'{{{SPREADSHEET_NAMESPACE}}}sheet')]
+
+
+def read_sheet_parts_from_workbook_xml(archive: zipfile.ZipFile) -> dict[str, str]:
+    """Отдает пути до XML частей страниц внутри архива XLSX по workbook.xml и его связям.
+    Args:
+        :param archive: открытый архив XLSX файла
+        :type archive: zipfile.ZipFile
+    Returns:
+        словарь {название страницы: путь до части страницы в архиве} в порядке следования страниц в файле
+    """
+    workbook_part = find_workbook_part(archive)
+    workbook_folder, workbook_file_name = posixpath.split(workbook_part)
+    workbook_xml = ElementTree.fromstring(archive.read(workbook_part))
+    relationships = ElementTree.fromstring(archive.read(posixpath.join(workbook_folder, '_rels',
+                                                                       f'{workbook_file_name}.rels')))
+    targets = {}
+    for relationship in relationships.iter(f'{{{PACKAGE_RELATIONSHIPS_NAMESPACE}}}Relationship'):
+        target = relationship.get('Target')
+        # путь может быть абсолютным (от корня архива) или относительным (от папки workbook.xml)
+        targets[relationship.get('Id')] = posixpath.normpath(target.lstrip('/') if target.startswith('/')
+                                                             else posixpath.join(workbook_folder, target))
+    return {sheet.get('name'): targets[sheet.get(f'{{{OFFICE_DOCUMENT_RELATIONSHIPS_NAMESPACE}}}id')]
+            for sheet in workbook_xml.iter(f'{{{SPREADSHEET_NAMESPACE}}}sheet')}
+
+
+def read_rows_of_sheets(xlsx_binary_stream: BinaryIO, sheet_names: Iterable[str], *, data_only: bool = False,
+                        fill_column_indexes: [list[int]|tuple[int]] = ()) -> dict[str, tuple[list, dict]]:
+    """Потоково (openpyxl read_only) читает значения всех ячеек нескольких страниц, открывая файл один раз
+    (стили и общие строки файла разбираются один раз для всех страниц).
+    Args:
+        :param xlsx_binary_stream: бинарный поток XLSX файла
+        :type xlsx_binary_stream: BinaryIO
+        :param sheet_names: названия страниц
+        :type sheet_names: Iterable[str]
+        :param data_only: режим загрузки openpyxl (True - значения вместо формул)
+        :type data_only: bool
+        :param fill_column_indexes: номера столбцов, для которых нужен цвет заливки ячеек
+        :type fill_column_indexes: list[int] | tuple[int]
+    Returns:
+        словарь {название страницы: (кортежи значений рядов начиная с первого,
+                                     {номер столбца: список цветов заливки по рядам})}
+    """
+    check_cancelled()
+    workbook = openpyxl.load_workbook(xlsx_binary_stream, read_only=True, data_only=data_only)
+    try:
+        rows_of_sheets = {}
+        for sheet_name in sheet_names:
+            # отмена проверяется и перед каждой страницей: в небольших страницах меньше PROGRESS_REPORT_INTERVAL рядов
+            check_cancelled()
+            worksheet = workbook[sheet_name]
+            # размер страницы из файла может быть записан неверно - читаем все ряды, которые есть в XML
+            worksheet.reset_dimensions()
+            rows, fill_colors = [], {column_index: [] for column_index in fill_column_indexes}
+            # объекты ячеек (для заливки) создаются, только если нужен цвет заливки
+            for row in worksheet.iter_rows(values_only=not fill_column_indexes):
+                if fill_column_indexes:
+                    for column_index in fill_column_indexes:
+                        # у отсутствующих в файле ячеек (EmptyCell и ячейки за концом ряда) заливки нет
+                        cell_fill = row[column_index - 1].fill if column_index <= len(row) else None
+                        fill_colors[column_index].append(cell_fill.fgColor.index if cell_fill else None)
+                    row = tuple(cell.value for cell in row)
+                rows.append(row)
+                if len(rows) % PROGRESS_REPORT_INTERVAL == 0:
+                    report_progress('workbook_parsing', len(rows))
+            rows_of_sheets[sheet_name] = rows, fill_colors
+        return rows_of_sheets
+    finally:
+        workbook.close()
@@ -0,0 +1,169 @@
+"""Module for generating synthetic model/issuer XLSX pairs and statement-tag configs of a parametrized size."""
+
+import random
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+
+import openpyxl
+
+# Первый исторический год в заголовках периодов модели
+FIRST_YEAR = 2000
+# Названия конфигов, которые использует add_similar_statement_tags_from_config
+CONFIG_NAMES = ('balance_config.ini', 'income_config.ini', 'segments_config.ini', 'cashflow_config.ini')
+CONFIG_SECTIONS = ('XBRL template', 'XLSX statements', 'PDF statements')
+# Доля нулевых значений в модели (нули сопоставляются со всеми нулями эмитента, поэтому их немного)
+ZERO_VALUE_SHARE = 0.02
+# Слова для построения правдоподобных названий статей
+TAG_WORDS = ('Денежные', 'средства', 'эквиваленты', 'Выручка', 'Себестоимость', 'продаж', 'Прочие', 'доходы',
+             'расходы', 'Запасы', 'Дебиторская', 'задолженность', 'Кредиторская', 'Основные', 'Нематериальные',
+             'активы', 'обязательства', 'Капитал', 'резервы', 'налог', 'прибыль', 'Финансовые', 'вложения',
+             'долгосрочные', 'краткосрочные', 'Займы', 'кредиты', 'Амортизация', 'Проценты', 'к', 'уплате')
+
+
+@dataclass
+class SyntheticDataSize:
+    """Параметры размера синтетических данных."""
+
+    # Название размера (для отчетов бенчмарка)
+    name: str
+    # Количество рядов со статьями на странице модели и эмитента
+    rows: int
+    # Количество исторических периодов (столбцов) модели
+    periods: int
+    # Количество страниц в каждом файле
+    sheets: int
+    # Количество вариантов названий в каждом разделе каждого конфига
+    config_variants: int
+    # Количество прогнозных периодов (F) модели
+    forecast_periods: int = 3
+    # Доля значений страницы эмитента, которые встречаются и в модели
+    overlap: float = 0.7
+
+
+SIZES = {
+    'small': SyntheticDataSize(name='small', rows=200, periods=8, sheets=3, config_variants=2_000),
+    'medium': SyntheticDataSize(name='medium', rows=2_000, periods=15, sheets=10, config_variants=20_000),
+    'large': SyntheticDataSize(name='large', rows=8_000, periods=25, sheets=50, config_variants=60_000),
+}
+
+
+def create_tag(randomizer: random.Random, number: int) -> str:
+    """Создает название статьи из случайных слов (номер делает название уникальным)."""
+    return ' '.join(randomizer.choice(TAG_WORDS) for _ in range(randomizer.randint(2, 5))) + f' {number}'
+
+
+def fill_model_sheet(worksheet, randomizer: random.Random, size: SyntheticDataSize) -> list[tuple[str, list]]:
+    """Заполняет страницу модели: названия периодов во втором ряду (прогнозные - с отметкой F),
+    названия статей во втором столбце, значения с четвертого ряда. Возвращает ряды (название, значения)."""
+    worksheet.cell(row=2, column=2, value='Статья')
+    for period in range(size.periods + size.forecast_periods):
+        year = FIRST_YEAR + period
+        worksheet.cell(row=2, column=3 + period, value=f'{year}F' if period >= size.periods else str(year))
+    rows = []
+    for row_number in range(size.rows):
+        tag = create_tag(randomizer, row_number)
+        # часть значений - дробные, изредка - нули, как в реальных моделях
+        values = [0 if randomizer.random() < ZERO_VALUE_SHARE
+                  else randomizer.choice((round(randomizer.uniform(1, 1e6), 2), randomizer.randint(1, 10**6)))
+                  for _ in range(size.periods + size.forecast_periods)]
+        worksheet.cell(row=4 + row_number, column=2, value=tag)
+        for period, value in enumerate(values):
+            worksheet.cell(row=4 + row_number, column=3 + period, value=value)
+        rows.append((tag, values[:size.periods]))
+    return rows
+
+
+def fill_issuer_sheet(worksheet, randomizer: random.Random, size: SyntheticDataSize,
+                      model_rows: list[tuple[str, list]]):
+    """Заполняет страницу эмитента: названия статей в первом столбце, значения периодов (от последнего
+    исторического периода модели к более ранним) начиная со второго столбца и второго ряда.
+    Доля size.overlap рядов повторяет значения модели, остальные - случайные."""
+    worksheet.cell(row=1, column=1, value='Наименование показателя')
+    number_of_issuer_periods = min(size.periods, 3)
+    for period in range(number_of_issuer_periods):
+        worksheet.cell(row=1, column=2 + period, value=str(FIRST_YEAR + size.periods - 1 - period))
+    shuffled_rows = model_rows[:]
+    randomizer.shuffle(shuffled_rows)
+    for row_number, (model_tag, model_values) in enumerate(shuffled_rows):
+        is_overlapping = randomizer.random() < size.overlap
+        worksheet.cell(row=2 + row_number, column=1,
+                       value=model_tag.lower() if is_overlapping else create_tag(randomizer, -row_number))
+        for period in range(number_of_issuer_periods):
+            value = model_values[-1 - period] if is_overlapping else randomizer.randint(1, 10**6)
+            worksheet.cell(row=2 + row_number, column=2 + period, value=value)
+
+
+def generate_workbooks(size: SyntheticDataSize, output_folder: Path, seed: int = 0) -> tuple[Path, Path]:
+    """Создает пару файлов модели и эмитента заданного размера.
+    Args:
+        :param size: параметры размера
+        :type size: SyntheticDataSize
+        :param output_folder: папка для файлов
+        :type output_folder: Path
+        :param seed: зерно генератора случайных чисел (для воспроизводимости)
+        :type seed: int
+    Returns:
+        пути до файла модели и файла эмитента
+    """
+    randomizer = random.Random(seed)
+    model_workbook, issuer_workbook = openpyxl.Workbook(), openpyxl.Workbook()
+    model_workbook.active.title = 'Model'
+    issuer_workbook.active.title = 'page-1-table-1'
+    model_rows = fill_model_sheet(model_workbook.active, randomizer, size)
+    fill_issuer_sheet(issuer_workbook.active, randomizer, size, model_rows)
+    # остальные страницы - независимые данные того же размера
+    for sheet_number in range(2, size.sheets + 1):
+        other_model_rows = fill_model_sheet(model_workbook.create_sheet(f'Model {sheet_number}'), randomizer, size)
+        fill_issuer_sheet(issuer_workbook.create_sheet(f'page-{sheet_number}-table-1'), randomizer, size,
+                          other_model_rows)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    path_to_model = output_folder.joinpath(f'model_{size.name}.xlsx')
+    path_to_issuer = output_folder.joinpath(f'issuer_{size.name}.xlsx')
+    model_workbook.save(path_to_model)
+    issuer_workbook.save(path_to_issuer)
+    return path_to_model, path_to_issuer
+
+
+def generate_configs(size: SyntheticDataSize, output_folder: Path, seed: int = 0, variants_per_key: int = 5):
+    """Создает конфиги (balance_config.ini и др.) с size.config_variants вариантами названий в каждом разделе.
+    Args:
+        :param size: параметры размера
+        :type size: SyntheticDataSize
+        :param output_folder: папка для конфигов
+        :type output_folder: Path
+        :param seed: зерно генератора случайных чисел (для воспроизводимости)
+        :type seed: int
+        :param variants_per_key: количество вариантов названий (строк в правой части) для одной статьи
+        :type variants_per_key: int
+    """
+    randomizer = random.Random(seed)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    number_of_keys = max(1, size.config_variants // variants_per_key)
+    for config_name in CONFIG_NAMES:
+        lines = ['[DEFAULTS]', 'is_cumulative=False', '']
+        for section in CONFIG_SECTIONS:
+            lines.append(f'[{section}]')
+            for key_number in range(number_of_keys):
+                variants = [create_tag(randomizer, key_number * variants_per_key + variant_number)
+                            for variant_number in range(variants_per_key)]
+                lines.append(f'{create_tag(randomizer, key_number)}={variants[0]}')
+                lines.extend(f'    {variant}' for variant in variants[1:])
+            lines.append('')
+        output_folder.joinpath(config_name).write_text('\n'.join(lines), encoding='UTF-8')
+
+
+def main(arguments: list[str] = None):
+    """Точка входа командной строки генератора синтетических данных."""
+    parser = argparse.ArgumentParser(description='Генерация синтетических файлов модели, эмитента и конфигов.')
+    parser.add_argument('output_folder', type=Path, help='папка для сгенерированных файлов')
+    parser.add_argument('--size', choices=SIZES, default='small', help='размер данных')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора случайных чисел')
+    parsed_arguments = parser.parse_args(arguments)
+    size = SIZES[parsed_arguments.size]
+    generate_workbooks(size, parsed_arguments.output_folder, parsed_arguments.seed)
+    generate_configs(size, parsed_arguments.output_folder, parsed_arguments.seed)
+
+
+if __name__ == '__main__':
+    main()
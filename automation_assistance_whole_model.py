@@ -0,0 +1,227 @@
+"""Module for processing all statement blocks of a model in one pass with shared workbook loads.
+
+Страницы аналитической модели сопоставляются с блоками статей по названию (Баланс/Balance, ОПУ/Income и т.д.).
+Для каждой такой страницы страница эмитента выбирается по пересечению числовых значений, затем ищутся ячейки
+для начала обработки, сопоставляются статьи и ищутся названия в конфиге блока. До запуска потоков все нужные
+страницы модели разбираются за один проход по файлу модели, а выбранные страницы эмитента - за один проход
+по файлу эмитента; снимки страниц передаются потокам, а извлечение столбцов для сопоставления берет
+разобранные страницы из общих кэшей. Параллельно в потоках идут только поиск ячеек для начала обработки,
+сопоставление статей и поиск названий в конфиге.
+"""
+
+import os
+import re
+import contextvars
+from io import BytesIO
+from typing import BinaryIO, Hashable
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from automation_assistance import find_addresses_of_start, get_sheetnames_with_binary_stream
+from automation_assistance_disk_cache import load_columnar_sheets_with_cache
+from automation_assistance_exceptions import JobCancelled
+from automation_assistance_instrumentation import measure_stage
+from automation_assistance_jobs import report_result
+from automation_assistance_mapping_store import MappingStore, iter_equivalents_with_mapping_store
+from automation_assistance_sheet_discovery import load_sheet_sketches_with_cache, rank_sheet_sketches_for_model_sheet
+from automation_assistance_snapshot import SheetSnapshot, load_sheet_snapshot_with_cache
+from automation_assistance_workbook_cache import read_binary_stream
+
+# Количество потоков, обрабатывающих страницы модели
+DEFAULT_MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Номер столбца с названиями статей модели (цвета заливки его ячеек нужны при сопоставлении)
+INDEX_OF_MODEL_COLUMN_WITH_TAGS = 2
+# Признаки блока статей в названии страницы модели (без учета регистра), проверяются по порядку
+STATEMENT_BLOCK_TITLE_PATTERNS = {
+    'Баланс': re.compile(r'баланс|balance', re.IGNORECASE),
+    'Финансовые результаты': re.compile(r'финансов\w* результат|\bопу\b|income|profit|\bp\s*&\s*l\b', re.IGNORECASE),
+    'Отчет о движении денежных средств': re.compile(r'движени\w* денежн|\bддс\b|cash', re.IGNORECASE),
+    'Сегменты': re.compile(r'сегмент|segment', re.IGNORECASE),
+}
+
+
+@dataclass
+class StatementBlockResult:
+    """Результат обработки одной страницы модели в режиме всей модели."""
+
+    model_sheet: str
+    statement_block: str
+    # Номер страницы среди обрабатываемых страниц модели (результаты передаются по мере готовности,
+    # по номеру восстанавливается порядок страниц в файле)
+    sheet_number: int = 0
+    issuer_sheet: str | None = None
+    model_address_of_start: str | None = None
+    issuer_address_of_start: str | None = None
+    # Объекты Equivalent и ProblemRow
+    items: list = field(default_factory=list)
+    # Описание ошибки, если страницу обработать не удалось (остальные страницы обрабатываются)
+    error: str | None = None
+
+
+def detect_statement_block(sheet_name: str) -> str | None:
+    """Определяет блок статей по названию страницы модели (None, если название не похоже ни на один блок)."""
+    for statement_block, title_pattern in STATEMENT_BLOCK_TITLE_PATTERNS.items():
+        if title_pattern.search(sheet_name):
+            return statement_block
+    return None
+
+
+def map_model_sheets_to_statement_blocks(sheet_names: list[str]) -> dict[str, str]:
+    """Отдает словарь {название страницы модели: блок статей} для страниц, блок которых определен по названию
+    (в порядке следования страниц в файле)."""
+    statement_blocks_of_sheets = {sheet_name: detect_statement_block(sheet_name) for sheet_name in sheet_names}
+    return {sheet_name: statement_block for sheet_name, statement_block in statement_blocks_of_sheets.items()
+            if statement_block}
+
+
+def process_statement_block(model_binary_stream: BinaryIO, issuer_binary_stream: BinaryIO,
+                            result: StatementBlockResult, model_sheet_snapshot: SheetSnapshot,
+                            issuer_sheet_snapshot: SheetSnapshot, *, data_source: str, issuer: str | None = None,
+                            mapping_store: MappingStore | None = None, multi_period_mode: bool = False,
+                            matching_options: dict = None, config_lookup_options: dict = None,
+                            run_key: Hashable = None) -> StatementBlockResult:
+    """Обрабатывает одну страницу модели, для которой уже выбрана страница эмитента: поиск ячеек для начала
+    обработки по переданным снимкам страниц, сопоставление статей и поиск названий в конфиге блока.
+    Страницы уже разобраны (см. process_whole_model), поэтому файлы здесь повторно не читаются.
+    Args:
+        :param model_binary_stream: бинарный поток XLSX файла аналитической модели (свой у каждого потока)
+        :type model_binary_stream: BinaryIO
+        :param issuer_binary_stream: бинарный поток XLSX файла отчета эмитента (свой у каждого потока)
+        :type issuer_binary_stream: BinaryIO
+        :param result: результат страницы с заполненными страницей модели, блоком статей и страницей эмитента
+        :type result: StatementBlockResult
+        :param model_sheet_snapshot: снимок страницы модели (data_only=True)
+        :type model_sheet_snapshot: SheetSnapshot
+        :param issuer_sheet_snapshot: снимок страницы эмитента (data_only=True)
+        :type issuer_sheet_snapshot: SheetSnapshot
+        остальные параметры - как у process_whole_model
+    Returns:
+        результат обработки страницы; ошибка записывается в результат и не прерывает обработку других страниц
+    """
+    try:
+        with measure_stage('start_cell_detection'):
+            addresses_of_start = find_addresses_of_start(model_sheet_snapshot, issuer_sheet_snapshot)
+        if not addresses_of_start or not all(addresses_of_start):
+            result.error = 'Не найдены ячейки для начала обработки'
+            return result
+        result.model_address_of_start, result.issuer_address_of_start = addresses_of_start
+        result.items = list(iter_equivalents_with_mapping_store(
+            mapping_store, issuer, statement_block=result.statement_block, data_source=data_source,
+            multi_period_mode=multi_period_mode, matching_options=matching_options,
+            config_lookup_options=config_lookup_options, run_key=run_key,
+            model_binary_stream=model_binary_stream, issuer_binary_stream=issuer_binary_stream,
+            selected_model_sheet=result.model_sheet, selected_issuer_sheet=result.issuer_sheet,
+            model_address_of_start=result.model_address_of_start,
+            issuer_address_of_start=result.issuer_address_of_start,
+            index_of_model_column_with_tags=INDEX_OF_MODEL_COLUMN_WITH_TAGS))
+    except JobCancelled:
+        raise
+    except Exception as error:
+        result.error = f'{type(error).__name__}: {error}'
+    return result
+
+
+def process_whole_model(model_binary_stream: BinaryIO, issuer_binary_stream: BinaryIO, *, data_source: str,
+                        issuer: str | None = None, mapping_store: MappingStore | None = None,
+                        multi_period_mode: bool = False, matching_options: dict = None,
+                        config_lookup_options: dict = None, run_key: Hashable = None,
+                        max_workers: int = DEFAULT_MAX_WORKERS) -> list[StatementBlockResult]:
+    """Обрабатывает все страницы модели, блок статей которых определяется по названию: страницы модели
+    и выбранные страницы эмитента разбираются один раз, затем страницы обрабатываются параллельно.
+    Результат каждой страницы передается в фоновое задание (report_result) сразу после ее обработки.
+    Args:
+        :param model_binary_stream: бинарный поток XLSX файла аналитической модели
+        :type model_binary_stream: BinaryIO
+        :param issuer_binary_stream: бинарный поток XLSX файла отчета эмитента
+        :type issuer_binary_stream: BinaryIO
+        :param data_source: источник данных (определяет раздел конфигов)
+        :type data_source: str
+        :param issuer: эмитент (None или пустая строка - не использовать хранилище подтвержденных пар)
+        :type issuer: str | None
+        :param mapping_store: хранилище подтвержденных пар
+        :type mapping_store: MappingStore | None
+        :param multi_period_mode: сопоставлять ли ряды по всем историческим периодам модели
+        :type multi_period_mode: bool
+        :param matching_options: параметры сравнения значений (допустимое отклонение, определение масштаба)
+        :type matching_options: dict
+        :param config_lookup_options: параметры поиска в конфиге (ранжированный поиск, top_k, min_score)
+        :type config_lookup_options: dict
+        :param run_key: ключ запуска для повторного использования результатов предыдущего запуска
+                        (см. automation_assistance_incremental)
+        :type run_key: Hashable
+        :param max_workers: количество потоков
+        :type max_workers: int
+    Returns:
+        результаты по страницам модели в порядке их следования в файле
+    """
+    model_content = read_binary_stream(model_binary_stream)
+    issuer_content = read_binary_stream(issuer_binary_stream)
+    with measure_stage('sheet_mapping') as stage:
+        statement_blocks_of_model_sheets = map_model_sheets_to_statement_blocks(
+            get_sheetnames_with_binary_stream(model_binary_stream))
+        stage.count('model_sheets', len(statement_blocks_of_model_sheets))
+    if not statement_blocks_of_model_sheets:
+        return []
+    results = [StatementBlockResult(model_sheet=model_sheet, statement_block=statement_block,
+                                    sheet_number=sheet_number)
+               for sheet_number, (model_sheet, statement_block)
+               in enumerate(statement_blocks_of_model_sheets.items())]
+
+    # все страницы модели разбираются за один проход по файлу (вместе с цветами заливки столбца с названиями
+    # статей - они нужны при сопоставлении)
+    with measure_stage('workbook_parsing') as stage:
+        model_columnar_sheets = load_columnar_sheets_with_cache(
+            model_binary_stream, list(statement_blocks_of_model_sheets), data_only=True,
+            fill_column_indexes=(INDEX_OF_MODEL_COLUMN_WITH_TAGS,))
+        count_columnar_sheet_cells(stage, *model_columnar_sheets.values())
+    model_sheet_snapshots = {model_sheet: load_sheet_snapshot_with_cache(model_binary_stream, model_sheet,
+                                                                         data_only=True)
+                             for model_sheet in model_columnar_sheets}
+
+    # наброски страниц эмитента строятся один раз, страница эмитента выбирается для каждой страницы модели
+    with measure_stage('sheet_discovery') as stage:
+        sheet_sketches = load_sheet_sketches_with_cache(issuer_binary_stream)
+        stage.count('sheets', len(sheet_sketches))
+        for result in results:
+            sheet_ranks = rank_sheet_sketches_for_model_sheet(model_sheet_snapshots[result.model_sheet],
+                                                              sheet_sketches)
+            if sheet_ranks and sheet_ranks[0].overlap:
+                result.issuer_sheet = sheet_ranks[0].sheet_name
+            else:
+                result.error = 'Не найдена страница эмитента со значениями этой страницы модели'
+
+    # выбранные страницы эмитента (одна страница может подойти нескольким страницам модели) разбираются
+    # за один проход по файлу
+    issuer_sheets = [result.issuer_sheet for result in results if result.issuer_sheet]
+    with measure_stage('workbook_parsing') as stage:
+        issuer_columnar_sheets = load_columnar_sheets_with_cache(issuer_binary_stream, issuer_sheets, data_only=True,
+                                                                 use_disk_cache=True)
+        count_columnar_sheet_cells(stage, *issuer_columnar_sheets.values())
+    issuer_sheet_snapshots = {issuer_sheet: load_sheet_snapshot_with_cache(issuer_binary_stream, issuer_sheet,
+                                                                           data_only=True, use_disk_cache=True)
+                              for issuer_sheet in issuer_columnar_sheets}
+
+    for result in results:
+        if result.error:
+            report_result(result)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # у каждого потока свои бинарные потоки (позиция чтения не делится между потоками) и своя копия
+        # контекста (замеры этапов и фоновое задание, которому сообщается прогресс)
+        futures = [executor.submit(contextvars.copy_context().run, process_statement_block,
+                                   BytesIO(model_content), BytesIO(issuer_content), result,
+                                   model_sheet_snapshots[result.model_sheet],
+                                   issuer_sheet_snapshots[result.issuer_sheet],
+                                   data_source=data_source, issuer=issuer, mapping_store=mapping_store,
+                                   multi_period_mode=multi_period_mode, matching_options=matching_options,
+                                   config_lookup_options=config_lookup_options, run_key=run_key)
+                   for result in results if not result.error]
+        for future in as_completed(futures):
+            report_result(future.result())
+    return results
+
+
+def count_columnar_sheet_cells(stage, *columnar_sheets):
+    """Добавляет в счетчики этапа количество рядов и ячеек разобранных страниц."""
+    for columnar_sheet in columnar_sheets:
+        stage.count('rows', columnar_sheet.max_row)
+        stage.count('cells', columnar_sheet.kinds.size)
@@ -0,0 +1,141 @@
+"""Module for caching data parsed from XLSX files (snapshots, columns, sheet sketches), so that one uploaded file
+is parsed once per load mode."""
+
+import os
+import weakref
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable
+
+# Ограничение суммарного (оценочного) объема памяти, занимаемого закэшированными объектами
+MAX_CACHE_SIZE_IN_BYTES = 1024 * 1024 * 1024
+
+# {объект потока: (размер содержимого, хэш)} - запись удаляется вместе с потоком
+_hashes_of_binary_streams = weakref.WeakKeyDictionary()
+_hashes_lock = threading.Lock()
+
+
+def read_binary_stream(binary_stream: BinaryIO) -> bytes:
+    """Возвращает все содержимое бинарного потока, не сдвигая его текущую позицию."""
+    if hasattr(binary_stream, 'getvalue'):
+        return binary_stream.getvalue()
+    position = binary_stream.tell()
+    binary_stream.seek(0)
+    content = binary_stream.read()
+    binary_stream.seek(position)
+    return content
+
+
+def get_hash_of_binary_stream(binary_stream: BinaryIO) -> str:
+    """Возвращает SHA-256 содержимого бинарного потока (hex). Хэш считается один раз на объект потока
+    (и пересчитывается, только если изменился размер содержимого): к кэшу обращаются много раз
+    за обработку - по каждой странице, виду объекта и потоку."""
+    size = get_size_of_binary_stream(binary_stream)
+    with _hashes_lock:
+        size_and_hash = _hashes_of_binary_streams.get(binary_stream)
+    if size_and_hash is not None and size_and_hash[0] == size:
+        return size_and_hash[1]
+    if hasattr(binary_stream, 'getbuffer'):
+        # getbuffer не копирует содержимое BytesIO
+        with binary_stream.getbuffer() as buffer:
+            file_hash = hashlib.sha256(buffer).hexdigest()
+    else:
+        file_hash = hashlib.sha256(read_binary_stream(binary_stream)).hexdigest()
+    with _hashes_lock:
+        _hashes_of_binary_streams[binary_stream] = size, file_hash
+    return file_hash
+
+
+def get_size_of_binary_stream(binary_stream: BinaryIO) -> int:
+    """Возвращает размер содержимого бинарного потока, не читая его и не сдвигая текущую позицию."""
+    if hasattr(binary_stream, 'getbuffer'):
+        with binary_stream.getbuffer() as buffer:
+            return buffer.nbytes
+    position = binary_stream.tell()
+    size = binary_stream.seek(0, os.SEEK_END)
+    binary_stream.seek(position)
+    return size
+
+
+class WorkbookCache:
+    """LRU кэш объектов, полученных разбором XLSX файла, с ограничением по оценочному объему памяти.
+
+    Ключ - хэш содержимого файла и вид объекта с параметрами разбора (например, режим загрузки data_only),
+    поэтому один и тот же загруженный файл разбирается не больше одного раза для формул и одного раза для значений.
+    """
+
+    def __init__(self, max_size_in_bytes: int = MAX_CACHE_SIZE_IN_BYTES):
+        self.max_size_in_bytes = max_size_in_bytes
+        self.current_size_in_bytes = 0
+        # {(хэш, вид объекта): (объект, оценочный объем)}, последний элемент - последний использованный
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, binary_stream: BinaryIO, kind: tuple, create: Callable[[], Any],
+                      estimate_size: Callable[[Any], int]) -> Any:
+        """Отдает из кэша объект, полученный разбором бинарного потока, или создает его и кладет в кэш.
+        Args:
+            :param binary_stream: бинарный поток XLSX файла
+            :type binary_stream: BinaryIO
+            :param kind: вид объекта и параметры разбора, вместе с хэшем содержимого образуют ключ кэша
+            :type kind: tuple
+            :param create: функция, создающая объект
+            :type create: Callable
+            :param estimate_size: функция, оценивающая объем памяти, занимаемый объектом
+            :type estimate_size: Callable
+        Returns:
+            объект из кэша или только что созданный объект (если объект одновременно создали несколько потоков,
+            все они получают тот, что попал в кэш первым)
+        """
+        key = (get_hash_of_binary_stream(binary_stream), kind)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        parsed_object = create()
+        return self._put(key, parsed_object, estimate_size(parsed_object))
+
+    def get(self, binary_stream: BinaryIO, kind: tuple) -> Any:
+        """Отдает объект из кэша, не создавая его (None, если объекта в кэше нет)."""
+        key = (get_hash_of_binary_stream(binary_stream), kind)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, binary_stream: BinaryIO, kind: tuple, parsed_object: Any, size_in_bytes: int,
+            replace: bool = False) -> Any:
+        """Кладет в кэш объект, созданный разбором бинарного потока (например, при разборе нескольких страниц
+        за один проход). Параметры - как у get_or_create; replace - заменить объект, если он уже есть в кэше
+        (например, объект, разобранный с дополнительными данными).
+        Returns:
+            объект из кэша, если его уже положил другой поток (и replace=False), иначе - переданный объект
+        """
+        return self._put((get_hash_of_binary_stream(binary_stream), kind), parsed_object, size_in_bytes, replace)
+
+    def _put(self, key: tuple, parsed_object: Any, size_in_bytes: int, replace: bool = False) -> Any:
+        with self._lock:
+            if key in self._entries and replace:
+                self.current_size_in_bytes -= self._entries.pop(key)[1]
+            if key in self._entries:
+                # пока файл разбирался, его уже положил в кэш другой поток - отдаем закэшированный объект
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self._entries[key] = (parsed_object, size_in_bytes)
+            self.current_size_in_bytes += size_in_bytes
+            # вытесняем давно не использованные объекты, но только что созданный оставляем в любом случае
+            while self.current_size_in_bytes > self.max_size_in_bytes and len(self._entries) > 1:
+                _, (_, evicted_size_in_bytes) = self._entries.popitem(last=False)
+                self.current_size_in_bytes -= evicted_size_in_bytes
+            return parsed_object
+
+    def clear(self):
+        """Очищает кэш."""
+        with self._lock:
+            self._entries.clear()
+            self.current_size_in_bytes = 0
+
+
+workbook_cache = WorkbookCache()
@@ -1,14 +1,103 @@
 """ Module defining web graphic user interface for Automation assistance. """
 
+import time
+import uuid
 import streamlit as st
 from io import BytesIO
 
-from automation_assistance import (get_sheetnames_with_binary_stream,
-                                   tags_equations_creator,
+from automation_assistance import (Equivalent,
+                                   ProblemRow,
+                                   get_sheetnames_with_binary_stream,
                                    check_cell_address_input,
-                                   add_similar_statement_tags_from_config,
                                    specify_function_for_cell_address_searching)
-from automation_assistance_exceptions import EmptyTagCellInModel
+from automation_assistance_exceptions import JobQueueIsFull
+from automation_assistance_instrumentation import enable_json_logging
+from automation_assistance_jobs import JobManager, report_result
+from automation_assistance_mapping_store import MappingStore, iter_equivalents_with_mapping_store
+from automation_assistance_sheet_discovery import rank_issuer_sheets
+from automation_assistance_workbook_cache import get_hash_of_binary_stream
+from automation_assistance_whole_model import StatementBlockResult, process_whole_model
+
+
+@st.cache_data(show_spinner=False)
+def get_cached_sheetnames(file_hash: str, _xlsx_binary_stream: BytesIO) -> list[str]:
+    """Кэширует список названий страниц по хэшу содержимого файла
+    (сам поток не хэшируется Streamlit - параметр начинается с подчеркивания)."""
+    return get_sheetnames_with_binary_stream(_xlsx_binary_stream)
+
+
+@st.cache_data(show_spinner=False)
+def get_cached_default_addresses_of_start(model_file_hash: str, issuer_file_hash: str,
+                                          selected_model_sheet: str, selected_issuer_sheet: str,
+                                          _model_binary_stream: BytesIO,
+                                          _issuer_binary_stream: BytesIO) -> tuple[str, str]:
+    """Кэширует адреса ячеек для начала обработки по хэшам файлов и выбранным страницам, чтобы
+    перезапуск скрипта Streamlit при каждом изменении виджета не повторял поиск по столбцам."""
+    return specify_function_for_cell_address_searching(_model_binary_stream, _issuer_binary_stream,
+                                                       selected_model_sheet, selected_issuer_sheet)
+
+
+@st.cache_data(show_spinner=False)
+def get_cached_issuer_sheet_scores(model_file_hash: str, issuer_file_hash: str, selected_model_sheet: str,
+                                   _model_binary_stream: BytesIO, _issuer_binary_stream: BytesIO) -> dict[str, float]:
+    """Кэширует ранжирование страниц эмитента по пересечению значений с выбранной страницей модели.
+    Returns:
+        словарь {название страницы эмитента: доля найденных значений модели} по убыванию схожести страниц
+    """
+    return {sheet_rank.sheet_name: sheet_rank.containment
+            for sheet_rank in rank_issuer_sheets(_model_binary_stream, _issuer_binary_stream, selected_model_sheet)}
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Общий для всех сессий пул фоновой обработки (один на процесс сервера Streamlit)."""
+    return JobManager()
+
+
+@st.cache_resource
+def get_mapping_store() -> MappingStore:
+    """Хранилище подтвержденных аналитиками пар названий статей (файл задается переменной окружения
+    AUTOMATION_ASSISTANCE_MAPPING_STORE)."""
+    return MappingStore()
+
+
+def process_files(*, issuer: str, multi_period_mode: bool, statement_block: str, data_source: str,
+                  matching_options: dict, config_lookup_options: dict, run_key: tuple,
+                  **creator_arguments):
+    """Обработка файлов в фоновом потоке: сопоставление статей модели и эмитента и поиск названий в конфиге.
+    Пары, подтвержденные ранее для эмитента, берутся из хранилища без повторного сопоставления.
+    Каждый результат сразу передается в задание (report_result), чтобы страница показывала его до конца обработки;
+    частичные результаты задания - единственный список результатов, отдельно они не накапливаются.
+    При повторной отправке тех же файлов сопоставляются только изменившиеся ряды.
+    Args:
+        :param issuer: эмитент (пустая строка - не использовать хранилище подтвержденных пар)
+        :type issuer: str
+        :param multi_period_mode: сопоставлять ли ряды по всем историческим периодам модели
+        :type multi_period_mode: bool
+        :param statement_block: блок статей (определяет конфиг)
+        :type statement_block: str
+        :param data_source: источник данных (определяет раздел конфига)
+        :type data_source: str
+        :param matching_options: параметры сравнения значений (допустимое отклонение, определение масштаба)
+        :type matching_options: dict
+        :param config_lookup_options: параметры поиска в конфиге (ранжированный нечеткий поиск)
+        :type config_lookup_options: dict
+        :param run_key: ключ запуска (сессия и имена загруженных файлов) для повторного использования результатов
+                        предыдущей обработки
+        :type run_key: tuple
+        :param creator_arguments: файлы, страницы и адреса ячеек для начала обработки
+    """
+    # в режиме нескольких периодов ряды сопоставляются по значениям за все исторические периоды;
+    # к новым парам добавляются названия статей из других аналитических моделей (из конфига),
+    # если в соответствующих им статьях (справа в конфиге) есть совпадение
+    # с переданным названием статьи у эмитента
+    for item in iter_equivalents_with_mapping_store(get_mapping_store(), issuer,
+                                                    statement_block=statement_block, data_source=data_source,
+                                                    multi_period_mode=multi_period_mode,
+                                                    matching_options=matching_options,
+                                                    config_lookup_options=config_lookup_options,
+                                                    run_key=run_key, **creator_arguments):
+        report_result(item)
 
 
 def change_app_status(new_status: str = None):
@@ -35,8 +124,10 @@ def page_before_updating():
                                                        type=source, accept_multiple_files=False)
         if st.session_state.model_file:
             st.session_state.model_binary_stream = BytesIO(st.session_state.model_file.getvalue())
+            st.session_state.model_file_hash = get_hash_of_binary_stream(st.session_state.model_binary_stream)
             #получаем названия страниц загруженного XLSX файла
-            st.session_state.model_sheet_names = get_sheetnames_with_binary_stream(st.session_state.model_binary_stream)
+            st.session_state.model_sheet_names = get_cached_sheetnames(st.session_state.model_file_hash,
+                                                                       st.session_state.model_binary_stream)
             st.session_state.selected_model_sheet = st.selectbox('Выберите название листа для сравнения в файле аналитической модели',
                                                                  st.session_state.model_sheet_names)
     with column_two:
@@ -44,12 +135,32 @@ def page_before_updating():
                                                         type=source, accept_multiple_files=False)
         if st.session_state.issuer_file:
             st.session_state.issuer_binary_stream = BytesIO(st.session_state.issuer_file.getvalue())
+            st.session_state.issuer_file_hash = get_hash_of_binary_stream(st.session_state.issuer_binary_stream)
             # получаем названия страниц загруженного XLSX файла
-            st.session_state.issuer_sheet_names = get_sheetnames_with_binary_stream(
-                                                            st.session_state.issuer_binary_stream)
+            st.session_state.issuer_sheet_names = get_cached_sheetnames(st.session_state.issuer_file_hash,
+                                                                        st.session_state.issuer_binary_stream)
+            issuer_sheet_scores = {}
+            if st.session_state.model_file:
+                # страницы эмитента ранжируются по пересечению значений с последним историческим столбцом модели,
+                # лучшая страница выбирается по умолчанию
+                issuer_sheet_scores = get_cached_issuer_sheet_scores(st.session_state.model_file_hash,
+                                                                     st.session_state.issuer_file_hash,
+                                                                     st.session_state.selected_model_sheet,
+                                                                     st.session_state.model_binary_stream,
+                                                                     st.session_state.issuer_binary_stream)
+            best_issuer_sheet = next((sheet_name for sheet_name, score in issuer_sheet_scores.items() if score), None)
+
+            def format_issuer_sheet_name(sheet_name: str) -> str:
+                if issuer_sheet_scores.get(sheet_name):
+                    return f'{sheet_name} (совпадает {issuer_sheet_scores[sheet_name]:.0%} значений модели)'
+                return sheet_name
+
             st.session_state.selected_issuer_sheet = st.selectbox(
                                                         'Выберите название листа для сравнения в файле эмитента',
-                                                        st.session_state.issuer_sheet_names)
+                                                        st.session_state.issuer_sheet_names,
+                                                        index=st.session_state.issuer_sheet_names.index(
+                                                            best_issuer_sheet) if best_issuer_sheet else 0,
+                                                        format_func=format_issuer_sheet_name)
     if st.button('Отправить на обработку', key='fileprocessing'):
         if st.session_state.model_file and st.session_state.issuer_file:
             with st.spinner('Обработка...'):
@@ -67,78 +178,256 @@ def page_on_updating():
     issuer_binary_stream = st.session_state.issuer_binary_stream
     selected_model_sheet = st.session_state.selected_model_sheet
     selected_issuer_sheet = st.session_state.selected_issuer_sheet
-    default_model_address_of_start, default_issuer_address_of_start = specify_function_for_cell_address_searching(
-                                                                        model_binary_stream,
-                                                                        issuer_binary_stream,
+    # результат кэшируется: повторные перезапуски скрипта при вводе адреса или выборе блока ничего не пересчитывают
+    default_model_address_of_start, default_issuer_address_of_start = get_cached_default_addresses_of_start(
+                                                                        st.session_state.model_file_hash,
+                                                                        st.session_state.issuer_file_hash,
                                                                         selected_model_sheet,
-                                                                        selected_issuer_sheet)
+                                                                        selected_issuer_sheet,
+                                                                        model_binary_stream,
+                                                                        issuer_binary_stream)
     with column_one:
         model_address_of_start = st.text_input(label='Введите адрес верхней ячейки столбца с числовыми значениями\n'
                                                + 'в файле аналитической модели (в формате А1):',
                                                value=default_model_address_of_start)
         statement_block = st.selectbox('Укажите блок статей', statement_block_option)
+        issuer = st.text_input('Эмитент (для использования подтвержденных ранее сопоставлений)').strip()
+        multi_period_mode = st.checkbox('Сопоставлять по всем историческим периодам модели')
+        scored_config_lookup = st.checkbox('Искать похожие названия статей в конфиге (с оценкой схожести)')
+        whole_model_mode = st.checkbox('Обработать всю модель (блоки статей определяются по названиям страниц, '
+                                       'страницы эмитента и адреса ячеек - автоматически)')
     with column_two:
         issuer_address_of_start = st.text_input(label='Введите адрес верхней ячейки столбца с числовыми значениями\n'
                                                 + 'в файле эмитента (в формате А1):',
                                                 value=default_issuer_address_of_start)
         data_source = st.selectbox('Укажите источник данных', data_source_option)
+        relative_tolerance_in_percent = st.number_input('Допустимое отклонение значений, %',
+                                                        min_value=0.0, max_value=100.0, value=0.0, step=0.1)
+        detect_scale = st.checkbox('Определять масштаб отчета эмитента (тысячи, миллионы)')
 
-    if st.button('Отправить на обработку', key='sendtoprocessing'):
+    # пока задание обрабатывается, повторно отправить файлы нельзя
+    if st.button('Отправить на обработку', key='sendtoprocessing', disabled='job_id' in st.session_state):
+        if whole_model_mode:
+            # все страницы модели обрабатываются в одном задании, блок статей - у каждой страницы свой
+            st.session_state.update({'issuer': issuer, 'statement_block': None, 'data_source': data_source})
+            try:
+                job = get_job_manager().submit(
+                    st.session_state.session_id, process_whole_model,
+                    model_binary_stream=BytesIO(model_binary_stream.getvalue()),
+                    issuer_binary_stream=BytesIO(issuer_binary_stream.getvalue()),
+                    data_source=data_source,
+                    issuer=issuer,
+                    mapping_store=get_mapping_store(),
+                    multi_period_mode=multi_period_mode,
+                    matching_options={'relative_tolerance': relative_tolerance_in_percent / 100,
+                                      'detect_scale': detect_scale},
+                    config_lookup_options={'scored': scored_config_lookup},
+                    run_key=(st.session_state.session_id, st.session_state.model_file.name,
+                             st.session_state.issuer_file.name))
+                st.session_state.job_id = job.job_id
+                st.experimental_rerun()
+            except JobQueueIsFull as error:
+                st.error(error, icon='🚨')
         # Если ввели адреса ячеек
-        if model_address_of_start and issuer_address_of_start:
+        elif model_address_of_start and issuer_address_of_start:
             # Если формат адреса ячеек верный
             model_address_of_start = check_cell_address_input(model_address_of_start)
             issuer_address_of_start = check_cell_address_input(issuer_address_of_start)
             if model_address_of_start and issuer_address_of_start:
-                with st.spinner('Обработка...'):
-                    # сохраняем список названий статей из модели и соответствующих им названий из файла эмитента
-                    try:
-                        st.session_state.list_of_equivalents = tags_equations_creator(
-                                                                      model_binary_stream=model_binary_stream,
-                                                                      issuer_binary_stream=issuer_binary_stream,
-                                                                      selected_model_sheet=selected_model_sheet,
-                                                                      selected_issuer_sheet=selected_issuer_sheet,
-                                                                      model_address_of_start=model_address_of_start,
-                                                                      issuer_address_of_start=issuer_address_of_start
-                                                                      )
-                        # добавляем названия статей из других аналитических моделей (из конфига),
-                        # если в соответствующих им статьях (справа в конфиге) есть совпадение
-                        # с переданным названием статьи у эмитента
-                        add_similar_statement_tags_from_config(statement_block, data_source,
-                                                               st.session_state.list_of_equivalents)
-                        st.session_state.status = 'after'
-                        st.experimental_rerun()
-                    except EmptyTagCellInModel as error:
-                        st.error(error, icon='🚨')
+                # обработка идет в общем пуле фоновых потоков, страница показывает прогресс и позволяет отменить
+                # блок, источник и эмитент нужны итоговой странице для подтверждения сопоставлений
+                st.session_state.update({'issuer': issuer, 'statement_block': statement_block,
+                                         'data_source': data_source})
+                try:
+                    job = get_job_manager().submit(
+                        st.session_state.session_id, process_files,
+                        issuer=issuer,
+                        multi_period_mode=multi_period_mode,
+                        statement_block=statement_block,
+                        data_source=data_source,
+                        matching_options={'relative_tolerance': relative_tolerance_in_percent / 100,
+                                          'detect_scale': detect_scale},
+                        config_lookup_options={'scored': scored_config_lookup},
+                        # исправленные файлы с теми же именами сравниваются с предыдущей обработкой в этой сессии
+                        run_key=(st.session_state.session_id, st.session_state.model_file.name,
+                                 st.session_state.issuer_file.name),
+                        # у фонового потока свои копии потоков, чтобы не делить позицию чтения со скриптом
+                        model_binary_stream=BytesIO(model_binary_stream.getvalue()),
+                        issuer_binary_stream=BytesIO(issuer_binary_stream.getvalue()),
+                        selected_model_sheet=selected_model_sheet,
+                        selected_issuer_sheet=selected_issuer_sheet,
+                        model_address_of_start=model_address_of_start,
+                        issuer_address_of_start=issuer_address_of_start)
+                    st.session_state.job_id = job.job_id
+                    st.experimental_rerun()
+                except JobQueueIsFull as error:
+                    st.error(error, icon='🚨')
 
             else:
                 st.error('Неверный формат записи ячейки', icon='🚨')
         else:
             st.error('Введите значения', icon='🚨')
+    show_job_progress()
 
-def page_after_updating():
-    """Функция GUI для отображения итогового окна приложения, в котором пользователь может
-    просмотреть список полученных эквивалентных значений,
-    а также скачать его в формате .txt."""
+def show_job_progress():
+    """Показывает состояние фонового задания сессии и кнопку отмены; пока задание не завершено,
+    страница перезапускается каждые job_polling_interval секунд. По завершении задания открывает итоговое окно."""
+    job_id = st.session_state.get('job_id')
+    if job_id is None:
+        return
+    job_manager = get_job_manager()
+    job = job_manager.get_job(job_id)
+    if job is None:
+        # задание удалено (например, сервер был перезапущен)
+        del st.session_state.job_id
+        return
+    if job.is_finished:
+        # завершенное задание (в том числе с ошибкой) убирается из сессии - файлы можно отправить снова
+        del st.session_state.job_id
+        job_manager.forget(job_id)
+        match job.status:
+            case 'done':
+                # результаты задания - его частичные результаты (объекты Equivalent и ProblemRow или, в режиме
+                # всей модели, результаты по страницам модели)
+                # результаты страниц модели приходят по мере готовности - восстанавливаем порядок страниц в файле
+                st.session_state.block_results = sorted(
+                    (item for item in job.partial_results if isinstance(item, StatementBlockResult)),
+                    key=lambda block_result: block_result.sheet_number)
+                items = [item for block_result in st.session_state.block_results for item in block_result.items] \
+                    if st.session_state.block_results else job.partial_results
+                st.session_state.list_of_equivalents = [item for item in items if isinstance(item, Equivalent)]
+                # ряды, которые не удалось сопоставить, не прерывают обработку и показываются предупреждениями
+                st.session_state.problem_rows = [item for item in items if isinstance(item, ProblemRow)]
+                # замеры этапов обработки (время, счетчики, память) показываются на итоговой странице
+                st.session_state.run_metrics = job.run_metrics
+                st.session_state.status = 'after'
+                st.experimental_rerun()
+            case 'cancelled':
+                st.warning('Обработка отменена', icon='⚠️')
+            case 'error':
+                # ошибка обработки (например, пустая ячейка с названием статьи в модели) показывается сообщением,
+                # а не трассировкой
+                st.error(job.error, icon='🚨')
+        return
 
+    if job.status == 'queued':
+        st.info(f'Задание в очереди, перед ним заданий: {job_manager.get_queue_position(job) or 0}')
+    else:
+        stage_title = stage_titles.get(job.stage, 'Подготовка')
+        if job.total:
+            st.text(f'{stage_title}: {job.done} из {job.total}')
+            st.progress(min(job.done / job.total, 1.0))
+        else:
+            st.text(f'{stage_title}: обработано {job.done}')
+    # найденные пары показываются по мере сопоставления, не дожидаясь конца обработки
+    partial_results = job.partial_results[:]
+    partial_equivalents = [item for item in partial_results if isinstance(item, Equivalent)]
+    finished_block_results = sorted((item for item in partial_results if isinstance(item, StatementBlockResult)),
+                                    key=lambda block_result: block_result.sheet_number)
+    if finished_block_results:
+        st.text(f'Обработано страниц модели: {len(finished_block_results)}')
+        partial_equivalents = [item for block_result in finished_block_results for item in block_result.items
+                               if isinstance(item, Equivalent)]
+    if partial_equivalents:
+        st.text_area(f'Найдено пар: {len(partial_equivalents)}', format_equivalents(partial_equivalents),
+                     height=300)
+    if st.button('Отменить', key='cancelprocessing'):
+        job_manager.cancel(job_id)
+    time.sleep(job_polling_interval)
+    st.experimental_rerun()
+
+def show_run_metrics(run_metrics):
+    """Показывает в сворачиваемой панели время, счетчики и память по этапам последней обработки."""
+    if run_metrics is None or not run_metrics.stages:
+        return
+    with st.expander(f'Этапы обработки ({run_metrics.total_seconds:.2f} с)'):
+        st.table([{'Этап': stage.stage,
+                   'Время, с': round(stage.seconds, 3),
+                   'Счетчики': ', '.join(f'{name}: {number}' for name, number in stage.counters.items()),
+                   'Пик памяти процесса, МБ': round(stage.max_rss_bytes / 2**20, 1) if stage.max_rss_bytes else None,
+                   'Пик памяти этапа (tracemalloc), МБ': round(stage.traced_peak_memory_bytes / 2**20, 1)
+                                                         if stage.traced_peak_memory_bytes is not None else None}
+                  for stage in run_metrics.stages])
+        # отчеты cProfile есть только в режиме профилирования (AUTOMATION_ASSISTANCE_PROFILING=cprofile)
+        for stage in run_metrics.stages:
+            if stage.profile:
+                st.text(f'{stage.stage}:\n{stage.profile}')
+
+def format_equivalents(list_of_equivalents: list) -> str:
+    """Формирует текст списка эквивалентных названий статей (с предложениями переименования из конфига)."""
     output_text = ''
-    for equivalent in st.session_state.list_of_equivalents:
+    for equivalent in list_of_equivalents:
+        equation = f'{equivalent.model_tag} = {equivalent.tag_from_filling}'
+        # при сопоставлении по нескольким периодам показываем уверенность сопоставления
+        if equivalent.confidence is not None:
+            equation += f' (уверенность {equivalent.confidence:.0%})'
         if len(equivalent.tags_from_config) == 1 and equivalent.model_tag == equivalent.tags_from_config[0]:
-            equal_statements = f'{equivalent.model_tag} = {equivalent.tag_from_filling}\n' \
+            equal_statements = f'{equation}\n' \
                                f'☻ Переименование не требуется!\n'
             output_text += equal_statements + '\n'
         else:
-            equal_statements = f'{equivalent.model_tag} = {equivalent.tag_from_filling}\n' \
+            equal_statements = f'{equation}\n' \
                                f'► Переименовать в: \n'
-            statements_to_rename = '\n'.join(equivalent.tags_from_config)
+            if equivalent.scores_of_tags_from_config is not None:
+                # при поиске похожих названий показываем схожесть каждого названия
+                scored_tags_from_config = zip(equivalent.tags_from_config, equivalent.scores_of_tags_from_config)
+                statements_to_rename = '\n'.join(f'{tag_from_config} (схожесть {score:.0%})'
+                                                 for tag_from_config, score in scored_tags_from_config)
+            else:
+                statements_to_rename = '\n'.join(equivalent.tags_from_config)
             output_text += equal_statements + statements_to_rename + '\n\n'
+    return output_text
+
+def format_whole_model_report(block_results: list) -> str:
+    """Формирует общий текст по всем страницам модели (режим всей модели): для каждой страницы - блок статей,
+    выбранная страница эмитента и список эквивалентных названий статей."""
+    output_text = ''
+    for block_result in block_results:
+        output_text += f'=== {block_result.statement_block}: страница модели «{block_result.model_sheet}»'
+        if block_result.issuer_sheet:
+            output_text += f', страница эмитента «{block_result.issuer_sheet}»'
+        output_text += ' ===\n\n'
+        if block_result.error:
+            output_text += f'Страница не обработана: {block_result.error}\n\n'
+        else:
+            output_text += format_equivalents([item for item in block_result.items if isinstance(item, Equivalent)])
+    return output_text
+
+def page_after_updating():
+    """Функция GUI для отображения итогового окна приложения, в котором пользователь может
+    просмотреть список полученных эквивалентных значений,
+    а также скачать его в формате .txt."""
+
+    block_results = st.session_state.get('block_results')
+    if block_results:
+        output_text = format_whole_model_report(block_results)
+        for block_result in block_results:
+            if block_result.error:
+                st.warning(f'{block_result.model_sheet}: {block_result.error}', icon='⚠️')
+    else:
+        output_text = format_equivalents(st.session_state.list_of_equivalents)
+    for problem_row in st.session_state.get('problem_rows', []):
+        st.warning(problem_row.message, icon='⚠️')
     st.text_area('Полученный список:', output_text, height=500)
+    show_run_metrics(st.session_state.get('run_metrics'))
     st.download_button(
         label='Скачать в виде файла',
         data=output_text,
         file_name='list_of_equivalents.txt',
         mime='text'
         )
+    # подтвержденные пары при следующей обработке отчетов эмитента берутся из хранилища
+    if st.session_state.get('issuer') and st.button('Подтвердить сопоставления', key='confirm'):
+        if block_results:
+            # в режиме всей модели пары подтверждаются по блоку статей своей страницы
+            for block_result in block_results:
+                get_mapping_store().confirm(st.session_state.issuer, block_result.statement_block,
+                                            st.session_state.data_source,
+                                            [item for item in block_result.items if isinstance(item, Equivalent)])
+        else:
+            get_mapping_store().confirm(st.session_state.issuer, st.session_state.statement_block,
+                                        st.session_state.data_source, st.session_state.list_of_equivalents)
+        st.success(f'Сопоставления сохранены для эмитента {st.session_state.issuer}')
     if st.button('Начать заново', key='restart'):
         st.session_state.status = 'before'
         st.experimental_rerun()
@@ -147,7 +436,16 @@ def page_after_updating():
 source = 'xlsx'
 statement_block_option = ['Баланс', 'Финансовые результаты', 'Сегменты', 'Отчет о движении денежных средств']
 data_source_option = ['XLSX', 'PDF', 'XBRL']
+stage_titles = {'workbook_parsing': 'Чтение файлов', 'value_matching': 'Сопоставление значений',
+                'config_lookup': 'Поиск названий в конфиге', 'mapping_lookup': 'Поиск подтвержденных сопоставлений',
+                'row_fingerprinting': 'Сравнение с предыдущей обработкой',
+                'sheet_mapping': 'Определение блоков статей', 'sheet_discovery': 'Выбор страницы эмитента',
+                'start_cell_detection': 'Поиск ячеек для начала обработки'}
+# Как часто (в секундах) страница проверяет состояние фонового задания
+job_polling_interval = 0.5
 
+# замеры этапов обработки пишутся в лог JSON записями
+enable_json_logging()
 st.set_page_config(page_title='Automation assistance',
                    page_icon='👩‍🎓',
                    layout="wide",
@@ -155,8 +453,11 @@ st.set_page_config(page_title='Automation assistance',
                    )
 st.header('Automation assistance', )
 column_one, column_two = st.columns((1, 1))
+if 'session_id' not in st.session_state:
+    # владелец фоновых заданий сессии (задания разных сессий запускаются по очереди по кругу)
+    st.session_state.session_id = uuid.uuid4().hex
 if 'status' not in st.session_state:
-    st.session_state.update({'list_of_equivalents': []})
+    st.session_state.update({'list_of_equivalents': [], 'problem_rows': [], 'block_results': None})
     change_app_status('before')
 else:
     change_app_status()
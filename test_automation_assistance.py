@@ -0,0 +1,46 @@
+from io import BytesIO
+
+import openpyxl
+
+from automation_assistance import create_value_index, find_matching_rows_exactly, tags_equations_creator
+from automation_assistance_disk_cache import disk_cache
+
+
+def create_workbook(rows: list, index_of_column_with_tags: int) -> BytesIO:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sheet'
+    for row_number, (tag, value) in enumerate(rows, start=1):
+        sheet.cell(row_number, index_of_column_with_tags, tag)
+        sheet.cell(row_number, 3, value)
+    binary_stream = BytesIO()
+    workbook.save(binary_stream)
+    binary_stream.seek(0)
+    return binary_stream
+
+
+def test_value_index_truncates_floats_and_skips_empty_cells():
+    value_index = create_value_index([(1, 100.7), (2, None), (3, 'Выручка'), (4, 100), (5, -3.2)])
+
+    assert value_index == {100: [1, 4], 'Выручка': [3], -3: [5]}
+
+
+def test_matching_rows_follow_model_order_and_all_tied_issuer_rows():
+    matching_rows = list(find_matching_rows_exactly([60.0, None, 100.2, 7], [100, 60.9, 100.0, 'текст'],
+                                                    [10, 11, 12, 13]))
+
+    assert matching_rows == [(0, 11), (2, 10), (2, 12)]
+
+
+def test_tags_equations_creator_joins_columns_by_value(tmp_path, monkeypatch):
+    monkeypatch.setattr(disk_cache, 'directory', tmp_path.joinpath('disk_cache'))
+    model_binary_stream = create_workbook([('Выручка', 100.0), ('Себестоимость', 60.0), ('Прочее', 5.0)], 2)
+    issuer_binary_stream = create_workbook([('Cost of sales', 60.0), ('Revenue', 100.0), ('Other', 1.0)], 1)
+
+    equivalents = tags_equations_creator(model_binary_stream=model_binary_stream,
+                                         issuer_binary_stream=issuer_binary_stream,
+                                         selected_model_sheet='Sheet', selected_issuer_sheet='Sheet',
+                                         model_address_of_start='C1', issuer_address_of_start='C1')
+
+    assert [(equivalent.model_tag, equivalent.tag_from_filling) for equivalent in equivalents] == [
+        ('Выручка', 'Revenue'), ('Себестоимость', 'Cost of sales')]
@@ -0,0 +1,49 @@
+import io
+import os
+import json
+import time
+
+from automation_assistance_batch import run_batch
+
+
+def run_fake_batch_job(job: dict) -> dict:
+    if job.get('crash'):
+        # процесс завершается, не передав результат (как при нехватке памяти) - исключение в нем не возникает
+        os._exit(1)
+    if job.get('hang'):
+        # задание зависает (например, при разборе поврежденного файла)
+        time.sleep(600)
+    return {'value': job['value']}
+
+
+def run_fake_batch(jobs: list[dict], **arguments) -> tuple[dict, dict]:
+    output_stream = io.StringIO()
+    summary = run_batch(jobs, output_stream, run_job=run_fake_batch_job, **arguments)
+    results = {result['job_number']: result for result in map(json.loads, output_stream.getvalue().splitlines())}
+    return summary, results
+
+
+def test_failed_process_fails_only_its_own_job():
+    jobs = [{'value': 0}, {'value': 1, 'crash': True}, {'value': 2}, {'value': 3}, {'value': 4}]
+
+    summary, results = run_fake_batch(jobs, max_workers=2, timeout=None)
+
+    assert summary == {'ok': 4, 'error': 1}
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[1]['status'] == 'error'
+    assert results[1]['error_type'] == 'BatchJobProcessFailed'
+    for job_number in (0, 2, 3, 4):
+        assert results[job_number]['status'] == 'ok'
+        assert results[job_number]['value'] == job_number
+
+
+def test_hanging_job_is_terminated_after_timeout():
+    jobs = [{'value': 0, 'hang': True}, {'value': 1}, {'value': 2}]
+    start = time.monotonic()
+
+    summary, results = run_fake_batch(jobs, max_workers=2, timeout=2)
+
+    assert time.monotonic() - start < 60
+    assert summary == {'ok': 2, 'error': 1}
+    assert results[0]['error_type'] == 'BatchJobTimeout'
+    assert [results[job_number]['value'] for job_number in (1, 2)] == [1, 2]
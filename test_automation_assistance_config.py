@@ -0,0 +1,60 @@
+import pytest
+
+from automation_assistance_config import ConfigSectionIndex, normalize_tag, stem_russian_word
+
+SECTION_ITEMS = [
+    ('Выручка', 'Выручка\nВыручка от продаж'),
+    ('Денежные средства', 'Денежные средства и их эквиваленты'),
+    ('Денежные средства в банках', 'Денежные средства на счетах в банках'),
+]
+
+
+def test_normalize_tag_drops_stop_words_and_endings():
+    assert normalize_tag('Денежные средства и их эквиваленты') == 'денежн средств эквивалент'
+    assert normalize_tag('Денежные средства и их эквиваленты') == normalize_tag('Денежные средства и эквиваленты')
+
+
+def test_normalize_tag_keeps_tag_of_stop_words_only():
+    assert normalize_tag('Итого') == 'итог'
+
+
+def test_normalize_tag_keeps_total_marker():
+    assert normalize_tag('Итого выручка') == normalize_tag('Выручка всего') == 'выручк итог'
+    assert normalize_tag('Итого выручка') != normalize_tag('Выручка')
+
+
+def test_find_scored_model_tags_tells_total_from_item():
+    config_section_index = ConfigSectionIndex([('Выручка', 'Выручка'), ('Итого выручка', 'Итого выручка')])
+
+    assert config_section_index.find_scored_model_tags('Выручка всего', top_k=1) == [('Итого выручка', 1.0)]
+    assert config_section_index.find_scored_model_tags('Выручка', top_k=1) == [('Выручка', 1.0)]
+
+
+def test_stem_russian_word_keeps_minimal_stem_length():
+    assert stem_russian_word('эквиваленты') == 'эквивалент'
+    assert stem_russian_word('денежные') == 'денежн'
+    # после отбрасывания окончания основа была бы короче MIN_STEM_LENGTH
+    assert stem_russian_word('для') == 'для'
+
+
+def test_find_scored_model_tags_orders_by_score():
+    config_section_index = ConfigSectionIndex(SECTION_ITEMS)
+
+    scored_model_tags = config_section_index.find_scored_model_tags('Денежные средства и эквиваленты',
+                                                                    min_score=0.1)
+
+    assert [model_tag for model_tag, _ in scored_model_tags] == ['Денежные средства', 'Денежные средства в банках']
+    assert scored_model_tags[0][1] == 1.0
+    assert scored_model_tags[0][1] > scored_model_tags[1][1]
+
+
+def test_find_scored_model_tags_returns_at_most_top_k():
+    config_section_index = ConfigSectionIndex(SECTION_ITEMS)
+
+    assert len(config_section_index.find_scored_model_tags('Денежные средства', top_k=1, min_score=0.1)) == 1
+
+
+@pytest.mark.parametrize('top_k', [0, -1])
+def test_find_scored_model_tags_rejects_non_positive_top_k(top_k):
+    with pytest.raises(ValueError):
+        ConfigSectionIndex(SECTION_ITEMS).find_scored_model_tags('Выручка', top_k=top_k)
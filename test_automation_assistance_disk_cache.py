@@ -0,0 +1,64 @@
+import os
+from datetime import date, datetime, time, timedelta
+
+import automation_assistance_disk_cache
+from automation_assistance_disk_cache import DiskCache, create_columnar_sheet_from_rows
+
+COLUMNAR_SHEET = create_columnar_sheet_from_rows('Sheet', [('Выручка', 100.0), ('Прибыль', 40.0)])
+
+
+def fill_disk_cache(tmp_path, number_of_entries: int) -> DiskCache:
+    disk_cache = DiskCache(tmp_path, max_size_in_bytes=10 ** 9)
+    for entry_number in range(number_of_entries):
+        disk_cache.save(f'file-{entry_number}', 'Sheet', True, COLUMNAR_SHEET)
+        metadata_path = disk_cache.get_entry_path(f'file-{entry_number}', 'Sheet', True).joinpath('metadata.json')
+        # записи использовались в порядке создания
+        os.utime(metadata_path, (entry_number, entry_number))
+    return disk_cache
+
+
+def test_cell_values_are_restored_with_their_types(tmp_path):
+    row = (1, 2.5, True, 'Выручка', datetime(2024, 3, 31, 12, 30), date(2024, 3, 31), time(9, 15, 30),
+           timedelta(hours=30, minutes=5), None)
+    disk_cache = DiskCache(tmp_path)
+    disk_cache.save('file', 'Sheet', False, create_columnar_sheet_from_rows('Sheet', [row]))
+
+    columnar_sheet = disk_cache.load('file', 'Sheet', False)
+
+    values = [columnar_sheet.get_column_values(column_number)[0] for column_number in range(1, len(row) + 1)]
+    assert values == list(row)
+    assert [type(value) for value in values] == [type(value) for value in row]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    disk_cache = fill_disk_cache(tmp_path, 3)
+    entry_size_in_bytes = disk_cache.get_entries()[0][1]
+    # чтение отмечает использование записи
+    assert disk_cache.load('file-0', 'Sheet', True).get_column_values(1) == ['Выручка', 'Прибыль']
+
+    disk_cache.max_size_in_bytes = 2 * entry_size_in_bytes
+    disk_cache.evict()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['file-0', 'file-2']
+    assert disk_cache.load('file-1', 'Sheet', True) is None
+
+
+def test_entry_that_cannot_be_removed_is_still_counted(tmp_path, monkeypatch):
+    disk_cache = fill_disk_cache(tmp_path, 3)
+    entry_size_in_bytes = disk_cache.get_entries()[0][1]
+    locked_entry_path = disk_cache.get_entry_path('file-0', 'Sheet', True)
+    replace = os.replace
+
+    def replace_unless_locked(source, destination):
+        # как на Windows, где файлы, отображенные в память, не переносятся и не удаляются
+        if source == locked_entry_path:
+            raise PermissionError(source)
+        replace(source, destination)
+
+    monkeypatch.setattr(automation_assistance_disk_cache.os, 'replace', replace_unless_locked)
+    disk_cache.max_size_in_bytes = 2 * entry_size_in_bytes
+    disk_cache.evict()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['file-0', 'file-2']
+    assert not list(tmp_path.glob('*/.evicted-*'))
+    assert disk_cache.load('file-0', 'Sheet', True) is not None
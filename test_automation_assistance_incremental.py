@@ -0,0 +1,128 @@
+import os
+import sys
+import subprocess
+from io import BytesIO
+
+import openpyxl
+import pytest
+
+import automation_assistance_incremental
+from automation_assistance import extract_columns_to_match
+from automation_assistance_disk_cache import disk_cache
+from automation_assistance_incremental import (PreviousRun, PreviousRuns, get_row_fingerprints,
+                                               iter_incremental_equivalents)
+from automation_assistance_streaming import ExtractedColumns
+from automation_assistance_sheet_discovery import rank_issuer_sheets
+from automation_assistance_workbook_cache import workbook_cache
+
+MODEL_ROWS = [('Выручка', 100.0), ('Себестоимость', 60.0), ('Прибыль', 40.0)]
+ISSUER_ROWS = [('Revenue', 100.0), ('Cost of sales', 60.0), ('Profit', 40.0)]
+
+
+def create_workbook(rows: list, index_of_column_with_tags: int) -> BytesIO:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sheet'
+    for row_number, (tag, value) in enumerate(rows, start=1):
+        sheet.cell(row_number, index_of_column_with_tags, tag)
+        sheet.cell(row_number, 3, value)
+    binary_stream = BytesIO()
+    workbook.save(binary_stream)
+    binary_stream.seek(0)
+    return binary_stream
+
+
+@pytest.fixture
+def run_in_folder_with_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(disk_cache, 'directory', tmp_path.joinpath('disk_cache'))
+    tmp_path.joinpath('balance_config.ini').write_text('[PDF statements]\nвыручка=Revenue\n', encoding='UTF-8')
+
+
+def run(runs: PreviousRuns, model_rows: list, issuer_rows: list) -> list:
+    return list(iter_incremental_equivalents(
+        'run', statement_block='Баланс', data_source='PDF', runs=runs,
+        model_binary_stream=create_workbook(model_rows, 2), issuer_binary_stream=create_workbook(issuer_rows, 1),
+        selected_model_sheet='Sheet', selected_issuer_sheet='Sheet',
+        model_address_of_start='C1', issuer_address_of_start='C1'))
+
+
+def test_reused_items_are_yielded_before_rematched_rows(run_in_folder_with_config):
+    runs = PreviousRuns()
+    run(runs, MODEL_ROWS, ISSUER_ROWS)
+
+    items = run(runs, [('Выручка всего', 100.0), ('Себестоимость', 60.0), ('Прибыль', 40.0)], ISSUER_ROWS)
+
+    assert [(item.model_tag, item.tag_from_filling) for item in items] == [
+        ('Себестоимость', 'Cost of sales'), ('Прибыль', 'Profit'), ('Выручка всего', 'Revenue')]
+    # названия из конфига ищутся и для пар, которые отдаются по мере сопоставления
+    assert items[-1].tags_from_config == ['Выручка']
+
+
+def test_unchanged_model_is_not_parsed_again(run_in_folder_with_config, monkeypatch):
+    runs = PreviousRuns()
+    run(runs, MODEL_ROWS, ISSUER_ROWS)
+    parsed_sheets = []
+    extract_model_columns_to_match = automation_assistance_incremental.extract_model_columns_to_match
+    monkeypatch.setattr(automation_assistance_incremental, 'extract_model_columns_to_match',
+                        lambda *arguments: parsed_sheets.append(arguments[1])
+                        or extract_model_columns_to_match(*arguments))
+
+    items = run(runs, MODEL_ROWS, [('Revenue', 100.0), ('Cost of sales', 60.0), ('Net profit', 40.0)])
+
+    assert parsed_sheets == []
+    assert [item.tag_from_filling for item in items] == ['Revenue', 'Cost of sales', 'Net profit']
+
+
+def test_model_ranked_against_issuer_is_not_parsed_again_for_matching(run_in_folder_with_config, monkeypatch):
+    workbook_cache.clear()
+    model_binary_stream, issuer_binary_stream = create_workbook(MODEL_ROWS, 2), create_workbook(ISSUER_ROWS, 1)
+    opened_streams = []
+    load_workbook = openpyxl.load_workbook
+    monkeypatch.setattr(openpyxl, 'load_workbook',
+                        lambda *arguments, **keyword_arguments: opened_streams.append(arguments[0])
+                        or load_workbook(*arguments, **keyword_arguments))
+
+    rank_issuer_sheets(model_binary_stream, issuer_binary_stream, 'Sheet')
+    model_columns, _ = extract_columns_to_match(model_binary_stream, issuer_binary_stream, 'Sheet', 'Sheet',
+                                                'C2', 'C1')
+
+    assert opened_streams.count(model_binary_stream) == 1
+    assert model_columns.rows == [2, 3]
+    assert model_columns.values == {3: [60.0, 40.0], 2: ['Себестоимость', 'Прибыль']}
+    assert model_columns.fill_colors == {2: ['00000000', '00000000']}
+
+
+def test_least_recently_used_runs_are_forgotten_over_size_limit():
+    def create_run(number_of_rows: int) -> PreviousRun:
+        return PreviousRun(model_file_hash='model', issuer_file_hash='issuer', excluded_tags_from_filling=frozenset(),
+                           config_key=(), items_by_model_position={},
+                           model_columns=ExtractedColumns(rows=list(range(number_of_rows)),
+                                                          values={3: [1.0] * number_of_rows}))
+
+    runs = PreviousRuns(max_size_in_bytes=create_run(100).nbytes * 2)
+    runs.put('first', create_run(100))
+    runs.put('second', create_run(100))
+    runs.get('first')
+    runs.put('third', create_run(100))
+
+    assert runs.get('second') is None
+    assert runs.get('first') is not None and runs.get('third') is not None
+    # слишком большой запуск запоминается, вытесняя все остальные
+    runs.put('large', create_run(1000))
+    assert [runs.get(key) is not None for key in ('first', 'third', 'large')] == [False, False, True]
+    assert runs.current_size_in_bytes == create_run(1000).nbytes
+
+
+def test_row_fingerprints_do_not_depend_on_hash_seed():
+    code = ('from automation_assistance_incremental import get_row_fingerprints; '
+            "print(get_row_fingerprints([1, 2], ['Выручка', 'Прибыль'], [100.0, None]).tolist())")
+    fingerprints = [subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   env={**os.environ, 'PYTHONHASHSEED': seed}).stdout
+                    for seed in ('1', '2')]
+
+    assert fingerprints[0] == fingerprints[1]
+    assert fingerprints[0].strip() == str(get_row_fingerprints([1, 2], ['Выручка', 'Прибыль'], [100.0, None]).tolist())
+    # значения разных типов с одинаковым hash различаются
+    assert len(set(get_row_fingerprints([1, 1, 1], [1, 1.0, True]).tolist())) == 3
@@ -0,0 +1,49 @@
+import time
+import threading
+from io import BytesIO
+
+import openpyxl
+import pytest
+
+from automation_assistance_jobs import JobManager
+from automation_assistance_sheet_discovery import create_sheet_sketches
+from automation_assistance_streaming import read_rows_of_sheets
+
+
+def create_workbook_with_small_sheets() -> BytesIO:
+    workbook = openpyxl.Workbook()
+    for sheet_number in range(3):
+        sheet = workbook.active if sheet_number == 0 else workbook.create_sheet()
+        sheet.title = f'Sheet{sheet_number}'
+        sheet.append([1.0, 2.0])
+    binary_stream = BytesIO()
+    workbook.save(binary_stream)
+    return binary_stream
+
+
+@pytest.mark.parametrize('parse', [
+    lambda binary_stream: read_rows_of_sheets(binary_stream, ['Sheet0', 'Sheet1', 'Sheet2']),
+    lambda binary_stream: create_sheet_sketches(binary_stream, max_workers=2)])
+def test_parsing_of_small_sheets_stops_after_cancel(parse):
+    job_manager = JobManager(max_workers=1)
+    started, cancel_requested = threading.Event(), threading.Event()
+
+    def parse_after_cancel():
+        started.set()
+        cancel_requested.wait(10)
+        return parse(create_workbook_with_small_sheets())
+
+    try:
+        job = job_manager.submit('owner', parse_after_cancel)
+        # задание отменяется, когда оно уже выполняется (а не стоит в очереди)
+        started.wait(10)
+        job_manager.cancel(job.job_id)
+        cancel_requested.set()
+        deadline = time.monotonic() + 10
+        while not job.is_finished and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # в страницах меньше PROGRESS_REPORT_INTERVAL рядов - отмена проверяется перед страницей
+        assert job.status == 'cancelled'
+    finally:
+        job_manager.shutdown()
@@ -0,0 +1,14 @@
+from automation_assistance import Equivalent
+from automation_assistance_config import get_config_section_index
+from automation_assistance_mapping_store import MappingStore
+
+
+def test_exported_config_section_with_percent_sign_is_readable(tmp_path):
+    mapping_store = MappingStore(tmp_path.joinpath('store.sqlite3'))
+    mapping_store.confirm('Эмитент', 'Баланс', 'PDF', [Equivalent(tag_from_filling='Доля, %', model_tag='доля')])
+    path_to_config = tmp_path.joinpath('balance_config.ini')
+    path_to_config.write_text(mapping_store.export_config_section('Баланс', 'PDF'), encoding='UTF-8')
+
+    config_section_index = get_config_section_index(path_to_config, 'PDF statements')
+
+    assert config_section_index.find_model_tags('Доля, %') == ['доля']
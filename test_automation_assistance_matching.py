@@ -0,0 +1,54 @@
+import numpy as np
+
+from automation_assistance_matching import detect_scale_factor, find_tolerance_windows, join_with_tolerance
+
+
+def test_find_tolerance_windows_keeps_values_inside_tolerance():
+    sorted_values = np.array([100.0, 200.0, 300.0])
+    lower, upper = find_tolerance_windows(sorted_values, np.array([101.0, 250.0]), absolute_tolerance=1.0)
+    assert upper.tolist() == [1, 2]
+    assert lower.tolist() == [0, 2]
+
+
+def test_find_tolerance_windows_uses_larger_of_absolute_and_relative_tolerance():
+    sorted_values = np.array([100.0, 1000.0])
+    lower, upper = find_tolerance_windows(sorted_values, np.array([100.5, 1004.0]), absolute_tolerance=1.0,
+                                          relative_tolerance=0.001)
+    # 100.5 - внутри абсолютного отклонения, 1004 - за пределами 0.1% от значения
+    assert (upper - lower).tolist() == [1, 0]
+
+
+def test_join_with_tolerance_matches_value_inside_tolerance_only():
+    model_values = np.array([99.6, 150.0])
+    issuer_values = np.array([100.0, 200.0])
+    model_indexes, issuer_indexes = join_with_tolerance(model_values, issuer_values, absolute_tolerance=0.5)
+    assert model_indexes.tolist() == [0]
+    assert issuer_indexes.tolist() == [0]
+
+
+def test_join_with_tolerance_returns_all_tied_issuer_values_in_order():
+    model_values = np.array([np.nan, 10.0, 5.0])
+    issuer_values = np.array([10.0, 5.0, 10.0, np.nan])
+    model_indexes, issuer_indexes = join_with_tolerance(model_values, issuer_values)
+    assert list(zip(model_indexes.tolist(), issuer_indexes.tolist())) == [(1, 0), (1, 2), (2, 1)]
+
+
+def test_join_with_tolerance_absorbs_rounding_of_scaled_values():
+    # 4.35 * 100 = 434.99999999999994
+    model_indexes, issuer_indexes = join_with_tolerance(np.array([4.35]), np.array([435.0]), scale_factor=100.0)
+    assert model_indexes.tolist() == [0]
+    assert issuer_indexes.tolist() == [0]
+
+
+def test_detect_scale_factor_finds_thousands_against_millions():
+    model_values = np.array([1.5, 2.25, 3.0, 12.75])
+    assert detect_scale_factor(model_values, model_values * 1000) == 1000.0
+    assert detect_scale_factor(model_values * 1000, model_values) == 0.001
+
+
+def test_detect_scale_factor_prefers_factor_closer_to_one_on_ties():
+    assert detect_scale_factor(np.array([5.0]), np.array([5.0, 50.0])) == 1.0
+
+
+def test_detect_scale_factor_without_evidence():
+    assert detect_scale_factor(np.array([0.0, np.nan]), np.array([1.0])) == 1.0
@@ -0,0 +1,24 @@
+import numpy as np
+
+from automation_assistance_sheet_discovery import SheetSketch, rank_sheets_by_overlap
+
+
+def test_large_sheet_with_incidental_values_ranks_below_matching_table():
+    model_values = np.arange(1, 101, dtype=float) * 7
+    # нужная таблица: 80 значений модели и столько же значений других периодов
+    statement_table = SheetSketch('page-2-table-1', np.unique(np.concatenate([model_values[:80],
+                                                                             np.arange(10_001, 10_081)])))
+    # большая страница: все целые до 10000, среди них - все значения модели
+    large_sheet = SheetSketch('page-1-table-1', np.arange(1, 10_001, dtype=float))
+
+    sheet_ranks = rank_sheets_by_overlap(model_values, [large_sheet, statement_table])
+
+    assert [sheet_rank.sheet_name for sheet_rank in sheet_ranks] == ['page-2-table-1', 'page-1-table-1']
+    assert sheet_ranks[0].containment == 0.8
+    assert sheet_ranks[1].overlap == 100
+
+
+def test_sheets_without_common_values_have_zero_score():
+    sheet_ranks = rank_sheets_by_overlap(np.array([1.0, 2.0]), [SheetSketch('page-1-table-1', np.array([3.0]))])
+
+    assert sheet_ranks[0].score == 0.0
@@ -0,0 +1,84 @@
+import numpy as np
+
+from automation_assistance import find_addresses_of_start, find_coordinates_for_start_in_filling
+from automation_assistance_disk_cache import create_columnar_sheet_from_rows
+from automation_assistance_snapshot import SheetSnapshot, create_sheet_snapshot_from_columnar_sheet
+
+MODEL_ROWS = [
+    (),
+    (None, 'Статья', '2022', '2023', '2024F', '2025F'),
+    (None, 'Выручка', 90, 111, 120, 130),
+    (None, 'Себестоимость', 50, 60, 70, 80),
+    (None, 'Прибыль', 40, 51, 50, 50),
+]
+
+
+def create_sheet_snapshot(title: str, rows: list) -> SheetSnapshot:
+    return create_sheet_snapshot_from_columnar_sheet(create_columnar_sheet_from_rows(title, rows))
+
+
+def test_snapshot_marks_numbers_headers_and_first_occupied_row():
+    sheet_snapshot = create_sheet_snapshot('ОПУ', MODEL_ROWS)
+
+    assert sheet_snapshot.min_row == 2
+    assert (sheet_snapshot.max_row, sheet_snapshot.max_column) == (5, 6)
+    assert sheet_snapshot.get_column(sheet_snapshot.is_numeric, 4).tolist() == [False, False, True, True, True]
+    assert sheet_snapshot.get_column(sheet_snapshot.numbers, 4)[2:].tolist() == [111.0, 60.0, 51.0]
+    assert sheet_snapshot.is_forecast_header[1].tolist() == [False, False, False, False, True, True]
+    assert sheet_snapshot.header_strings[2][4] == '2023'
+    # столбец за пределами снимка считается пустым
+    assert not sheet_snapshot.get_column(sheet_snapshot.is_occupied, 10).any()
+
+
+def test_start_cells_are_first_model_value_found_in_issuer_sheet():
+    issuer_sheet_snapshot = create_sheet_snapshot('Отчет', [
+        ('Показатель', '2023 г.', '2022 г.'),
+        ('Выручка', 110, 90),
+        ('Себестоимость', 60, 50),
+        ('Прибыль', 50, 40),
+    ])
+
+    # последний исторический столбец модели - D (перед первым прогнозным E); 111 у эмитента нет,
+    # 60 найдено в столбце B, первая числовая ячейка которого - B2
+    assert find_addresses_of_start(create_sheet_snapshot('ОПУ', MODEL_ROWS), issuer_sheet_snapshot) == ('D4', 'B2')
+
+
+def test_start_cells_default_when_no_model_value_is_found():
+    issuer_sheet_snapshot = create_sheet_snapshot('Отчет', [
+        ('Показатель', '2023 г.'),
+        ('Выручка', None),
+        ('Прочее', 7),
+    ])
+
+    assert find_addresses_of_start(create_sheet_snapshot('ОПУ', MODEL_ROWS), issuer_sheet_snapshot) == ('D4', 'B3')
+
+
+def test_value_location_index_keeps_first_column_of_each_value():
+    sheet_snapshot = create_sheet_snapshot('Отчет', [
+        (60, 'Показатель', 'текст', 5),
+        ('Выручка', None, 0, 60),
+        ('Прибыль', 40, 60, float('nan')),
+    ])
+
+    value_location_index = sheet_snapshot.get_value_location_index(min_column=2)
+
+    # значения отсортированы, NaN и значения первого столбца в индекс не попадают
+    assert value_location_index.values.tolist() == [0.0, 5.0, 40.0, 60.0]
+    # 60 встречается в столбцах C и D - берется левый столбец C, его первая числовая ячейка (в том числе 0) - C2
+    positions = value_location_index.find_positions(np.array([60.0, 5.0, 61.0]))
+    assert positions[2] == -1
+    assert [value_location_index.get_coordinate(position) for position in positions[:2]] == ['C2', 'D1']
+    # индекс строится один раз для снимка и первого столбца
+    assert sheet_snapshot.get_value_location_index(min_column=2) is value_location_index
+
+
+def test_find_coordinates_for_start_in_filling_uses_value_location_index():
+    sheet_snapshot = create_sheet_snapshot('Отчет', [
+        ('Показатель', '2023 г.', '2022 г.'),
+        ('Выручка', 110, 90),
+        ('Прибыль', 50, 40),
+    ])
+
+    assert find_coordinates_for_start_in_filling(sheet_snapshot, 40) == 'C2'
+    assert find_coordinates_for_start_in_filling(sheet_snapshot, 50.0) == 'B2'
+    assert find_coordinates_for_start_in_filling(sheet_snapshot, 41) is None
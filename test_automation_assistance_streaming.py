@@ -0,0 +1,68 @@
+import re
+import zipfile
+from io import BytesIO
+
+import openpyxl
+from openpyxl.styles import PatternFill
+
+from automation_assistance_disk_cache import create_columnar_sheet_from_rows
+from automation_assistance_streaming import read_rows_of_sheets, read_sheetnames_from_workbook_xml
+
+YELLOW_FILL = PatternFill(fill_type='solid', fgColor='FFFFFF00')
+
+
+def create_workbook() -> BytesIO:
+    workbook = openpyxl.Workbook()
+    model_sheet = workbook.active
+    model_sheet.title = 'Модель'
+    for row in [(None, 'Выручка', 100.5), (None, 'Прибыль', 40)]:
+        model_sheet.append(row)
+    model_sheet['B2'].fill = YELLOW_FILL
+    workbook.create_sheet('Пустая')
+    workbook.create_sheet('Отчет').append(['Revenue', 100])
+    binary_stream = BytesIO()
+    workbook.save(binary_stream)
+    return binary_stream
+
+
+def set_dimension_of_sheets(binary_stream: BytesIO, dimension: str) -> BytesIO:
+    """Переписывает размер страниц в XML (как в файлах, сохраненных сторонними программами с неверным размером)."""
+    rewritten_stream = BytesIO()
+    with zipfile.ZipFile(binary_stream) as archive, zipfile.ZipFile(rewritten_stream, 'w') as rewritten_archive:
+        for item in archive.infolist():
+            content = archive.read(item)
+            if item.filename.startswith('xl/worksheets/'):
+                content = re.sub(rb'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"'.encode(), content)
+            rewritten_archive.writestr(item, content)
+    return rewritten_stream
+
+
+def test_sheet_names_are_read_from_workbook_xml():
+    assert read_sheetnames_from_workbook_xml(create_workbook()) == ['Модель', 'Пустая', 'Отчет']
+
+
+def test_rows_of_several_sheets_are_read_in_one_pass():
+    rows_of_sheets = read_rows_of_sheets(create_workbook(), ['Отчет', 'Модель', 'Пустая'], fill_column_indexes=(2, 5))
+
+    assert list(rows_of_sheets) == ['Отчет', 'Модель', 'Пустая']
+    assert rows_of_sheets['Модель'] == ([(None, 'Выручка', 100.5), (None, 'Прибыль', 40)],
+                                        {2: ['00000000', 'FFFFFF00'], 5: [None, None]})
+    assert rows_of_sheets['Отчет'][0] == [('Revenue', 100)]
+    assert rows_of_sheets['Пустая'] == ([], {2: [], 5: []})
+
+
+def test_rows_are_read_beyond_wrong_sheet_dimension():
+    rows, _ = read_rows_of_sheets(set_dimension_of_sheets(create_workbook(), 'A1'), ['Модель'])['Модель']
+
+    assert rows == [(None, 'Выручка', 100.5), (None, 'Прибыль', 40)]
+
+
+def test_columns_are_extracted_from_row_of_start():
+    (rows, fill_colors), = read_rows_of_sheets(create_workbook(), ['Модель'], fill_column_indexes=(2,)).values()
+    columnar_sheet = create_columnar_sheet_from_rows('Модель', rows, fill_colors)
+
+    extracted_columns = columnar_sheet.extract_columns((3, 2, 3, 7), min_row=2)
+
+    assert extracted_columns.rows == [2]
+    assert extracted_columns.values == {3: [40], 2: ['Прибыль'], 7: [None]}
+    assert extracted_columns.fill_colors == {2: ['FFFFFF00']}
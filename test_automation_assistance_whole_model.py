@@ -0,0 +1,48 @@
+from io import BytesIO
+
+import openpyxl
+import pytest
+
+from automation_assistance_disk_cache import disk_cache
+from automation_assistance_synthetic_data import SIZES, generate_configs, generate_workbooks
+from automation_assistance_whole_model import process_whole_model
+from automation_assistance_workbook_cache import get_hash_of_binary_stream, workbook_cache
+
+
+@pytest.fixture
+def whole_model_files(tmp_path, monkeypatch):
+    path_to_model, path_to_issuer = generate_workbooks(SIZES['small'], tmp_path)
+    generate_configs(SIZES['small'], tmp_path)
+    workbook = openpyxl.load_workbook(path_to_model)
+    for title in ('ОПУ', 'ДДС'):
+        workbook.copy_worksheet(workbook['Model']).title = title
+    workbook['Model'].title = 'Сегменты'
+    model_binary_stream = BytesIO()
+    workbook.save(model_binary_stream)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(disk_cache, 'directory', tmp_path.joinpath('disk_cache'))
+    workbook_cache.clear()
+    return model_binary_stream, BytesIO(path_to_issuer.read_bytes())
+
+
+def test_each_workbook_is_opened_once(whole_model_files, monkeypatch):
+    opened_workbooks = []
+    load_workbook = openpyxl.load_workbook
+    monkeypatch.setattr(openpyxl, 'load_workbook',
+                        lambda *arguments, **keyword_arguments: opened_workbooks.append(arguments[0])
+                        or load_workbook(*arguments, **keyword_arguments))
+
+    results = process_whole_model(*whole_model_files, data_source='PDF')
+
+    assert len(opened_workbooks) == 2
+    assert [(result.model_sheet, result.sheet_number) for result in results] == [
+        ('Сегменты', 0), ('ОПУ', 1), ('ДДС', 2)]
+    assert all(result.error is None and result.items for result in results)
+
+
+def test_only_issuer_sheets_are_saved_to_disk_cache(whole_model_files):
+    model_binary_stream, issuer_binary_stream = whole_model_files
+
+    process_whole_model(model_binary_stream, issuer_binary_stream, data_source='PDF')
+
+    assert [path.name for path in disk_cache.directory.iterdir()] == [get_hash_of_binary_stream(issuer_binary_stream)]
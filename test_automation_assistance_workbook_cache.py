@@ -0,0 +1,41 @@
+from io import BytesIO
+
+import automation_assistance_workbook_cache
+from automation_assistance_workbook_cache import WorkbookCache, get_hash_of_binary_stream
+
+
+def test_hash_is_computed_once_per_stream(monkeypatch):
+    binary_stream = BytesIO(b'workbook')
+    file_hash = get_hash_of_binary_stream(binary_stream)
+    hashed_contents = []
+    sha256 = automation_assistance_workbook_cache.hashlib.sha256
+    monkeypatch.setattr(automation_assistance_workbook_cache.hashlib, 'sha256',
+                        lambda content: hashed_contents.append(bytes(content)) or sha256(content))
+
+    assert get_hash_of_binary_stream(binary_stream) == file_hash
+    assert hashed_contents == []
+    binary_stream.seek(0, 2)
+    binary_stream.write(b' changed')
+    assert get_hash_of_binary_stream(binary_stream) != file_hash
+    assert hashed_contents == [b'workbook changed']
+
+
+def test_same_content_shares_entry_and_least_recently_used_is_evicted():
+    workbook_cache = WorkbookCache(max_size_in_bytes=100)
+    first_stream, second_stream = BytesIO(b'first'), BytesIO(b'second')
+    created = []
+
+    def get(binary_stream: BytesIO, kind: tuple) -> str:
+        return workbook_cache.get_or_create(binary_stream, kind,
+                                            lambda: created.append(kind) or f'{kind[0]} object',
+                                            lambda parsed_object: 60)
+
+    get(first_stream, ('a',))
+    # другой объект потока с тем же содержимым получает тот же объект из кэша
+    get(BytesIO(b'first'), ('a',))
+    assert created == [('a',)]
+    # второй объект не помещается вместе с первым - давно не использованный вытесняется
+    get(second_stream, ('b',))
+    assert workbook_cache.get(first_stream, ('a',)) is None
+    assert workbook_cache.get(second_stream, ('b',)) == 'b object'
+    assert workbook_cache.current_size_in_bytes == 60